@@ -1,68 +1,131 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 from dataclasses import dataclass
 import logging
 import json
 import os
 import random
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from app.config import settings
+from app.governor import get_governor
+from app.hedging import get_hedger
+from app.inputs import InputImage
+from src.ark_client import get_async_ark_client
+from src.downloads import get_async_download_pool
+from src.result_cache import get_result_cache, is_deterministic, payload_key
+from src.retry import FATAL, RetryPolicy, acall_with_retry, classify, status_code
 
 log = logging.getLogger("app.ark")
 
 
 @dataclass
 class GeneratedImage:
-    base64: str
+    # Raw image bytes; base64 is produced once, at the HTTP edge
+    data: bytes
     mime: str = "image/png"
+    # Latency breakdown for the Ark call that produced this image
+    generate_ms: Optional[int] = None
+    download_ms: Optional[int] = None
 
+    @property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("ascii")
 
-def generate_images(
+
+class ArkRejected(RuntimeError):
+    """Ark refused every call with a 4xx (bad parameters, moderation, credentials).
+
+    Sending the same request again cannot succeed. ``status`` is what our API
+    reports: 422 when Ark rejected the request itself, 502 for the rest
+    (e.g. our credentials or model access).
+    """
+
+    def __init__(self, message: str, upstream_status: int):
+        super().__init__(message)
+        self.upstream_status = upstream_status
+        self.status = 422 if upstream_status in (400, 422) else 502
+
+
+def _field(obj: Any, *names: str) -> Any:
+    # SDK responses are objects, fakes/raw JSON are dicts; read either without converting
+    for name in names:
+        v = obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+        if v:
+            return v
+    return None
+
+
+def _cancel_surplus(interface_name: str, tasks: List[asyncio.Task]) -> None:
+    """Cancel calls whose results are no longer needed.
+
+    Calls still queued on the worker semaphore never reach Ark; calls in flight
+    have their HTTP request aborted. Tasks are detached rather than awaited so
+    they cannot hold the response.
+    """
+    surplus = [t for t in tasks if not t.done()]
+    for t in surplus:
+        t.cancel()
+        # retrieve the outcome so detached tasks never log "exception was never retrieved"
+        t.add_done_callback(lambda t: t.cancelled() or t.exception())
+    if surplus:
+        log.info("ark_generate_cancel_surplus interface=%s cancelled=%s", interface_name, len(surplus))
+
+
+async def iter_generate_images(
     interface_name: str,
     prompt_mode: Optional[str],
     custom_prompt: Optional[str],
     template_key: Optional[str],
     template_params: Optional[dict],
-    primary_image_base64: Optional[str],
-    ref_images_base64: Optional[list[str]],
+    primary_image: Optional[InputImage],
+    ref_images: Optional[List[InputImage]],
     num_candidates: int = 4,
     ark: Optional[dict] = None,
-) -> List[GeneratedImage]:
+    slots: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[GeneratedImage]:
     """
     Adapter for image generation. Always uses real Ark API via official SDK.
+
+    Runs natively on the event loop: Ark calls go through ``AsyncArk`` and
+    result downloads through ``httpx.AsyncClient``, so concurrent generations
+    do not hold worker threads while waiting on the network. Candidates are
+    yielded in completion order, at most ``num_candidates`` of them.
+
+    Input images arrive as raw bytes and are encoded into data URLs once here,
+    for all candidate calls. ``slots`` lets several calls share one concurrency cap (batch
+    scheduling); by default each call gets its own ``ARK_MAX_WORKERS`` cap.
     """
 
     # Real Ark integration via official SDK.
     # Lazily import so tests/dev do not require the dependency.
     try:
-        from volcenginesdkarkruntime import Ark  # type: ignore
+        import volcenginesdkarkruntime  # type: ignore  # noqa: F401
     except Exception as e:  # pragma: no cover
         raise RuntimeError(
             "Ark SDK not available. Install with: pip install 'volcengine-python-sdk[ark]'"
         ) from e
 
-    # Build Ark client
+    # Process-wide pooled client (keep-alive connections shared across requests)
     base_url = settings.ark_base_url or os.getenv("ARK_BASE_URL") or "https://ark.cn-beijing.volces.com/api/v3"
     api_key = settings.ark_api_key or os.getenv("ARK_API_KEY")
     if not api_key:
         raise RuntimeError("Missing ARK_API_KEY (or config.ark_api_key)")
-    client = Ark(base_url=base_url, api_key=api_key)
+    client = get_async_ark_client(base_url, api_key)
 
     # Final prompt is provided by routes (custom_prompt already expanded for template mode)
     if not custom_prompt:
         raise ValueError("custom_prompt is required after prompt expansion")
 
-    # Prepare image(s) as data URLs. Default mime to image/png
-    def _as_data_url(b64: str, mime: str = "image/png") -> str:
-        return f"data:{mime};base64,{b64}"
-
-    images: List[str] = []
-    if primary_image_base64:
-        images.append(_as_data_url(primary_image_base64))
-    if ref_images_base64:
-        images.extend([_as_data_url(b) for b in ref_images_base64[:2]])
+    inputs: List[InputImage] = []
+    if primary_image:
+        inputs.append(primary_image)
+    if ref_images:
+        inputs.extend(ref_images[:2])
+    images = [i.data_url for i in inputs]
 
     # Ark kwargs with defaults per docs/spec
     ark_kwargs: Dict[str, Any] = dict(ark or {})
@@ -98,7 +161,7 @@ def generate_images(
     # Extra params passthrough (only documented fields should be used)
     # Support `param: ["k=v", ...]` and `json_params: "{...}"`
     try:
-        from src.ark_image_cli import _parse_param_overrides  # reuse logic
+        from src.ark_exec import _parse_param_overrides  # reuse logic
     except Exception:
         _parse_param_overrides = None  # type: ignore
 
@@ -116,7 +179,7 @@ def generate_images(
     spec_varying_seed = interface_name == "FusionRandomize"
     provided_seed = base_payload.get("seed")
 
-    results: List[GeneratedImage] = []
+    delivered = 0
 
     # Log sanitized payload (no image data, no api_key)
     try:
@@ -135,86 +198,180 @@ def generate_images(
     except Exception:
         pass
 
-    def _resp_to_images(resp_obj: Any) -> List[GeneratedImage]:
-        out: List[GeneratedImage] = []
-        # Attempt generic dict conversion
-        try:
-            resp_dict = json.loads(json.dumps(resp_obj, default=lambda o: o.__dict__))
-        except Exception:
-            resp_dict = {"repr": str(resp_obj)}
-        data_list = resp_dict.get("data") or []
-        # Prefer direct base64 when present; otherwise, fetch URL
-        for item in data_list:
-            if isinstance(item, dict):
-                b64 = item.get("b64_json") or item.get("base64") or item.get("image_base64")
-                if b64:
-                    out.append(GeneratedImage(base64=b64, mime="image/png"))
-                    continue
-                url = item.get("url")
-            else:
-                # object with attributes
-                b64 = getattr(item, "b64_json", None) or getattr(item, "base64", None) or getattr(item, "image_base64", None)
-                if b64:
-                    out.append(GeneratedImage(base64=b64, mime="image/png"))
-                    continue
-                url = getattr(item, "url", None)
+    async def _resp_to_images(resp_obj: Any) -> List[GeneratedImage]:
+        out: List[Optional[GeneratedImage]] = []
+        # Prefer direct base64 when present; otherwise, collect URLs to fetch together
+        pending: List[tuple[int, str]] = []
+        for item in _field(resp_obj, "data") or []:
+            b64 = _field(item, "b64_json", "base64", "image_base64")
+            if b64:
+                out.append(GeneratedImage(data=base64.b64decode(b64), mime="image/png"))
+                continue
+            url = _field(item, "url")
             if url and str(url).lower().startswith("http"):
-                try:
-                    import httpx  # type: ignore
-
-                    with httpx.Client(timeout=30.0) as client:
-                        r = client.get(url)
-                        r.raise_for_status()
-                        b64 = base64.b64encode(r.content).decode("ascii")
-                        out.append(GeneratedImage(base64=b64, mime="image/png"))
-                except Exception as de:  # pragma: no cover
-                    raise RuntimeError(f"failed to download image: {de}")
-        return out
-
-    # Perform parallel calls until enough candidates collected
+                pending.append((len(out), str(url)))
+                out.append(None)
+        if pending:
+            # All URLs of the response download in parallel over the shared pool
+            started = time.perf_counter()
+            try:
+                blobs = await get_async_download_pool().fetch_all([u for _, u in pending])
+            except Exception as de:  # pragma: no cover
+                raise RuntimeError(f"failed to download image: {de}")
+            download_ms = int((time.perf_counter() - started) * 1000)
+            for (pos, _), raw in zip(pending, blobs):
+                out[pos] = GeneratedImage(data=raw, mime="image/png", download_ms=download_ms)
+        return [img for img in out if img is not None]
+
+    # Perform concurrent calls; ARK_MAX_WORKERS bounds in-flight calls per request
     attempts = max(1, int(num_candidates))
     max_workers_env = os.getenv("ARK_MAX_WORKERS")
     try:
         max_workers = int(max_workers_env) if max_workers_env else None
     except ValueError:
         max_workers = None
-    workers = max(1, min(attempts, max_workers or 4))
+    if slots is None:
+        slots = asyncio.Semaphore(max(1, min(attempts, max_workers or 4)))
 
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+    # Opt-in result cache for seeded calls of fixed-seed interfaces
+    result_cache = get_result_cache()
+    governor = get_governor()
+    hedger = get_hedger()
+    hedge_key = (str(model), interface_name)
+    # One retry budget per request, shared by all of its calls
+    retry_policy = RetryPolicy.from_env()
+    retry_budget = retry_policy.new_budget()
+    errors: List[BaseException] = []
 
-    def _call_once(seed_override: Optional[int]) -> List[GeneratedImage]:
+    async def _call_once(seed_override: Optional[int]) -> List[GeneratedImage]:
         payload = dict(base_payload)
         if seed_override is not None:
             payload["seed"] = seed_override
-        try:
-            resp = client.images.generate(**payload)
-        except Exception as e:  # pragma: no cover
-            log.warning("ark_generate_error interface=%s error=%s", interface_name, e)
-            # surface as empty set so aggregation can continue
-            return []
-        return _resp_to_images(resp)
-
-    futures = []
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        for i in range(attempts):
-            seed_override = None
-            if spec_varying_seed and provided_seed is None:
-                seed_override = random.randint(1, 2**31 - 1)
-            futures.append(ex.submit(_call_once, seed_override))
-        for fu in as_completed(futures):
+        cache_key = None
+        if result_cache is not None and is_deterministic(payload, interface_name):
+            cache_key = payload_key(payload)
+            cached = await asyncio.to_thread(result_cache.get, cache_key)
+            if cached is not None:
+                log.info("ark_result_cache_hit interface=%s images=%s", interface_name, len(cached))
+                return [GeneratedImage(data=raw, generate_ms=0, download_ms=0) for raw in cached]
+        async def _generate() -> Any:
+            if hedger is None:
+                return await client.images.generate(**payload)
+            # Hedged only once admitted: the hedge delay and latency samples cover Ark
+            # alone, and a duplicate waits for its own governor token inside the race
+            return await hedger.call(
+                hedge_key,
+                lambda: client.images.generate(**payload),
+                slot=governor.slot if governor is not None else None,
+            )
+
+        async def _attempt() -> Any:
+            if governor is None:
+                return await _generate()
+            # Process-wide cap shared with every other request (and worker); each
+            # attempt holds a token only while it talks to Ark, never while backing off
+            async with governor.slot():
+                return await _generate()
+
+        def _on_retry(attempt: int, exc: BaseException, wait: float) -> None:
+            log.warning(
+                "ark_generate_retry interface=%s attempt=%s class=%s delay_ms=%s error=%s",
+                interface_name,
+                attempt,
+                classify(exc),
+                int(wait * 1000),
+                exc,
+            )
+
+        async with slots:
+            started = time.perf_counter()
+            try:
+                resp = await acall_with_retry(
+                    _attempt,
+                    retry_policy,
+                    retry_budget,
+                    on_retry=_on_retry,
+                )
+            except Exception as e:
+                log.warning("ark_generate_error interface=%s class=%s error=%s", interface_name, classify(e), e)
+                errors.append(e)
+                # surface as empty set so aggregation can continue
+                return []
+            generate_ms = int((time.perf_counter() - started) * 1000)
+            imgs = await _resp_to_images(resp)
+        for img in imgs:
+            img.generate_ms = generate_ms
+        if cache_key is not None and imgs:
+            await asyncio.to_thread(result_cache.put, cache_key, [i.data for i in imgs])
+        log.info(
+            "ark_generate_done interface=%s images=%s generate_ms=%s download_ms=%s",
+            interface_name,
+            len(imgs),
+            generate_ms,
+            max((i.download_ms or 0 for i in imgs), default=0),
+        )
+        return imgs
+
+    tasks: List[asyncio.Task] = []
+    for i in range(attempts):
+        seed_override = None
+        if spec_varying_seed and provided_seed is None:
+            seed_override = random.randint(1, 2**31 - 1)
+        tasks.append(asyncio.ensure_future(_call_once(seed_override)))
+    wanted = max(1, num_candidates)
+    try:
+        # Deliver each candidate as soon as its call finishes; stop once enough arrived
+        for fu in asyncio.as_completed(tasks):
             try:
-                imgs = fu.result()
+                imgs = await fu
             except Exception:
                 imgs = []
             for img in imgs:
-                results.append(img)
-                if len(results) >= num_candidates:
-                    break
-            if len(results) >= num_candidates:
-                break
+                yield img
+                delivered += 1
+                if delivered >= wanted:
+                    return
+    finally:
+        _cancel_surplus(interface_name, tasks)
 
     # Ensure at least one image when API returned empty list
-    if not results:
+    if not delivered:
         log.error("ark_generate_no_images interface=%s", interface_name)
+        if errors:
+            last = errors[-1]
+            message = f"Ark returned no images: {classify(last)}: {last}"
+            upstream = status_code(last)
+            if classify(last) == FATAL and upstream is not None:
+                raise ArkRejected(message, upstream)
+            raise RuntimeError(message)
         raise RuntimeError("Ark returned no images")
-    return results[: max(1, num_candidates)]
+
+
+async def generate_images(
+    interface_name: str,
+    prompt_mode: Optional[str],
+    custom_prompt: Optional[str],
+    template_key: Optional[str],
+    template_params: Optional[dict],
+    primary_image: Optional[InputImage],
+    ref_images: Optional[List[InputImage]],
+    num_candidates: int = 4,
+    ark: Optional[dict] = None,
+    slots: Optional[asyncio.Semaphore] = None,
+) -> List[GeneratedImage]:
+    """Collect all candidates from :func:`iter_generate_images`."""
+    return [
+        img
+        async for img in iter_generate_images(
+            interface_name=interface_name,
+            prompt_mode=prompt_mode,
+            custom_prompt=custom_prompt,
+            template_key=template_key,
+            template_params=template_params,
+            primary_image=primary_image,
+            ref_images=ref_images,
+            num_candidates=num_candidates,
+            ark=ark,
+            slots=slots,
+        )
+    ]
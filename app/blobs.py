@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Protocol
+
+from app.config import settings
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobNotFound(KeyError):
+    pass
+
+
+class BlobStore(Protocol):
+    """Content-addressed image storage; keys are sha256 hex digests of the bytes."""
+
+    def put(self, data: bytes, mime: str = "application/octet-stream") -> str: ...
+
+    def put_stream(self, f: BinaryIO, mime: str = "application/octet-stream") -> str: ...
+
+    def get(self, key: str) -> bytes: ...
+
+    def exists(self, key: str) -> bool: ...
+
+
+def _copy_hashing(f: BinaryIO, out: BinaryIO) -> str:
+    """Copy ``f`` to ``out`` in chunks; returns the sha256 hex digest of the bytes copied."""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+        h.update(chunk)
+        out.write(chunk)
+    return h.hexdigest()
+
+
+def _key_path(key: str) -> str:
+    # Fan out by prefix so no single directory grows unbounded
+    return f"{key[:2]}/{key[2:4]}/{key}"
+
+
+class LocalBlobStore:
+    """Filesystem backend (dev/tests). Writes are atomic via rename."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *_key_path(key).split("/"))
+
+    def put(self, data: bytes, mime: str = "application/octet-stream") -> str:
+        key = content_hash(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return key
+
+    def put_stream(self, f: BinaryIO, mime: str = "application/octet-stream") -> str:
+        """Hash while copying to a temp file, so the image is never held in memory."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                key = _copy_hashing(f, out)
+            path = self._path(key)
+            if os.path.exists(path):
+                os.unlink(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return key
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+class SupabaseBlobStore:
+    """Supabase Storage backend; objects live in one bucket under their hash."""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+
+    def _bucket(self):
+        from app.db import get_client
+
+        return get_client().storage.from_(self.bucket)
+
+    def put(self, data: bytes, mime: str = "application/octet-stream") -> str:
+        key = content_hash(data)
+        b = self._bucket()
+        if not b.exists(_key_path(key)):
+            b.upload(_key_path(key), data, {"content-type": mime, "upsert": "true"})
+        return key
+
+    def put_stream(self, f: BinaryIO, mime: str = "application/octet-stream") -> str:
+        """Spool to a local temp file while hashing (the object name is the hash), then
+        upload from that file; the client sends it in chunks, never as one buffer."""
+        fd, tmp = tempfile.mkstemp(prefix=".blob-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                key = _copy_hashing(f, out)
+            b = self._bucket()
+            if not b.exists(_key_path(key)):
+                with open(tmp, "rb") as src:
+                    b.upload(_key_path(key), src, {"content-type": mime, "upsert": "true"})
+        finally:
+            os.unlink(tmp)
+        return key
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self._bucket().download(_key_path(key))
+        except Exception as e:
+            raise BlobNotFound(key) from e
+
+    def exists(self, key: str) -> bool:
+        return bool(self._bucket().exists(_key_path(key)))
+
+
+_lock = threading.Lock()
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    with _lock:
+        if _store is None:
+            if settings.blob_store == "supabase":
+                _store = SupabaseBlobStore(settings.blob_store_bucket)
+            else:
+                _store = LocalBlobStore(settings.blob_store_dir)
+        return _store
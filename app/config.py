@@ -1,6 +1,8 @@
 import os
 from dataclasses import dataclass
 
+from src.env import env_int
+
 
 @dataclass
 class Settings:
@@ -17,5 +19,26 @@ class Settings:
     ark_base_url: str | None = os.getenv("ARK_BASE_URL")
     ark_api_key: str | None = os.getenv("ARK_API_KEY")
 
+    # Version image blob store: "local" (filesystem) or "supabase" (Storage bucket)
+    blob_store: str = os.getenv("BLOB_STORE", "local")
+    blob_store_dir: str = os.getenv("BLOB_STORE_DIR", "blobs")
+    blob_store_bucket: str = os.getenv("BLOB_STORE_BUCKET", "version-images")
+
+    # In-memory cache of version details (bounded by total image bytes)
+    version_cache_max_bytes: int = env_int("VERSION_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+
+    # Stored images resolved as generate inputs (primary_version_id / ref_asset_ids), as data URLs
+    input_cache_max_bytes: int = env_int("INPUT_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+
+    # Durable background generation jobs (SQLite queue shared by the workers of one host)
+    jobs_db: str = os.getenv("JOBS_DB", "jobs.sqlite")
+
+    # Image derivatives (thumbnails/transcodes) cached on disk under LRU eviction
+    derivative_cache_dir: str = os.getenv("DERIVATIVE_CACHE_DIR", "derivatives")
+    derivative_cache_max_bytes: int = env_int("DERIVATIVE_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+    derivative_eager_widths: tuple = tuple(
+        int(w) for w in os.getenv("DERIVATIVE_EAGER_WIDTHS", "256").split(",") if w.strip()
+    )
+
 
 settings = Settings()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.config import settings
 
@@ -46,9 +46,18 @@ def project_get(project_id: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def project_list() -> List[Dict[str, Any]]:
+def project_list(limit: Optional[int] = None, after: Optional[Tuple[datetime, uuid.UUID]] = None) -> List[Dict[str, Any]]:
+    """Projects ordered by (created_at, id); `after` is the keyset cursor of the previous page."""
     c = get_client()
-    res = c.table("project").select("id,name,created_at").order("created_at", desc=False).execute()
+    q = c.table("project").select("id,name,created_at")
+    if after is not None:
+        # Formatted from parsed values only, so a cursor cannot add filter clauses
+        created_at, pid = after[0].isoformat(), str(after[1])
+        q = q.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{pid})')
+    q = q.order("created_at", desc=False).order("id", desc=False)
+    if limit is not None:
+        q = q.limit(limit)
+    res = q.execute()
     return list(res.data or [])
 
 
@@ -59,59 +68,143 @@ def version_count_for_project(project_id: str) -> int:
     return int(res.count or 0)
 
 
-# Helpers for version table
-def version_get(version_id: str) -> Optional[Dict[str, Any]]:
+def version_counts_for_projects(project_ids: List[str]) -> Dict[str, int]:
+    """Version counts for many projects in one round trip (`project_version_counts` RPC)."""
+    if not project_ids:
+        return {}
     c = get_client()
-    res = c.table("version").select("* ").eq("id", version_id).limit(1).execute()
-    return res.data[0] if res.data else None
+    res = c.rpc("project_version_counts", {"project_ids": list(project_ids)}).execute()
+    counts = {pid: 0 for pid in project_ids}
+    for row in res.data or []:
+        counts[str(row["project_id"])] = int(row["version_count"])
+    return counts
 
 
-def version_list(project_id: str) -> List[Dict[str, Any]]:
-    c = get_client()
-    res = (
-        c.table("version")
-        .select("id,project_id,parent_version_id,index,interface_name,image_mime,image_base64,created_at")
-        .eq("project_id", project_id)
-        .order("index", desc=False)
-        .execute()
-    )
-    return list(res.data or [])
+# Helpers for version table
+VERSION_BRIEF_COLUMNS = "id,project_id,parent_version_id,index,interface_name,created_at"
 
 
-def version_latest_index(project_id: str) -> int:
+def version_list(project_id: str, limit: Optional[int] = None, after_index: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Brief version rows (no image columns), ordered by index, starting after `after_index`."""
     c = get_client()
-    res = (
-        c.table("version")
-        .select("index")
-        .eq("project_id", project_id)
-        .order("index", desc=True)
-        .limit(1)
-        .execute()
-    )
-    if res.data:
-        return int(res.data[0]["index"])  # current max
-    return 0
+    q = c.table("version").select(VERSION_BRIEF_COLUMNS).eq("project_id", project_id)
+    if after_index is not None:
+        q = q.gt("index", after_index)
+    q = q.order("index", desc=False)
+    if limit is not None:
+        q = q.limit(limit)
+    res = q.execute()
+    return list(res.data or [])
 
 
 def version_insert(
     project_id: str,
     interface_name: str,
     image_mime: str,
-    image_base64: str,
+    image_hash: str,
     parent_version_id: Optional[str] = None,
 ) -> Dict[str, Any]:
+    """Insert a version row referencing an image already in the blob store.
+
+    Index allocation and insert happen atomically in the `version_insert_next`
+    RPC (one round trip; concurrent submits to a project serialize on its row).
+    """
+    c = get_client()
+    res = c.rpc(
+        "version_insert_next",
+        {
+            "p_id": str(uuid.uuid4()),
+            "p_project_id": project_id,
+            "p_parent_version_id": parent_version_id,
+            "p_interface_name": interface_name,
+            "p_image_mime": image_mime,
+            "p_image_hash": image_hash,
+        },
+    ).execute()
+    data = res.data
+    row = data[0] if isinstance(data, list) else data
+    if not row:
+        raise RuntimeError("version_insert_next returned no row")
+    return dict(row)
+
+
+def version_set_image_hash(version_id: str, image_hash: str) -> None:
+    """Record the blob key of a legacy inline-image row (the inline copy is kept)."""
+    c = get_client()
+    c.table("version").update({"image_hash": image_hash}).eq("id", version_id).execute()
+
+
+# Helpers for asset table (per-project reference images)
+def asset_upsert(project_id: str, image_mime: str, image_hash: str) -> Dict[str, Any]:
+    """Insert an asset or return the project's existing one for the same image (`asset_upsert` RPC)."""
     c = get_client()
-    vid = str(uuid.uuid4())
-    idx = version_latest_index(project_id) + 1
-    row = {
-        "id": vid,
-        "project_id": project_id,
-        "parent_version_id": parent_version_id,
-        "index": idx,
-        "interface_name": interface_name,
-        "image_mime": image_mime,
-        "image_base64": image_base64,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    }
-    c.table("version").insert(row).execute()
-    return row
+    res = c.rpc(
+        "asset_upsert",
+        {
+            "p_id": str(uuid.uuid4()),
+            "p_project_id": project_id,
+            "p_image_mime": image_mime,
+            "p_image_hash": image_hash,
+        },
+    ).execute()
+    data = res.data
+    row = data[0] if isinstance(data, list) else data
+    if not row:
+        raise RuntimeError("asset_upsert returned no row")
+    return dict(row)
+
+
+class Loader:
+    """Request-scoped lookups: memoizes projects/versions/assets and resolves
+    "version X in project Y" with a single filtered query."""
+
+    def __init__(self) -> None:
+        self._projects: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._versions: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._assets: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._known_projects: set = set()
+
+    def project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        if project_id not in self._projects:
+            p = project_get(project_id)
+            self._projects[project_id] = p
+            if p:
+                self._known_projects.add(project_id)
+        return self._projects[project_id]
+
+    def project_exists(self, project_id: str) -> bool:
+        # A version row seen in this project proves the project exists (FK)
+        return project_id in self._known_projects or self.project(project_id) is not None
+
+    def version_in_project(self, project_id: str, version_id: str) -> Optional[Dict[str, Any]]:
+        if version_id in self._versions:
+            v = self._versions[version_id]
+            return v if v and v.get("project_id") == project_id else None
+        c = get_client()
+        res = c.table("version").select("*").eq("id", version_id).eq("project_id", project_id).limit(1).execute()
+        v = res.data[0] if res.data else None
+        if v:
+            self._remember_version(version_id, v)
+        return v
+
+    def asset_in_project(self, project_id: str, asset_id: str) -> Optional[Dict[str, Any]]:
+        if asset_id in self._assets:
+            a = self._assets[asset_id]
+            return a if a and a.get("project_id") == project_id else None
+        c = get_client()
+        res = c.table("asset").select("*").eq("id", asset_id).eq("project_id", project_id).limit(1).execute()
+        a = res.data[0] if res.data else None
+        if a:
+            self._assets[asset_id] = a
+            self._known_projects.add(project_id)
+        return a
+
+    def _remember_version(self, version_id: str, v: Optional[Dict[str, Any]]) -> None:
+        self._versions[version_id] = v
+        if v:
+            self._known_projects.add(v["project_id"])
+
+
+def get_loader() -> Loader:
+    """FastAPI dependency: a fresh Loader per request."""
+    return Loader()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import io
+import logging
+import threading
+from typing import Iterable, Optional, Tuple
+
+from app.blobs import get_blob_store
+from app.config import settings
+from src.cache import DiskLRU
+
+
+log = logging.getLogger("app.derivatives")
+
+FORMAT_MIME = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+MIME_FORMAT = {v: k for k, v in FORMAT_MIME.items()}
+
+
+def derivative_key(image_hash: str, width: Optional[int], fmt: str) -> str:
+    return f"{image_hash}-w{width or 0}.{fmt}"
+
+
+def render(data: bytes, width: Optional[int], fmt: str) -> bytes:
+    """Resize to `width` (never upscaling, aspect preserved) and encode as `fmt`."""
+    try:
+        from PIL import Image  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("Pillow not available. Install with: pip install Pillow") from e
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        save_kwargs = {"quality": 85} if fmt in ("jpeg", "webp") else {"optimize": True}
+        img.save(out, format=fmt.upper(), **save_kwargs)
+        return out.getvalue()
+
+
+_lock = threading.Lock()
+_cache: Optional[DiskLRU] = None
+
+
+def get_derivative_cache() -> DiskLRU:
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = DiskLRU(settings.derivative_cache_dir, settings.derivative_cache_max_bytes)
+        return _cache
+
+
+def get_derivative(image_hash: str, width: Optional[int], fmt: str) -> Tuple[bytes, str]:
+    """Return (bytes, mime) of a variant, rendering and caching it on a miss."""
+    cache = get_derivative_cache()
+    key = derivative_key(image_hash, width, fmt)
+    data = cache.get(key)
+    if data is None:
+        data = render(get_blob_store().get(image_hash), width, fmt)
+        cache.put(key, data)
+    return data, FORMAT_MIME[fmt]
+
+
+def warm_thumbnails(image_hash: str, widths: Optional[Iterable[int]] = None, fmt: str = "webp") -> None:
+    """Eagerly render thumbnails for a freshly inserted version (run as a background task)."""
+    for w in widths if widths is not None else settings.derivative_eager_widths:
+        try:
+            get_derivative(image_hash, w, fmt)
+        except Exception as e:
+            log.warning("derivative_warm_error hash=%s width=%s error=%s", image_hash, w, e)
@@ -0,0 +1,373 @@
+"""Process-wide adaptive concurrency limit for Ark calls.
+
+``ARK_MAX_WORKERS`` only bounds the calls of one request; the governor bounds
+all Ark calls of the process (or of every uvicorn worker sharing a token
+store). The limit adapts AIMD-style: each call finished within the latency
+target raises it by ``1/limit`` (about +1 per round of calls), a throttled
+call (429) or a call over the latency target multiplies it by the backoff
+factor, at most once per cooldown period.
+
+Tuning (environment):
+  - ARK_GOVERNOR                 "off" disables the limiter (default on)
+  - ARK_GOVERNOR_INITIAL         starting limit (default 16)
+  - ARK_GOVERNOR_MIN / _MAX      bounds of the limit (default 1 / 64)
+  - ARK_GOVERNOR_LATENCY_MS      latency target; 0 ignores latency (default 120000)
+  - ARK_GOVERNOR_BACKOFF         multiplicative decrease factor (default 0.5)
+  - ARK_GOVERNOR_COOLDOWN        seconds between decreases (default 5)
+  - ARK_GOVERNOR_DB              SQLite file shared by workers; unset = per process
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Protocol
+
+from src.env import env_float
+from src.retry import THROTTLED, classify
+
+
+@dataclass(frozen=True)
+class GovernorSettings:
+    initial: float
+    min_limit: float
+    max_limit: float
+    latency_target_ms: float
+    backoff: float
+    cooldown_s: float
+
+    @classmethod
+    def from_env(cls) -> "GovernorSettings":
+        min_limit = max(1.0, env_float("ARK_GOVERNOR_MIN", 1))
+        max_limit = max(min_limit, env_float("ARK_GOVERNOR_MAX", 64))
+        return cls(
+            initial=min(max_limit, max(min_limit, env_float("ARK_GOVERNOR_INITIAL", 16))),
+            min_limit=min_limit,
+            max_limit=max_limit,
+            latency_target_ms=env_float("ARK_GOVERNOR_LATENCY_MS", 120_000),
+            backoff=min(0.95, max(0.05, env_float("ARK_GOVERNOR_BACKOFF", 0.5))),
+            cooldown_s=env_float("ARK_GOVERNOR_COOLDOWN", 5),
+        )
+
+
+class TokenStore(Protocol):
+    """Where the limit and the tokens of in-flight calls live (thread-safe)."""
+
+    kind: str
+
+    def try_acquire(self) -> Optional[str]: ...
+
+    def release(self, token: str) -> None: ...
+
+    def in_flight(self) -> int: ...
+
+    def get_limit(self) -> float: ...
+
+    def increase(self, max_limit: float) -> bool:
+        """Additive step ``limit + 1/limit``, capped; False when already at the cap."""
+        ...
+
+    def decrease(self, factor: float, min_limit: float) -> None: ...
+
+
+class LocalTokenStore:
+    """In-process store; never blocks, so the governor calls it on the event loop."""
+
+    kind = "local"
+
+    def __init__(self, initial: float):
+        self._lock = threading.Lock()
+        self._limit = initial
+        self._tokens: set = set()
+
+    def try_acquire(self) -> Optional[str]:
+        with self._lock:
+            if len(self._tokens) >= int(self._limit):
+                return None
+            token = uuid.uuid4().hex
+            self._tokens.add(token)
+            return token
+
+    def release(self, token: str) -> None:
+        with self._lock:
+            self._tokens.discard(token)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._tokens)
+
+    def get_limit(self) -> float:
+        with self._lock:
+            return self._limit
+
+    def increase(self, max_limit: float) -> bool:
+        with self._lock:
+            if self._limit >= max_limit:
+                return False
+            self._limit = min(max_limit, self._limit + 1.0 / self._limit)
+            return True
+
+    def decrease(self, factor: float, min_limit: float) -> None:
+        with self._lock:
+            self._limit = max(min_limit, self._limit * factor)
+
+
+class SqliteTokenStore:
+    """Token table shared by all workers on a host.
+
+    Tokens carry a lease so a worker killed mid-call cannot leak capacity.
+    Calls do file I/O and may wait on other workers' locks, so the governor
+    runs them in threads, never on the event loop.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path: str, initial: float, lease_s: float = 900.0):
+        self.path = path
+        self.lease_s = lease_s
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("create table if not exists tokens (id text primary key, acquired_at real not null)")
+        self._conn.execute("create table if not exists state (k text primary key, v real not null)")
+        self._conn.execute("insert or ignore into state (k, v) values ('limit', ?)", (initial,))
+
+    def try_acquire(self) -> Optional[str]:
+        with self._lock:
+            c = self._conn
+            c.execute("begin immediate")
+            try:
+                c.execute("delete from tokens where acquired_at < ?", (time.time() - self.lease_s,))
+                (count,) = c.execute("select count(*) from tokens").fetchone()
+                if count >= int(self._limit()):
+                    c.execute("rollback")
+                    return None
+                token = uuid.uuid4().hex
+                c.execute("insert into tokens (id, acquired_at) values (?, ?)", (token, time.time()))
+                c.execute("commit")
+                return token
+            except BaseException:
+                c.execute("rollback")
+                raise
+
+    def release(self, token: str) -> None:
+        with self._lock:
+            self._conn.execute("delete from tokens where id = ?", (token,))
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("select count(*) from tokens").fetchone()[0])
+
+    def _limit(self) -> float:
+        row = self._conn.execute("select v from state where k = 'limit'").fetchone()
+        return float(row[0]) if row else 1.0
+
+    def get_limit(self) -> float:
+        with self._lock:
+            return self._limit()
+
+    # Single UPDATEs, so concurrent workers never overwrite each other's adjustment
+    def increase(self, max_limit: float) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "update state set v = min(?, v + 1.0 / v) where k = 'limit' and v < ?", (max_limit, max_limit)
+            )
+            return cur.rowcount > 0
+
+    def decrease(self, factor: float, min_limit: float) -> None:
+        with self._lock:
+            self._conn.execute("update state set v = max(?, v * ?) where k = 'limit'", (min_limit, factor))
+
+
+_SHARED_POLL_S = 0.05
+
+
+class _Waiter:
+    """A queued acquire; woken thread-safely since waiters may run on different loops."""
+
+    __slots__ = ("loop", "fut")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.fut: asyncio.Future = loop.create_future()
+
+    def wake(self) -> None:
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self) -> None:
+        if not self.fut.done():
+            self.fut.set_result(None)
+
+
+class Governor:
+    def __init__(self, settings: GovernorSettings, store: TokenStore):
+        self.settings = settings
+        self.store = store
+        # Guards the in-memory state only; store calls are made outside it
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+        self._last_decrease = 0.0
+        # Shared stores do blocking I/O and run in threads; the local store runs inline
+        self._blocking = store.kind != "local"
+        self.acquired = 0
+        self.throttled = 0
+        self.slow = 0
+        self.increases = 0
+        self.decreases = 0
+
+    async def _try_acquire(self) -> Optional[str]:
+        if not self._blocking:
+            return self.store.try_acquire()
+        attempt = asyncio.ensure_future(asyncio.to_thread(self.store.try_acquire))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            # The attempt still completes in its thread; give back any token it took
+            attempt.add_done_callback(self._discard)
+            raise
+
+    def _discard(self, attempt: asyncio.Future) -> None:
+        if not attempt.cancelled() and attempt.exception() is None and attempt.result() is not None:
+            asyncio.get_running_loop().run_in_executor(None, self.store.release, attempt.result())
+
+    async def acquire(self) -> str:
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop)
+        with self._lock:
+            self._waiters.append(waiter)
+        # Other workers release shared tokens without notifying us; poll for those
+        timeout = _SHARED_POLL_S if self._blocking else None
+        try:
+            while True:
+                with self._lock:
+                    # Wakes from here on land on the new future
+                    waiter.fut = loop.create_future()
+                    # FIFO: only the head of the queue may take a token
+                    head = self._waiters[0] is waiter
+                if head:
+                    token = await self._try_acquire()
+                    if token is not None:
+                        with self._lock:
+                            self._waiters.remove(waiter)
+                            self.acquired += 1
+                            # Capacity may remain for the next waiter as well
+                            self._wake()
+                        return token
+                try:
+                    await asyncio.wait_for(waiter.fut, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+            raise
+
+    async def release(self, token: str, latency_ms: Optional[float] = None, throttled: bool = False) -> None:
+        """Return a token and feed the call's outcome into the AIMD loop."""
+        if self._blocking:
+            # Shielded: a cancelled caller must still give its token back
+            await asyncio.shield(asyncio.to_thread(self._settle, token, latency_ms, throttled))
+        else:
+            self._settle(token, latency_ms, throttled)
+        with self._lock:
+            self._wake()
+
+    def _settle(self, token: str, latency_ms: Optional[float], throttled: bool) -> None:
+        self.store.release(token)
+        s = self.settings
+        slow = latency_ms is not None and s.latency_target_ms > 0 and latency_ms > s.latency_target_ms
+        decrease = False
+        with self._lock:
+            if throttled or slow:
+                self.throttled += int(throttled)
+                self.slow += int(slow)
+                now = time.monotonic()
+                if now - self._last_decrease >= s.cooldown_s:
+                    self._last_decrease = now
+                    decrease = True
+        if decrease:
+            self.store.decrease(s.backoff, s.min_limit)
+            with self._lock:
+                self.decreases += 1
+        elif not (throttled or slow) and latency_ms is not None and self.store.increase(s.max_limit):
+            with self._lock:
+                self.increases += 1
+
+    def _wake(self) -> None:
+        if self._waiters:
+            self._waiters[0].wake()
+
+    def slot(self) -> "_Slot":
+        return _Slot(self)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "queue_depth": len(self._waiters),
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "slow": self.slow,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+        return {
+            "store": self.store.kind,
+            "limit": round(self.store.get_limit(), 2),
+            "in_flight": self.store.in_flight(),
+            **counters,
+        }
+
+
+def is_throttle(exc: BaseException) -> bool:
+    """Ark/HTTP rate limiting (429), whichever client raised it."""
+    return classify(exc) == THROTTLED
+
+
+class _Slot:
+    """``async with governor.slot():`` around one Ark call; the outcome is reported on exit."""
+
+    def __init__(self, governor: Governor):
+        self._governor = governor
+        self._token: Optional[str] = None
+        self._started = 0.0
+
+    async def __aenter__(self) -> "_Slot":
+        self._token = await self._governor.acquire()
+        self._started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        latency_ms = (time.perf_counter() - self._started) * 1000
+        if exc is None:
+            await self._governor.release(self._token, latency_ms=latency_ms)
+        elif is_throttle(exc):
+            await self._governor.release(self._token, throttled=True)
+        else:
+            # Cancellations and other failures say nothing about Ark capacity
+            await self._governor.release(self._token)
+
+
+_lock = threading.Lock()
+_governor: Optional[Governor] = None
+
+
+def get_governor() -> Optional[Governor]:
+    """Process-wide governor, or None when ARK_GOVERNOR=off."""
+    global _governor
+    if os.getenv("ARK_GOVERNOR", "").lower() in ("off", "false", "0"):
+        return None
+    with _lock:
+        if _governor is None:
+            settings = GovernorSettings.from_env()
+            path = os.getenv("ARK_GOVERNOR_DB")
+            store: TokenStore = SqliteTokenStore(path, settings.initial) if path else LocalTokenStore(settings.initial)
+            _governor = Governor(settings, store)
+        return _governor
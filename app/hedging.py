@@ -0,0 +1,228 @@
+"""Opt-in hedged Ark calls to cut tail latency.
+
+A call still running after the configured percentile of recent latencies for
+its (model, interface) gets a duplicate; whichever copy succeeds first wins
+and the other is cancelled. Hedges are capped at a fraction of recent calls,
+so the extra load stays bounded even when Ark slows down across the board.
+No hedging happens for a key until it has enough latency samples.
+
+Tuning (environment):
+  - ARK_HEDGE                 "on" enables hedging (default off)
+  - ARK_HEDGE_PERCENTILE      latency percentile that triggers a hedge (default 95)
+  - ARK_HEDGE_MAX_RATE        max fraction of recent calls that may be hedged (default 0.05)
+  - ARK_HEDGE_MIN_SAMPLES     samples per key before hedging starts (default 20)
+  - ARK_HEDGE_WINDOW          recent samples kept per key and calls counted for the rate (default 200)
+  - ARK_HEDGE_MIN_DELAY_MS    never hedge earlier than this (default 1000)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from src.env import env_float, env_int
+
+
+T = TypeVar("T")
+Key = Tuple[str, str]
+
+
+@dataclass(frozen=True)
+class HedgeSettings:
+    percentile: float = 95.0
+    max_rate: float = 0.05
+    min_samples: int = 20
+    window: int = 200
+    min_delay_ms: float = 1000.0
+
+    @classmethod
+    def from_env(cls) -> "HedgeSettings":
+        return cls(
+            percentile=min(99.9, max(50.0, env_float("ARK_HEDGE_PERCENTILE", 95))),
+            max_rate=min(1.0, max(0.0, env_float("ARK_HEDGE_MAX_RATE", 0.05))),
+            min_samples=max(1, env_int("ARK_HEDGE_MIN_SAMPLES", 20)),
+            window=max(1, env_int("ARK_HEDGE_WINDOW", 200)),
+            min_delay_ms=max(0.0, env_float("ARK_HEDGE_MIN_DELAY_MS", 1000)),
+        )
+
+
+class LatencyTracker:
+    """Recent successful-call latencies per (model, interface)."""
+
+    def __init__(self, window: int):
+        self._window = window
+        self._samples: Dict[Key, Deque[float]] = {}
+
+    def record(self, key: Key, latency_ms: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self._window)
+        samples.append(latency_ms)
+
+    def count(self, key: Key) -> int:
+        return len(self._samples.get(key, ()))
+
+    def percentile(self, key: Key, pct: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+    def keys(self):
+        return list(self._samples)
+
+
+class Hedger:
+    def __init__(self, settings: HedgeSettings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._tracker = LatencyTracker(settings.window)
+        # Whether each recent call was hedged; bounds the hedge rate
+        self._recent: Deque[bool] = deque(maxlen=settings.window)
+        self._recent_hedged = 0
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.denied = 0
+
+    def delay_ms(self, key: Key) -> Optional[float]:
+        """How long to wait before hedging a call for ``key``; None while samples are too few."""
+        s = self.settings
+        with self._lock:
+            if self._tracker.count(key) < s.min_samples:
+                return None
+            threshold = self._tracker.percentile(key, s.percentile)
+        return max(s.min_delay_ms, threshold or 0.0)
+
+    def _note_call(self) -> int:
+        """Count a call into the rate window; returns its sequence number for ``_try_hedge``."""
+        with self._lock:
+            self.calls += 1
+            if len(self._recent) == self._recent.maxlen and self._recent[0]:
+                self._recent_hedged -= 1
+            self._recent.append(False)
+            return self.calls
+
+    def _try_hedge(self, seq: int) -> bool:
+        with self._lock:
+            # The call itself is in the window as not-hedged (unless it already aged out)
+            if self._recent_hedged + 1 > self.settings.max_rate * len(self._recent):
+                self.denied += 1
+                return False
+            # Calls ``calls - len + 1 .. calls`` are in the window, oldest first
+            pos = seq - (self.calls - len(self._recent)) - 1
+            if pos >= 0:
+                self._recent[pos] = True
+                self._recent_hedged += 1
+            self.hedged += 1
+            return True
+
+    def _record(self, key: Key, latency_ms: float, hedge_won: bool = False) -> None:
+        with self._lock:
+            self._tracker.record(key, latency_ms)
+            self.hedge_wins += int(hedge_won)
+
+    async def call(
+        self,
+        key: Key,
+        fn: Callable[[], Awaitable[T]],
+        slot: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+    ) -> T:
+        """Run ``fn``; if it is still running past the key's percentile, race a duplicate.
+
+        The caller already holds whatever admission ``fn`` needs. A duplicate
+        enters ``slot()`` (e.g. a governor slot) inside the race, and is timed
+        from when it got in, so queueing never counts as Ark latency.
+        """
+        seq = self._note_call()
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(fn())
+        delay = self.delay_ms(key)
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay / 1000.0)
+            if delay is None or primary in done or not self._try_hedge(seq):
+                result = await primary
+                self._record(key, (time.perf_counter() - started) * 1000)
+                return result
+            hedge_started: List[float] = []
+            hedge = asyncio.ensure_future(self._hedge(fn, slot, hedge_started))
+            return await self._race(key, primary, hedge, started, hedge_started)
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    @staticmethod
+    async def _hedge(
+        fn: Callable[[], Awaitable[T]], slot: Optional[Callable[[], AsyncContextManager[Any]]], started: List[float]
+    ) -> T:
+        if slot is None:
+            started.append(time.perf_counter())
+            return await fn()
+        async with slot():
+            started.append(time.perf_counter())
+            return await fn()
+
+    async def _race(
+        self, key: Key, primary: asyncio.Future, hedge: asyncio.Future, started: float, hedge_started: List[float]
+    ) -> Any:
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    if fut.exception() is not None:
+                        # Only the last copy standing may surface its failure
+                        if not pending:
+                            raise fut.exception()
+                        continue
+                    won = fut is hedge
+                    # Each copy is timed from its own start: that is what Ark took
+                    self._record(key, (time.perf_counter() - (hedge_started[0] if won else started)) * 1000, won)
+                    return fut.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+                fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise RuntimeError("unreachable")  # pragma: no cover
+
+    def stats(self) -> Dict[str, Any]:
+        s = self.settings
+        with self._lock:
+            thresholds = {
+                f"{model}/{interface}": {
+                    "samples": self._tracker.count((model, interface)),
+                    f"p{s.percentile:g}_ms": round(self._tracker.percentile((model, interface), s.percentile) or 0.0),
+                }
+                for model, interface in self._tracker.keys()
+            }
+            return {
+                "percentile": s.percentile,
+                "max_rate": s.max_rate,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "denied": self.denied,
+                "keys": thresholds,
+            }
+
+
+_lock = threading.Lock()
+_hedger: Optional[Hedger] = None
+
+
+def get_hedger() -> Optional[Hedger]:
+    """Process-wide hedger, or None unless ARK_HEDGE=on."""
+    global _hedger
+    if os.getenv("ARK_HEDGE", "").lower() not in ("on", "true", "1"):
+        return None
+    with _lock:
+        if _hedger is None:
+            _hedger = Hedger(HedgeSettings.from_env())
+        return _hedger
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.blobs import get_blob_store
+from app.config import settings
+from app.db import Loader
+from app.uploads import decode_image
+from src.cache import ByteLRU
+
+
+@dataclass
+class InputImage:
+    # Raw image bytes; the data URL Ark needs is built once, with the Ark payload
+    data: bytes
+    mime: str = "image/png"
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+# Images are immutable under their hash, so cached bytes never go stale
+input_cache: "ByteLRU[bytes]" = ByteLRU(settings.input_cache_max_bytes)
+
+
+def _stored_input(image_hash: str, mime: str) -> InputImage:
+    data = input_cache.get(image_hash)
+    if data is None:
+        data = get_blob_store().get(image_hash)
+        input_cache.put(image_hash, data)
+    return InputImage(data, mime)
+
+
+def _version_input(v: Dict[str, Any]) -> InputImage:
+    if v.get("image_hash"):
+        return _stored_input(v["image_hash"], v["image_mime"])
+    # Legacy inline row
+    return InputImage(decode_image(v["image_base64"]), v["image_mime"])
+
+
+def _missing(loader: Loader, project_id: str, detail: str) -> HTTPException:
+    if not loader.project_exists(project_id):
+        return HTTPException(status_code=404, detail="project not found")
+    return HTTPException(status_code=404, detail=detail)
+
+
+def resolve_primary(loader: Loader, project_id: str, version_id: str) -> InputImage:
+    """A stored version's image, for use as a generate primary image."""
+    v = loader.version_in_project(project_id, version_id)
+    if not v:
+        raise _missing(loader, project_id, "primary_version not found for project")
+    return _version_input(v)
+
+
+def resolve_refs(loader: Loader, project_id: str, asset_ids: Optional[List[str]]) -> List[InputImage]:
+    """Images of uploaded project assets, in request order."""
+    images: List[InputImage] = []
+    for asset_id in asset_ids or []:
+        a = loader.asset_in_project(project_id, asset_id)
+        if not a:
+            raise _missing(loader, project_id, f"asset {asset_id} not found for project")
+        images.append(_stored_input(a["image_hash"], a["image_mime"]))
+    return images
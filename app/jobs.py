@@ -0,0 +1,414 @@
+"""Durable background generation jobs.
+
+Submitting a job stores it in a local SQLite queue and returns immediately;
+worker tasks started with the app claim queued jobs, run them, and record the
+outcome, so a generation survives client disconnects and proxy timeouts.
+A claimed job holds a lease that its worker renews while it runs. A worker
+that dies (restart, crash) stops renewing, and once the lease lapses the job
+is claimed again by whichever worker polls next, up to ``JOBS_MAX_ATTEMPTS``.
+A job that fails with an unexpected error is queued again after a backoff,
+within the same attempt count; failures the client caused (``JobFailed``)
+are final. Only the worker of a job's current attempt can renew it or record
+its outcome. Every uvicorn worker pointed at the same file shares the queue.
+All SQLite access from the event loop goes through threads; idle workers
+wait on an event, not a thread.
+
+Tuning (environment):
+  - JOBS_DB             SQLite file of the queue (default jobs.sqlite)
+  - JOBS_WORKERS        jobs run concurrently per process (default 2; 0 = submit only)
+  - JOBS_LEASE_S        seconds a claim stays valid without renewal (default 60)
+  - JOBS_MAX_ATTEMPTS   claims before a job is failed for good (default 3)
+  - JOBS_RETRY_DELAY_S  backoff before re-running a failed attempt, doubled per attempt (default 2)
+  - JOBS_POLL_S         idle poll interval for work submitted by other processes (default 1)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from src.env import env_float, env_int
+
+
+log = logging.getLogger("app.jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL = (SUCCEEDED, FAILED)
+
+
+@dataclass(frozen=True)
+class JobSettings:
+    workers: int = 2
+    lease_s: float = 60.0
+    max_attempts: int = 3
+    poll_s: float = 1.0
+    retry_delay_s: float = 2.0
+
+    @classmethod
+    def from_env(cls) -> "JobSettings":
+        return cls(
+            workers=max(0, env_int("JOBS_WORKERS", 2)),
+            lease_s=max(1.0, env_float("JOBS_LEASE_S", 60)),
+            max_attempts=max(1, env_int("JOBS_MAX_ATTEMPTS", 3)),
+            poll_s=max(0.05, env_float("JOBS_POLL_S", 1)),
+            retry_delay_s=max(0.0, env_float("JOBS_RETRY_DELAY_S", 2)),
+        )
+
+
+class JobFailed(Exception):
+    """Raised by a job runner for failures the client caused (reported with ``status``)."""
+
+    def __init__(self, status: int, detail: Any):
+        super().__init__(str(detail))
+        self.status = status
+        self.detail = detail
+
+
+_SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    project_id text not null,
+    interface_name text not null,
+    status text not null,
+    params text not null,
+    result text,
+    error text,
+    error_status integer,
+    attempts integer not null default 0,
+    created_at real not null,
+    started_at real,
+    finished_at real,
+    lease_until real
+);
+create index if not exists jobs_status_created on jobs (status, created_at);
+"""
+
+
+def _row(cur: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    out = {d[0]: v for d, v in zip(cur.description, row)}
+    for k in ("params", "result"):
+        if out.get(k) is not None:
+            out[k] = json.loads(out[k])
+    return out
+
+
+class JobQueue:
+    """SQLite-backed queue; one connection guarded by a lock, WAL for multi-process use."""
+
+    def __init__(self, path: str, settings: Optional[JobSettings] = None):
+        self.path = path
+        self.settings = settings or JobSettings.from_env()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = _row
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.executescript(_SCHEMA)
+        # Woken on submit/retry/finish within this process; other processes are polled.
+        # Set from worker threads, so each loop's event is set on that loop
+        self._waiters_lock = threading.Lock()
+        self._work: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Event] = weakref.WeakKeyDictionary()
+        self._finished: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def submit(self, project_id: str, interface_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "insert into jobs (id, project_id, interface_name, status, params, created_at) values (?, ?, ?, ?, ?, ?)",
+                (job_id, project_id, interface_name, QUEUED, json.dumps(params), time.time()),
+            )
+        self._wake_workers()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._conn.execute("select * from jobs where id = ?", (job_id,)).fetchone()
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job, or a running one whose worker stopped renewing its lease."""
+        while True:
+            now = time.time()
+            c = self._conn
+            with self._lock:
+                c.execute("begin immediate")
+                try:
+                    # A queued job's lease_until, when set, is the end of its retry backoff
+                    job = c.execute(
+                        "select * from jobs where (status = ? and coalesce(lease_until, 0) <= ?)"
+                        " or (status = ? and lease_until < ?) order by created_at limit 1",
+                        (QUEUED, now, RUNNING, now),
+                    ).fetchone()
+                    abandoned = job is not None and job["attempts"] >= self.settings.max_attempts
+                    if abandoned:
+                        # Its worker died on the last attempt; stop handing it out
+                        error = "job abandoned: worker lost on the last attempt"
+                        if job["error"]:
+                            error += f"; previous attempt failed: {job['error']}"
+                        c.execute(
+                            "update jobs set status = ?, error = ?, error_status = 500, finished_at = ?, lease_until = null where id = ?",
+                            (FAILED, error, now, job["id"]),
+                        )
+                    elif job is not None:
+                        c.execute(
+                            "update jobs set status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? where id = ?",
+                            (RUNNING, now, now + self.settings.lease_s, job["id"]),
+                        )
+                    c.execute("commit")
+                except BaseException:
+                    c.execute("rollback")
+                    raise
+            if job is None:
+                return None
+            if abandoned:
+                # Claims run off the loop; long-pollers see this on their next re-check
+                log.warning("job_abandoned job_id=%s attempts=%s", job["id"], job["attempts"])
+                continue
+            if job["status"] == RUNNING:
+                log.warning("job_reclaimed job_id=%s attempts=%s", job["id"], job["attempts"])
+            job.update(status=RUNNING, attempts=job["attempts"] + 1, started_at=now)
+            return job
+
+    # Updates for a running attempt are guarded by its number: a worker whose lease lapsed
+    # and whose job was claimed again must not touch the new attempt
+    def renew(self, job_id: str, attempt: int) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                "update jobs set lease_until = ? where id = ? and status = ? and attempts = ?",
+                (time.time() + self.settings.lease_s, job_id, RUNNING, attempt),
+            )
+        return cur.rowcount > 0
+
+    def finish(
+        self,
+        job_id: str,
+        attempt: int,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        error_status: Optional[int] = None,
+    ) -> bool:
+        """Record the outcome of ``attempt``; False when that attempt no longer owns the job."""
+        status = FAILED if error is not None else SUCCEEDED
+        with self._lock:
+            cur = self._conn.execute(
+                "update jobs set status = ?, result = ?, error = ?, error_status = ?, finished_at = ?, lease_until = null"
+                " where id = ? and status = ? and attempts = ?",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    error_status,
+                    time.time(),
+                    job_id,
+                    RUNNING,
+                    attempt,
+                ),
+            )
+        if cur.rowcount == 0:
+            return False
+        self._notify(job_id)
+        return True
+
+    def retry(self, job_id: str, attempt: int, error: str) -> bool:
+        """Queue the job again after the backoff of ``attempt``; False once attempts are used up
+        or when that attempt no longer owns the job."""
+        if attempt >= self.settings.max_attempts:
+            return False
+        delay = self.settings.retry_delay_s * 2 ** (attempt - 1)
+        with self._lock:
+            cur = self._conn.execute(
+                "update jobs set status = ?, error = ?, lease_until = ? where id = ? and status = ? and attempts = ?",
+                (QUEUED, error, time.time() + delay, job_id, RUNNING, attempt),
+            )
+        if cur.rowcount == 0:
+            return False
+        self._wake_workers()
+        return True
+
+    def _notify(self, job_id: str) -> None:
+        # May run in a worker thread; each waiter is woken on its own loop
+        with self._waiters_lock:
+            waiters = self._finished.pop(job_id, [])
+        for loop, ev in waiters:
+            loop.call_soon_threadsafe(ev.set)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll: return the job once it is finished or ``timeout`` seconds passed."""
+        deadline = time.monotonic() + timeout
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        while True:
+            # Registered before the read, so a finish in between still wakes us
+            with self._waiters_lock:
+                self._finished.setdefault(job_id, []).append(waiter)
+            try:
+                job = await asyncio.to_thread(self.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in TERMINAL or remaining <= 0:
+                    return job
+                try:
+                    # Jobs run by other processes finish without notifying us; re-check periodically
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, self.settings.poll_s))
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._waiters_lock:
+                    waiters = self._finished.get(job_id)
+                    if waiters and waiter in waiters:
+                        waiters.remove(waiter)
+                        if not waiters:
+                            del self._finished[job_id]
+            waiter[1].clear()
+
+    def _wake_workers(self) -> None:
+        with self._waiters_lock:
+            events = list(self._work.items())
+        for loop, ev in events:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(ev.set)
+
+    async def wait_for_work(self) -> None:
+        """Return when work was queued in this process, or after ``poll_s`` for other processes'."""
+        loop = asyncio.get_running_loop()
+        with self._waiters_lock:
+            ev = self._work.get(loop)
+            if ev is None:
+                ev = self._work[loop] = asyncio.Event()
+        try:
+            await asyncio.wait_for(ev.wait(), self.settings.poll_s)
+        except asyncio.TimeoutError:
+            pass
+        ev.clear()
+
+    def stats(self, recent: int = 200) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            counts = {
+                r["status"]: r["n"]
+                for r in self._conn.execute("select status, count(*) as n from jobs group by status").fetchall()
+            }
+            oldest = self._conn.execute(
+                "select min(created_at) as t from jobs where status = ?", (QUEUED,)
+            ).fetchone()["t"]
+            done = self._conn.execute(
+                "select created_at, started_at, finished_at from jobs where status in (?, ?) order by finished_at desc limit ?",
+                (SUCCEEDED, FAILED, recent),
+            ).fetchall()
+        return {
+            "queue_depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "succeeded": counts.get(SUCCEEDED, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_queued_ms": int((now - oldest) * 1000) if oldest else 0,
+            # Over the most recent finished jobs
+            "wait_ms": _summary([j["started_at"] - j["created_at"] for j in done if j["started_at"]]),
+            "run_ms": _summary([j["finished_at"] - j["started_at"] for j in done if j["started_at"]]),
+            "total_ms": _summary([j["finished_at"] - j["created_at"] for j in done]),
+        }
+
+
+def _summary(seconds: List[float]) -> Dict[str, int]:
+    if not seconds:
+        return {"count": 0, "avg": 0, "p50": 0, "p95": 0}
+    ordered = sorted(seconds)
+
+    def _pct(p: float) -> int:
+        return int(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000)
+
+    return {"count": len(ordered), "avg": int(sum(ordered) / len(ordered) * 1000), "p50": _pct(0.5), "p95": _pct(0.95)}
+
+
+JobRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobWorkers:
+    """Worker tasks on the app's event loop; each runs one job at a time."""
+
+    def __init__(self, queue: JobQueue, runner: JobRunner):
+        self.queue = queue
+        self.runner = runner
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for n in range(self.queue.settings.workers):
+            self._tasks.append(asyncio.ensure_future(self._loop(n)))
+        log.info("job_workers_started workers=%s db=%s", len(self._tasks), self.queue.path)
+
+    async def stop(self) -> None:
+        # Interrupted jobs keep their lease and are picked up again after a restart
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, n: int) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pragma: no cover
+                log.warning("job_claim_error worker=%s error=%s", n, e)
+                job = None
+            if job is None:
+                await self.queue.wait_for_work()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id, attempt = job["id"], job["attempts"]
+        log.info("job_start job_id=%s interface=%s attempt=%s", job_id, job["interface_name"], attempt)
+        renew = asyncio.ensure_future(self._renew(job_id, attempt))
+        queue = self.queue
+        try:
+            result = await self.runner(job)
+        except JobFailed as e:
+            # The client's fault: running it again cannot help
+            if await asyncio.to_thread(queue.finish, job_id, attempt, error=str(e.detail), error_status=e.status):
+                log.warning("job_failed job_id=%s status=%s error=%s", job_id, e.status, e.detail)
+            else:
+                log.warning("job_lost job_id=%s attempt=%s", job_id, attempt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if await asyncio.to_thread(queue.retry, job_id, attempt, str(e)):
+                log.warning("job_retry job_id=%s attempt=%s error=%s", job_id, attempt, e)
+            elif await asyncio.to_thread(queue.finish, job_id, attempt, error=str(e), error_status=500):
+                log.warning("job_failed job_id=%s status=500 attempts=%s error=%s", job_id, attempt, e)
+            else:
+                log.warning("job_lost job_id=%s attempt=%s", job_id, attempt)
+        else:
+            if await asyncio.to_thread(queue.finish, job_id, attempt, result=result):
+                log.info("job_done job_id=%s run_ms=%s", job_id, int((time.time() - job["started_at"]) * 1000))
+            else:
+                # Our lease lapsed and another worker owns the job now; its outcome stands
+                log.warning("job_lost job_id=%s attempt=%s", job_id, attempt)
+        finally:
+            renew.cancel()
+
+    async def _renew(self, job_id: str, attempt: int) -> None:
+        while True:
+            await asyncio.sleep(self.queue.settings.lease_s / 3)
+            if not await asyncio.to_thread(self.queue.renew, job_id, attempt):
+                return
+
+
+_lock = threading.Lock()
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = JobQueue(settings.jobs_db)
+        return _queue
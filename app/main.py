@@ -3,11 +3,19 @@ from __future__ import annotations
 import os
 import logging
 import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from app.jobs import JobWorkers, get_job_queue
+from app.pagination import NEXT_CURSOR_HEADER
 from app.routes.projects import router as projects_router
+from app.routes.assets import router as assets_router
 from app.routes.generate import router as generate_router
+from app.routes.jobs import router as jobs_router, run_job
 from app.routes.versions import router as versions_router
+from app.routes.metrics import router as metrics_router
+from src.ark_client import close_async_clients
+from src.downloads import close_async_download_pools
 
 
 def _setup_logging() -> None:
@@ -19,9 +27,22 @@ def _setup_logging() -> None:
     )
 
 
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Background job workers; jobs left running by a previous process resume once their lease lapses
+    workers = JobWorkers(get_job_queue(), run_job)
+    workers.start()
+    try:
+        yield
+    finally:
+        await workers.stop()
+        await close_async_clients()
+        await close_async_download_pools()
+
+
 def create_app() -> FastAPI:
     _setup_logging()
-    app = FastAPI(title="Vehicle Designer API", version="0.1.0")
+    app = FastAPI(title="Vehicle Designer API", version="0.1.0", lifespan=_lifespan)
 
     logger = logging.getLogger("app.middleware")
 
@@ -44,6 +65,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=allow_methods,
         allow_headers=allow_headers,
+        expose_headers=[NEXT_CURSOR_HEADER],
     )
 
     @app.middleware("http")
@@ -69,6 +91,9 @@ def create_app() -> FastAPI:
     app.include_router(projects_router)
     app.include_router(generate_router)
     app.include_router(versions_router)
+    app.include_router(assets_router)
+    app.include_router(jobs_router)
+    app.include_router(metrics_router)
     return app
 
 
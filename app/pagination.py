@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=422, detail="invalid cursor")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="invalid cursor")
+    return data
+
+
+def decode_keyset_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """The ``(created_at, id)`` of a keyset cursor, parsed so it is safe to put in a filter."""
+    data = decode_cursor(cursor)
+    created_at, pid = data.get("created_at"), data.get("id")
+    if not isinstance(created_at, str) or not isinstance(pid, str):
+        raise HTTPException(status_code=422, detail="invalid cursor")
+    try:
+        return datetime.fromisoformat(created_at), uuid.UUID(pid)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="invalid cursor")
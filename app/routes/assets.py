@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+
+from app.blobs import get_blob_store
+from app.db import Loader, asset_upsert, get_loader
+from app.schemas import AssetOut, ImagePayload
+from app.uploads import decode_image, upload_mime
+
+
+router = APIRouter(prefix="/api/projects/{project_id}/assets", tags=["assets"])
+log = logging.getLogger("app.routes.assets")
+
+
+def _asset_out(a: Dict[str, Any]) -> AssetOut:
+    return AssetOut(asset_id=a["id"], project_id=a["project_id"], mime=a["image_mime"], created_at=a["created_at"])
+
+
+def _require_project(loader: Loader, project_id: str) -> None:
+    if not loader.project_exists(project_id):
+        raise HTTPException(status_code=404, detail="project not found")
+
+
+@router.post("", response_model=AssetOut)
+def create_asset(project_id: str, body: ImagePayload, loader: Loader = Depends(get_loader)):
+    log.info("asset_create project_id=%s mime=%s", project_id, body.mime)
+    _require_project(loader, project_id)
+    image_hash = get_blob_store().put(decode_image(body.base64), body.mime)
+    # Re-uploading the same image returns the asset the project already has
+    return _asset_out(asset_upsert(project_id, body.mime, image_hash))
+
+
+@router.post("/multipart", response_model=AssetOut)
+def create_asset_multipart(project_id: str, image: UploadFile = File(...), loader: Loader = Depends(get_loader)):
+    mime = upload_mime(image)
+    log.info("asset_create_multipart project_id=%s mime=%s", project_id, mime)
+    _require_project(loader, project_id)
+    image_hash = get_blob_store().put_stream(image.file, mime)
+    return _asset_out(asset_upsert(project_id, mime, image_hash))
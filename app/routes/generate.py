@@ -1,14 +1,24 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, Iterator, List, Literal, Optional, Tuple, Union
+import asyncio
+import base64
+import json
 import logging
-from fastapi import APIRouter, HTTPException
+import time
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 
-from app.ark import generate_images
-from app.schemas import CandidatesOut, GenerateCommon, ImagePayload
+from app.ark import ArkRejected, GeneratedImage, generate_images, iter_generate_images
+from app.db import Loader, get_loader
+from app.inputs import InputImage, resolve_primary, resolve_refs
+from app.schemas import BatchGenerateIn, BatchItem, CandidatesOut, GenerateCommon, PrimaryImage, RefImage
+from app.uploads import decode_image, parse_form_model, upload_mime
 
 # Align validation and prompt/image handling with src workflow
-from src.workflow.interfaces import SPECS, normalize_images
+from src.env import env_int
+from src.image_prep import ImagePrepError, get_image_prep
+from src.workflow.interfaces import normalize_images
 from src.workflow import templates as tpl
 
 
@@ -38,195 +48,422 @@ def _expand_prompt(prompt_mode: str, template_key: Optional[str], template_param
     raise HTTPException(status_code=422, detail="invalid prompt_mode")
 
 
-def _to_data_url(image_base64: Optional[str], mime: Optional[str]) -> Optional[str]:
-    if not image_base64:
-        return None
-    m = mime or "image/png"
-    return f"data:{m};base64,{image_base64}"
+def _inline_input(payload: Union[PrimaryImage, RefImage]) -> InputImage:
+    # A data: prefix on the base64 is tolerated; the format is re-detected by image prep
+    return InputImage(decode_image(payload.base64), payload.mime or "image/png")
 
 
-def _prepare_images(interface_name: str, primary_base64: Optional[str], primary_mime: Optional[str], ref_items: Optional[List[ImagePayload]]) -> List[str]:
-    primary_url = _to_data_url(primary_base64, primary_mime)
-    ref_urls = [
-        _to_data_url(r.base64, getattr(r, "mime", None))  # type: ignore[attr-defined]
-        for r in (ref_items or [])
-    ]
+async def _upload_input(f: UploadFile) -> InputImage:
+    # Starlette has already spooled the part to a temp file; read it once here
+    mime = upload_mime(f)
+    return InputImage(await f.read(), mime)
+
+
+def _inputs(
+    loader: Loader,
+    project_id: str,
+    body: GenerateCommon,
+    primary: Optional[InputImage] = None,
+    refs: Optional[List[InputImage]] = None,
+) -> Tuple[Optional[InputImage], List[Optional[InputImage]]]:
+    """Primary/ref images from inline base64 (or uploaded parts) plus stored versions/assets."""
+    if body.primary_version_id and (primary or body.primary_image):
+        raise HTTPException(status_code=422, detail="primary_image and primary_version_id are mutually exclusive")
+    if body.primary_version_id:
+        primary = resolve_primary(loader, project_id, body.primary_version_id)
+    elif primary is None and body.primary_image:
+        primary = _inline_input(body.primary_image)
+    if refs is None:
+        refs = [_inline_input(r) for r in (body.ref_images or [])]
+    return primary, list(refs) + resolve_refs(loader, project_id, body.ref_asset_ids)
+
+
+def _prepared_inputs(
+    interface_name: str,
+    project_id: str,
+    body: GenerateCommon,
+    loader: Loader,
+    primary: Optional[InputImage],
+    refs: Optional[List[InputImage]],
+) -> List[InputImage]:
+    images = _normalize(interface_name, *_inputs(loader, project_id, body, primary, refs))
+    prep = get_image_prep()
+    out: List[InputImage] = []
+    for img in images:
+        try:
+            data, mime = prep.prepare(img.data)
+        except ImagePrepError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        out.append(img if data is img.data and mime == img.mime else InputImage(data, mime))
+    return out
+
+
+async def _prepare_images(
+    interface_name: str,
+    project_id: str,
+    body: GenerateCommon,
+    loader: Loader,
+    primary: Optional[InputImage] = None,
+    refs: Optional[List[InputImage]] = None,
+) -> List[InputImage]:
+    """Validated inputs as raw bytes; base64 is decoded here and encoded again only for Ark.
+
+    Stored inputs need Supabase/blob store reads, and every input is decoded and
+    downscaled/recompressed when oversized (cached by content hash), so all of it
+    runs off the event loop.
+    """
+    if not (primary or refs or body.primary_image or body.ref_images or body.primary_version_id or body.ref_asset_ids):
+        return _normalize(interface_name, None, [])
+    return await asyncio.to_thread(_prepared_inputs, interface_name, project_id, body, loader, primary, refs)
+
+
+def _normalize(
+    interface_name: str, primary: Optional[InputImage], refs: List[Optional[InputImage]]
+) -> List[InputImage]:
     # normalize_images enforces required primary and max ref limits
     try:
-        return normalize_images(interface_name, primary_url, ref_urls)
+        return normalize_images(interface_name, primary, refs)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 
-@router.post("/text-to-image", response_model=CandidatesOut)
-def text_to_image(project_id: str, body: GenerateCommon):
-    log.info(
-        "text_to_image_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s",
-        project_id,
-        body.prompt_mode,
-        body.template_key,
-        body.num_candidates,
-    )
-    # Build/validate prompt via workflow templates when in template mode
-    prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
-    imgs = generate_images(
-        interface_name="TextToImage",
+def _timing(img: GeneratedImage) -> Dict[str, Optional[int]]:
+    # Generation and download latency reported separately per candidate
+    return {"generate_ms": img.generate_ms, "download_ms": img.download_ms}
+
+
+def _timings(imgs: List[GeneratedImage]) -> List[Dict[str, Optional[int]]]:
+    return [_timing(i) for i in imgs]
+
+
+StreamMode = Optional[Literal["sse", "ndjson"]]
+_STREAM_MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+
+def _frame(stream: str, event: str, data: Dict[str, Any]) -> str:
+    if stream == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+
+def _metadata(interface_name: str, body: GenerateCommon, imgs: List[GeneratedImage]) -> Dict[str, Any]:
+    return {
+        "interface_name": interface_name,
+        "prompt_mode": body.prompt_mode,
+        "template_key": body.template_key,
+        "template_params": body.template_params,
+        "ark": body.ark or {},
+        "timings": _timings(imgs),
+    }
+
+
+def _candidates_json(imgs: List[GeneratedImage], metadata: Dict[str, Any]) -> Iterator[bytes]:
+    """CandidatesOut body written from raw image bytes, one candidate at a time.
+
+    Each image is base64-encoded exactly once, straight into the output, so at
+    most one encoded candidate is alive besides the raw bytes (no full-body
+    str/bytes copies and no ImagePayload re-validation by response_model).
+    """
+    yield b'{"candidates":['
+    for n, img in enumerate(imgs):
+        yield b'%s{"base64":"%s","mime":%s}' % (b"," if n else b"", base64.b64encode(img.data), json.dumps(img.mime).encode())
+    yield b'],"metadata":%s}' % json.dumps(metadata).encode()
+
+
+async def _stream_candidates(
+    stream: str,
+    log_prefix: str,
+    project_id: str,
+    interface_name: str,
+    body: GenerateCommon,
+    gen_kwargs: Dict[str, Any],
+) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    imgs: List[GeneratedImage] = []
+    try:
+        async for img in iter_generate_images(**gen_kwargs):
+            if not imgs:
+                log.info(
+                    "%s_first_candidate project_id=%s ttfi_ms=%s",
+                    log_prefix,
+                    project_id,
+                    int((time.perf_counter() - started) * 1000),
+                )
+            yield _frame(
+                stream,
+                "candidate",
+                {"index": len(imgs), "candidate": {"base64": img.base64, "mime": img.mime}, "timings": _timing(img)},
+            )
+            imgs.append(img)
+    except Exception as e:
+        log.warning("%s_stream_error project_id=%s error=%s", log_prefix, project_id, e)
+        yield _frame(stream, "error", {"detail": str(e)})
+    yield _frame(stream, "metadata", {"candidates": len(imgs), "metadata": _metadata(interface_name, body, imgs)})
+    log.info("%s_exit project_id=%s candidates=%s", log_prefix, project_id, len(imgs))
+
+
+def _gen_kwargs(interface_name: str, body: GenerateCommon, prompt: Optional[str], images: List[InputImage]) -> Dict[str, Any]:
+    return dict(
+        interface_name=interface_name,
         prompt_mode=body.prompt_mode,
         custom_prompt=prompt if body.prompt_mode == "template" else body.custom_prompt,
         template_key=body.template_key,
         template_params=body.template_params,
-        primary_image_base64=None,
-        ref_images_base64=None,
+        primary_image=images[0] if images else None,
+        ref_images=images[1:] if images and len(images) > 1 else None,
         num_candidates=body.num_candidates or 4,
         ark=body.ark,
     )
-    payloads = [ImagePayload(base64=i.base64, mime=i.mime) for i in imgs]
-    meta: Dict = {
-        "interface_name": "TextToImage",
-        "prompt_mode": body.prompt_mode,
-        "template_key": body.template_key,
-        "template_params": body.template_params,
-        "ark": body.ark or {},
-    }
+
+
+def _generate_error(e: Exception) -> Optional[HTTPException]:
+    """The status every route and job reports for a generate failure retrying cannot fix."""
+    if isinstance(e, ArkRejected):
+        return HTTPException(status_code=e.status, detail=str(e))
+    if isinstance(e, ValueError):
+        # e.g. invalid ark.json_params
+        return HTTPException(status_code=422, detail=str(e))
+    return None
+
+
+async def _generate(
+    log_prefix: str,
+    project_id: str,
+    interface_name: str,
+    body: GenerateCommon,
+    prompt: Optional[str],
+    images: List[InputImage],
+    stream: StreamMode,
+):
+    gen_kwargs = _gen_kwargs(interface_name, body, prompt, images)
+    if stream:
+        # Push each candidate as soon as it is ready, then a final metadata frame
+        return StreamingResponse(
+            _stream_candidates(stream, log_prefix, project_id, interface_name, body, gen_kwargs),
+            media_type=_STREAM_MEDIA_TYPES[stream],
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    try:
+        imgs = await generate_images(**gen_kwargs)
+    except (ArkRejected, ValueError) as e:
+        raise _generate_error(e)
     log.info(
-        "text_to_image_exit project_id=%s candidates=%s",
+        "%s_exit project_id=%s candidates=%s",
+        log_prefix,
         project_id,
-        len(payloads),
+        len(imgs),
+    )
+    return StreamingResponse(
+        _candidates_json(imgs, _metadata(interface_name, body, imgs)),
+        media_type="application/json",
     )
-    return CandidatesOut(candidates=payloads, metadata=meta)
 
 
-@router.post("/sketch-to-3d", response_model=CandidatesOut)
-def sketch_to_3d(project_id: str, body: GenerateCommon):
+@router.post("/text-to-image", response_model=CandidatesOut)
+async def text_to_image(project_id: str, body: GenerateCommon, stream: StreamMode = Query(None)):
     log.info(
-        "sketch_to_3d_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
+        "text_to_image_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s",
         project_id,
         body.prompt_mode,
         body.template_key,
         body.num_candidates,
-        bool(body.primary_image),
-        len(body.ref_images or []),
     )
+    # Build/validate prompt via workflow templates when in template mode
     prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
-    # Enforce primary presence and ref limits via workflow normalize_images
-    images = _prepare_images(
-        interface_name="SketchTo3D",
-        primary_base64=body.primary_image.base64 if body.primary_image else None,
-        primary_mime=body.primary_image.mime if body.primary_image else None,
-        ref_items=body.ref_images,
-    )
-    imgs = generate_images(
-        interface_name="SketchTo3D",
-        prompt_mode=body.prompt_mode,
-        custom_prompt=prompt if body.prompt_mode == "template" else body.custom_prompt,
-        template_key=body.template_key,
-        template_params=body.template_params,
-        primary_image_base64=images[0] if images else None,
-        ref_images_base64=images[1:] if images and len(images) > 1 else None,
-        num_candidates=body.num_candidates or 4,
-        ark=body.ark,
-    )
-    payloads = [ImagePayload(base64=i.base64, mime=i.mime) for i in imgs]
-    meta: Dict = {
-        "interface_name": "SketchTo3D",
-        "prompt_mode": body.prompt_mode,
-        "template_key": body.template_key,
-        "template_params": body.template_params,
-        "ark": body.ark or {},
-    }
+    return await _generate("text_to_image", project_id, "TextToImage", body, prompt, [], stream)
+
+
+@router.post("/sketch-to-3d", response_model=CandidatesOut)
+async def sketch_to_3d(
+    project_id: str,
+    body: GenerateCommon,
+    stream: StreamMode = Query(None),
+    loader: Loader = Depends(get_loader),
+):
     log.info(
-        "sketch_to_3d_exit project_id=%s candidates=%s",
+        "sketch_to_3d_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
         project_id,
-        len(payloads),
+        body.prompt_mode,
+        body.template_key,
+        body.num_candidates,
+        bool(body.primary_image or body.primary_version_id),
+        len(body.ref_images or []) + len(body.ref_asset_ids or []),
     )
-    return CandidatesOut(candidates=payloads, metadata=meta)
+    prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
+    # Enforce primary presence and ref limits via workflow normalize_images
+    images = await _prepare_images("SketchTo3D", project_id, body, loader)
+    return await _generate("sketch_to_3d", project_id, "SketchTo3D", body, prompt, images, stream)
 
 
 @router.post("/fusion-randomize", response_model=CandidatesOut)
-def fusion_randomize(project_id: str, body: GenerateCommon):
+async def fusion_randomize(
+    project_id: str,
+    body: GenerateCommon,
+    stream: StreamMode = Query(None),
+    loader: Loader = Depends(get_loader),
+):
     log.info(
         "fusion_randomize_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
         project_id,
         body.prompt_mode,
         body.template_key,
         body.num_candidates,
-        bool(body.primary_image),
-        len(body.ref_images or []),
+        bool(body.primary_image or body.primary_version_id),
+        len(body.ref_images or []) + len(body.ref_asset_ids or []),
     )
     prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt) if body.prompt_mode else None
-    images = _prepare_images(
-        interface_name="FusionRandomize",
-        primary_base64=body.primary_image.base64 if body.primary_image else None,
-        primary_mime=body.primary_image.mime if body.primary_image else None,
-        ref_items=body.ref_images,
-    )
-    imgs = generate_images(
-        interface_name="FusionRandomize",
-        prompt_mode=body.prompt_mode,
-        custom_prompt=prompt if body.prompt_mode == "template" else body.custom_prompt,
-        template_key=body.template_key,
-        template_params=body.template_params,
-        primary_image_base64=images[0] if images else None,
-        ref_images_base64=images[1:] if images and len(images) > 1 else None,
-        num_candidates=body.num_candidates or 4,
-        ark=body.ark,
-    )
-    payloads = [ImagePayload(base64=i.base64, mime=i.mime) for i in imgs]
-    meta: Dict = {
-        "interface_name": "FusionRandomize",
-        "prompt_mode": body.prompt_mode,
-        "template_key": body.template_key,
-        "template_params": body.template_params,
-        "ark": body.ark or {},
-    }
+    images = await _prepare_images("FusionRandomize", project_id, body, loader)
+    return await _generate("fusion_randomize", project_id, "FusionRandomize", body, prompt, images, stream)
+
+
+@router.post("/refine-edit", response_model=CandidatesOut)
+async def refine_edit(
+    project_id: str,
+    body: GenerateCommon,
+    stream: StreamMode = Query(None),
+    loader: Loader = Depends(get_loader),
+):
     log.info(
-        "fusion_randomize_exit project_id=%s candidates=%s",
+        "refine_edit_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
         project_id,
-        len(payloads),
+        body.prompt_mode,
+        body.template_key,
+        body.num_candidates,
+        bool(body.primary_image or body.primary_version_id),
+        len(body.ref_images or []) + len(body.ref_asset_ids or []),
     )
-    return CandidatesOut(candidates=payloads, metadata=meta)
+    prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
+    images = await _prepare_images("RefineEdit", project_id, body, loader)
+    return await _generate("refine_edit", project_id, "RefineEdit", body, prompt, images, stream)
 
 
-@router.post("/refine-edit", response_model=CandidatesOut)
-def refine_edit(project_id: str, body: GenerateCommon):
+# Multipart variants: `params` carries the GenerateCommon JSON, images come as raw file parts
+_MULTIPART_ROUTES = {
+    "text-to-image": ("text_to_image", "TextToImage"),
+    "sketch-to-3d": ("sketch_to_3d", "SketchTo3D"),
+    "fusion-randomize": ("fusion_randomize", "FusionRandomize"),
+    "refine-edit": ("refine_edit", "RefineEdit"),
+}
+
+
+@router.post("/{route}/multipart", response_model=CandidatesOut)
+async def generate_multipart(
+    project_id: str,
+    route: Literal["text-to-image", "sketch-to-3d", "fusion-randomize", "refine-edit"],
+    params: str = Form(..., description="JSON object with the GenerateCommon fields"),
+    primary_image: Optional[UploadFile] = File(None),
+    ref_images: Optional[List[UploadFile]] = File(None),
+    stream: StreamMode = Query(None),
+    loader: Loader = Depends(get_loader),
+):
+    log_prefix, interface_name = _MULTIPART_ROUTES[route]
+    body = parse_form_model(GenerateCommon, params)
     log.info(
-        "refine_edit_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
+        "%s_multipart_enter project_id=%s prompt_mode=%s template_key=%s num_candidates=%s has_primary=%s ref_count=%s",
+        log_prefix,
         project_id,
         body.prompt_mode,
         body.template_key,
         body.num_candidates,
-        bool(body.primary_image),
-        len(body.ref_images or []),
+        bool(primary_image or body.primary_image or body.primary_version_id),
+        len(ref_images or body.ref_images or []) + len(body.ref_asset_ids or []),
     )
     prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
-    images = _prepare_images(
-        interface_name="RefineEdit",
-        primary_base64=body.primary_image.base64 if body.primary_image else None,
-        primary_mime=body.primary_image.mime if body.primary_image else None,
-        ref_items=body.ref_images,
+    # File parts win over base64 fields of `params`, which keep working for mixed clients
+    primary = await _upload_input(primary_image) if primary_image is not None else None
+    refs = [await _upload_input(f) for f in ref_images] if ref_images else None
+    images = await _prepare_images(interface_name, project_id, body, loader, primary, refs)
+    return await _generate(log_prefix, project_id, interface_name, body, prompt, images, stream)
+
+
+def _batch_concurrency() -> int:
+    return max(1, env_int("ARK_BATCH_MAX_CONCURRENCY", 8))
+
+
+async def _batch_item(
+    index: int,
+    item: BatchItem,
+    project_id: str,
+    loader: Loader,
+    calls: asyncio.Semaphore,
+) -> Tuple[str, Dict[str, Any]]:
+    """Run one batch item; failures become an error frame instead of failing the batch."""
+    started = time.perf_counter()
+    try:
+        prompt = _expand_prompt(item.prompt_mode, item.template_key, item.template_params, item.custom_prompt)
+        images = await _prepare_images(item.interface_name, project_id, item, loader)
+        imgs = await generate_images(**_gen_kwargs(item.interface_name, item, prompt, images), slots=calls)
+    except HTTPException as e:
+        return "error", {"index": index, "status": e.status_code, "detail": e.detail}
+    except (ArkRejected, ValueError) as e:
+        err = _generate_error(e)
+        return "error", {"index": index, "status": err.status_code, "detail": err.detail}
+    except Exception as e:
+        log.warning("generate_batch_item_error project_id=%s index=%s error=%s", project_id, index, e)
+        return "error", {"index": index, "status": 500, "detail": str(e)}
+    return "item", {
+        "index": index,
+        "candidates": [{"base64": i.base64, "mime": i.mime} for i in imgs],
+        "metadata": _metadata(item.interface_name, item, imgs),
+        "elapsed_ms": int((time.perf_counter() - started) * 1000),
+    }
+
+
+async def _stream_batch(stream: str, project_id: str, items: List[BatchItem], loader: Loader) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    cap = _batch_concurrency()
+    # One scheduler per batch: every Ark call of every item shares `calls`, and at
+    # most `cap` items hold prepared inputs at once, in submission order
+    calls = asyncio.Semaphore(cap)
+    admitted = asyncio.Semaphore(cap)
+
+    async def _run(index: int, item: BatchItem) -> Tuple[str, Dict[str, Any]]:
+        async with admitted:
+            return await _batch_item(index, item, project_id, loader, calls)
+
+    tasks = [asyncio.ensure_future(_run(i, item)) for i, item in enumerate(items)]
+    counts = {"item": 0, "error": 0}
+    try:
+        for fu in asyncio.as_completed(tasks):
+            event, data = await fu
+            counts[event] += 1
+            yield _frame(stream, event, data)
+    finally:
+        # Client went away: pending items never reach Ark
+        for t in tasks:
+            t.cancel()
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+    log.info(
+        "generate_batch_exit project_id=%s items=%s succeeded=%s failed=%s elapsed_ms=%s",
+        project_id,
+        len(items),
+        counts["item"],
+        counts["error"],
+        elapsed_ms,
     )
-    imgs = generate_images(
-        interface_name="RefineEdit",
-        prompt_mode=body.prompt_mode,
-        custom_prompt=prompt if body.prompt_mode == "template" else body.custom_prompt,
-        template_key=body.template_key,
-        template_params=body.template_params,
-        primary_image_base64=images[0] if images else None,
-        ref_images_base64=images[1:] if images and len(images) > 1 else None,
-        num_candidates=body.num_candidates or 4,
-        ark=body.ark,
+    yield _frame(
+        stream,
+        "done",
+        {"items": len(items), "succeeded": counts["item"], "failed": counts["error"], "elapsed_ms": elapsed_ms},
     )
-    payloads = [ImagePayload(base64=i.base64, mime=i.mime) for i in imgs]
-    meta: Dict = {
-        "interface_name": "RefineEdit",
-        "prompt_mode": body.prompt_mode,
-        "template_key": body.template_key,
-        "template_params": body.template_params,
-        "ark": body.ark or {},
-    }
+
+
+@router.post("/batch")
+async def generate_batch(
+    project_id: str,
+    body: BatchGenerateIn,
+    stream: Literal["sse", "ndjson"] = Query("ndjson"),
+    loader: Loader = Depends(get_loader),
+):
     log.info(
-        "refine_edit_exit project_id=%s candidates=%s",
+        "generate_batch_enter project_id=%s items=%s concurrency=%s",
         project_id,
-        len(payloads),
+        len(body.items),
+        _batch_concurrency(),
+    )
+    # Results are reported per item, in completion order, as they finish
+    return StreamingResponse(
+        _stream_batch(stream, project_id, body.items, loader),
+        media_type=_STREAM_MEDIA_TYPES[stream],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return CandidatesOut(candidates=payloads, metadata=meta)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+
+from app.ark import ArkRejected, generate_images
+from app.blobs import get_blob_store
+from app.db import Loader, get_loader
+from app.jobs import SUCCEEDED, JobFailed, get_job_queue
+from app.inputs import InputImage
+from app.routes.generate import _expand_prompt, _gen_kwargs, _generate_error, _metadata, _prepare_images
+from app.schemas import BatchItem, JobOut
+
+
+router = APIRouter(prefix="/api/projects/{project_id}/jobs", tags=["jobs"])
+log = logging.getLogger("app.routes.jobs")
+
+# Request fields that are resolved into stored inputs at submit time
+_INPUT_FIELDS = {"primary_image", "ref_images", "primary_version_id", "ref_asset_ids"}
+
+
+def _ts(t: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(t, timezone.utc).isoformat() if t else None
+
+
+def _store_inputs(images: List[InputImage]) -> List[Dict[str, str]]:
+    store = get_blob_store()
+    return [{"hash": store.put(i.data, i.mime), "mime": i.mime} for i in images]
+
+
+def _load_inputs(inputs: List[Dict[str, str]]) -> List[InputImage]:
+    store = get_blob_store()
+    return [InputImage(store.get(i["hash"]), i["mime"]) for i in inputs]
+
+
+def _job_out(job: Dict[str, Any]) -> JobOut:
+    result = None
+    if job["status"] == SUCCEEDED and job.get("result"):
+        store = get_blob_store()
+        result = {
+            "candidates": [
+                {"base64": base64.b64encode(store.get(c["hash"])).decode("ascii"), "mime": c["mime"]}
+                for c in job["result"]["candidates"]
+            ],
+            "metadata": job["result"]["metadata"],
+        }
+    return JobOut(
+        job_id=job["id"],
+        project_id=job["project_id"],
+        interface_name=job["interface_name"],
+        status=job["status"],
+        attempts=job["attempts"],
+        created_at=_ts(job["created_at"]),
+        started_at=_ts(job["started_at"]),
+        finished_at=_ts(job["finished_at"]),
+        error=job["error"],
+        error_status=job["error_status"],
+        result=result,
+    )
+
+
+async def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job runner used by the workers: generate, then keep candidates in the blob store."""
+    params = job["params"]
+    item = BatchItem.model_validate(params["item"])
+    images = await asyncio.to_thread(_load_inputs, params["inputs"])
+    try:
+        imgs = await generate_images(**_gen_kwargs(item.interface_name, item, params["prompt"], images))
+    except (ArkRejected, ValueError) as e:
+        # Final, with the status the sync routes return; anything else is retried
+        err = _generate_error(e)
+        raise JobFailed(err.status_code, err.detail)
+    store = get_blob_store()
+    keys = await asyncio.to_thread(lambda: [store.put(i.data, i.mime) for i in imgs])
+    return {
+        "candidates": [{"hash": k, "mime": i.mime} for k, i in zip(keys, imgs)],
+        "metadata": _metadata(item.interface_name, item, imgs),
+    }
+
+
+@router.post("", status_code=202, response_model=JobOut)
+async def submit_job(project_id: str, body: BatchItem, loader: Loader = Depends(get_loader)):
+    log.info(
+        "job_submit_enter project_id=%s interface=%s prompt_mode=%s num_candidates=%s",
+        project_id,
+        body.interface_name,
+        body.prompt_mode,
+        body.num_candidates,
+    )
+    if not await asyncio.to_thread(loader.project_exists, project_id):
+        raise HTTPException(status_code=404, detail="project not found")
+    # Validate and prepare inputs now, so bad requests fail here rather than in the queue
+    prompt = _expand_prompt(body.prompt_mode, body.template_key, body.template_params, body.custom_prompt)
+    images = await _prepare_images(body.interface_name, project_id, body, loader)
+    inputs = await asyncio.to_thread(_store_inputs, images)
+    params = {"item": body.model_dump(exclude=_INPUT_FIELDS), "prompt": prompt, "inputs": inputs}
+    job = await asyncio.to_thread(get_job_queue().submit, project_id, body.interface_name, params)
+    log.info("job_submitted project_id=%s job_id=%s inputs=%s", project_id, job["id"], len(inputs))
+    return JSONResponse(
+        status_code=202,
+        content=_job_out(job).model_dump(),
+        headers={"Location": f"/api/projects/{project_id}/jobs/{job['id']}"},
+    )
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(
+    project_id: str,
+    job_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Long-poll: seconds to wait for the job to finish"),
+):
+    queue = get_job_queue()
+    job = await queue.wait(job_id, wait) if wait else await asyncio.to_thread(queue.get, job_id)
+    if job is None or job["project_id"] != project_id:
+        raise HTTPException(status_code=404, detail="job not found")
+    return await asyncio.to_thread(_job_out, job)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+import logging
+from fastapi import APIRouter
+
+from app.derivatives import get_derivative_cache
+from app.governor import get_governor
+from app.hedging import get_hedger
+from app.inputs import input_cache
+from app.jobs import get_job_queue
+from app.routes.versions import version_cache
+from src.ark_client import pool_stats
+from src.image_prep import get_image_prep
+from src.result_cache import get_result_cache
+from src.retry import retry_stats
+
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+log = logging.getLogger("app.routes.metrics")
+
+
+@router.get("")
+def get_metrics() -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "ark_pool": pool_stats(),
+        "ark_retries": retry_stats.snapshot(),
+        "derivative_cache": get_derivative_cache().stats(),
+        "version_cache": version_cache.stats(),
+        "input_cache": input_cache.stats(),
+        "image_prep": get_image_prep().stats(),
+        "jobs": get_job_queue().stats(),
+    }
+    governor = get_governor()
+    if governor is not None:
+        out["ark_governor"] = governor.stats()
+    hedger = get_hedger()
+    if hedger is not None:
+        out["ark_hedge"] = hedger.stats()
+    result_cache = get_result_cache()
+    if result_cache is not None:
+        out["result_cache"] = result_cache.stats()
+    return out
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from typing import List
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
 import logging
 
-from app.db import project_create, project_get, project_list, version_count_for_project
+from app.db import project_create, project_get, project_list, version_count_for_project, version_counts_for_projects
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER, decode_keyset_cursor, encode_cursor
 from app.schemas import ProjectCreate, ProjectOut
 
 
@@ -20,16 +21,25 @@ def create_project(payload: ProjectCreate):
 
 
 @router.get("", response_model=List[ProjectOut])
-def list_projects():
-    log.info("project_list")
-    rows = project_list()
-    result: List[ProjectOut] = []
-    for p in rows:
-        cnt = version_count_for_project(p["id"])  # exact count
-        result.append(
-            ProjectOut(project_id=p["id"], name=p.get("name"), created_at=p["created_at"], version_count=cnt)
-        )
-    return result
+def list_projects(
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+):
+    log.info("project_list limit=%s cursor=%s", limit, bool(cursor))
+    after = decode_keyset_cursor(cursor) if cursor else None
+    # Fetch one extra row to know whether another page follows
+    rows = project_list(limit=limit + 1, after=after)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"created_at": last["created_at"], "id": last["id"]})
+    # One aggregate query for the whole page instead of one count per project
+    counts = version_counts_for_projects([p["id"] for p in rows])
+    return [
+        ProjectOut(project_id=p["id"], name=p.get("name"), created_at=p["created_at"], version_count=counts.get(p["id"], 0))
+        for p in rows
+    ]
 
 
 @router.get("/{project_id}", response_model=ProjectOut)
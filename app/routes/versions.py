@@ -1,18 +1,27 @@
 from __future__ import annotations
 
-from typing import List
+import base64
+from typing import Any, Dict, List, Literal, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile
 import logging
 
+from app.blobs import get_blob_store
+from app.config import settings
+from app.derivatives import MIME_FORMAT, derivative_key, get_derivative, warm_thumbnails
 from app.db import (
-    project_get,
-    version_get,
+    Loader,
+    get_loader,
     version_insert,
     version_list,
+    version_set_image_hash,
 )
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.uploads import decode_image, parse_form_model, upload_mime
+from src.cache import ByteLRU
 from app.schemas import (
     ImagePayload,
+    SubmitVersionFields,
     SubmitVersionIn,
     SubmitVersionOut,
     VersionDetailOut,
@@ -23,43 +32,153 @@ from app.schemas import (
 router = APIRouter(prefix="/api/projects/{project_id}", tags=["versions"])
 log = logging.getLogger("app.routes.versions")
 
+# Versions are immutable once inserted, so details can be cached until evicted
+version_cache: "ByteLRU[Dict[str, Any]]" = ByteLRU(
+    settings.version_cache_max_bytes, sizeof=lambda e: len(e["detail"]["image"]["base64"]) + 256
+)
+_DETAIL_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _image_hash(v: Dict[str, Any]) -> str:
+    """Blob key of a version's image; legacy inline rows are moved into the store on first use."""
+    if v.get("image_hash"):
+        return v["image_hash"]
+    image_hash = get_blob_store().put(decode_image(v["image_base64"]), v["image_mime"])
+    # Written back so the decode and upload happen once per row, not on every read
+    try:
+        version_set_image_hash(v["id"], image_hash)
+    except Exception as e:
+        log.warning("version_image_hash_backfill_failed version_id=%s error=%s", v["id"], e)
+    v["image_hash"] = image_hash
+    return image_hash
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str, wildcard: bool = True) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return (wildcard and "*" in tags) or etag in tags or f"W/{etag}" in tags
+
+
+def _version_in_project(loader: Loader, project_id: str, version_id: str, detail: str) -> Dict[str, Any]:
+    v = loader.version_in_project(project_id, version_id)
+    if not v:
+        # Only the miss path pays a second query, to pick the right 404
+        if not loader.project_exists(project_id):
+            raise HTTPException(status_code=404, detail="project not found")
+        raise HTTPException(status_code=404, detail=detail)
+    return v
+
+
+def _image_base64(v: Dict[str, Any]) -> str:
+    if v.get("image_hash"):
+        return base64.b64encode(get_blob_store().get(v["image_hash"])).decode("ascii")
+    return v["image_base64"]
+
 
 @router.post("/versions/create", response_model=SubmitVersionOut)
-def submit_version(project_id: str, body: SubmitVersionIn):
+def submit_version(
+    project_id: str,
+    body: SubmitVersionIn,
+    background_tasks: BackgroundTasks,
+    loader: Loader = Depends(get_loader),
+):
     log.info(
         "version_create project_id=%s base=%s interface=%s",
         project_id,
         body.base_version_id,
         body.interface_name,
     )
-    if not project_get(project_id):
-        raise HTTPException(status_code=404, detail="project not found")
-    base_ver = None
-    if body.base_version_id:
-        base_ver = version_get(body.base_version_id)
-        if not base_ver or base_ver.get("project_id") != project_id:
-            raise HTTPException(status_code=404, detail="base_version not found for project")
-    ver = version_insert(
+    base_ver = _submit_base(loader, project_id, body)
+    # Identical images are stored once; the row only references the blob
+    image_hash = get_blob_store().put(decode_image(body.image.base64), body.image.mime)
+    ver = _submit_insert(project_id, body, base_ver, body.image.mime, image_hash, background_tasks)
+    return SubmitVersionOut(
         project_id=project_id,
-        parent_version_id=base_ver.get("id") if base_ver else None,
-        interface_name=body.interface_name,
-        image_mime=body.image.mime,
-        image_base64=body.image.base64,
+        version={"id": ver["id"], "index": ver["index"]},
+        image=ImagePayload(base64=body.image.base64, mime=ver["image_mime"]),
+        interface_name=ver["interface_name"],
+    )
+
+
+@router.post("/versions/create/multipart", response_model=SubmitVersionOut)
+def submit_version_multipart(
+    project_id: str,
+    background_tasks: BackgroundTasks,
+    params: str = Form(..., description="JSON object with the SubmitVersionIn fields except image"),
+    image: UploadFile = File(...),
+    loader: Loader = Depends(get_loader),
+):
+    fields = parse_form_model(SubmitVersionFields, params)
+    log.info(
+        "version_create_multipart project_id=%s base=%s interface=%s",
+        project_id,
+        fields.base_version_id,
+        fields.interface_name,
     )
+    mime = upload_mime(image)
+    base_ver = _submit_base(loader, project_id, fields)
+    # The part is already spooled to a temp file; hash and store it without loading it whole
+    image_hash = get_blob_store().put_stream(image.file, mime)
+    ver = _submit_insert(project_id, fields, base_ver, mime, image_hash, background_tasks)
     return SubmitVersionOut(
         project_id=project_id,
         version={"id": ver["id"], "index": ver["index"]},
-        image=ImagePayload(base64=ver["image_base64"], mime=ver["image_mime"]),
+        image=ImagePayload(base64=_image_base64(ver), mime=ver["image_mime"]),
         interface_name=ver["interface_name"],
     )
 
 
+def _submit_base(loader: Loader, project_id: str, fields: SubmitVersionFields) -> Optional[Dict[str, Any]]:
+    if fields.base_version_id:
+        return _version_in_project(loader, project_id, fields.base_version_id, "base_version not found for project")
+    if not loader.project_exists(project_id):
+        raise HTTPException(status_code=404, detail="project not found")
+    return None
+
+
+def _submit_insert(
+    project_id: str,
+    fields: SubmitVersionFields,
+    base_ver: Optional[Dict[str, Any]],
+    image_mime: str,
+    image_hash: str,
+    background_tasks: BackgroundTasks,
+) -> Dict[str, Any]:
+    ver = version_insert(
+        project_id=project_id,
+        parent_version_id=base_ver.get("id") if base_ver else None,
+        interface_name=fields.interface_name,
+        image_mime=image_mime,
+        image_hash=image_hash,
+    )
+    # Gallery thumbnails are rendered after the response is sent
+    background_tasks.add_task(warm_thumbnails, image_hash)
+    return ver
+
+
 @router.get("/versions", response_model=List[VersionOutBrief])
-def list_versions(project_id: str):
-    log.info("version_list project_id=%s", project_id)
-    if not project_get(project_id):
+def list_versions(
+    project_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    loader: Loader = Depends(get_loader),
+):
+    log.info("version_list project_id=%s limit=%s cursor=%s", project_id, limit, bool(cursor))
+    after_index = None
+    if cursor:
+        after_index = decode_cursor(cursor).get("index")
+        if not isinstance(after_index, int):
+            raise HTTPException(status_code=422, detail="invalid cursor")
+    # Brief columns only; one extra row tells whether another page follows
+    rows = version_list(project_id, limit=limit + 1, after_index=after_index)
+    # Rows prove the project exists; only an empty page needs the project lookup
+    if not rows and not loader.project_exists(project_id):
         raise HTTPException(status_code=404, detail="project not found")
-    rows = version_list(project_id)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"index": rows[-1]["index"]})
     return [
         VersionOutBrief(
             id=v["id"],
@@ -73,38 +192,87 @@ def list_versions(project_id: str):
 
 
 @router.get("/versions/{version_id}", response_model=VersionDetailOut)
-def get_version(project_id: str, version_id: str):
+def get_version(
+    project_id: str,
+    version_id: str,
+    request: Request,
+    response: Response,
+    loader: Loader = Depends(get_loader),
+):
     log.info("version_get project_id=%s version_id=%s", project_id, version_id)
-    v = version_get(version_id)
-    if not v or v.get("project_id") != project_id:
+    etag = f'"{version_id}"'
+    headers = {"ETag": etag, "Cache-Control": _DETAIL_CACHE_CONTROL}
+    # The version is resolved (cache first) before any 304, so a conditional GET never
+    # vouches for an id that is missing or belongs to another project
+    if_none_match = request.headers.get("if-none-match")
+    cached = version_cache.get(version_id)
+    if cached is not None and cached["project_id"] == project_id:
+        if _etag_matches(if_none_match, etag, wildcard=False):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return cached["detail"]
+    v = loader.version_in_project(project_id, version_id)
+    if not v:
         raise HTTPException(status_code=404, detail="version not found for project")
-    return VersionDetailOut(
+    if _etag_matches(if_none_match, etag, wildcard=False):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    detail = VersionDetailOut(
         id=v["id"],
         index=v["index"],
         parent_version_id=v.get("parent_version_id"),
         interface_name=v["interface_name"],
-        image=ImagePayload(base64=v["image_base64"], mime=v["image_mime"]),
-    )
+        image=ImagePayload(base64=_image_base64(v), mime=v["image_mime"]),
+    ).model_dump()
+    version_cache.put(version_id, {"project_id": project_id, "detail": detail})
+    return detail
+
+
+@router.get("/versions/{version_id}/image")
+def get_version_image(
+    project_id: str,
+    version_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=16, le=4096),
+    format: Optional[Literal["png", "jpeg", "webp"]] = None,
+    loader: Loader = Depends(get_loader),
+):
+    log.info("version_image project_id=%s version_id=%s w=%s format=%s", project_id, version_id, w, format)
+    v = loader.version_in_project(project_id, version_id)
+    if not v:
+        raise HTTPException(status_code=404, detail="version not found for project")
+    image_hash = _image_hash(v)
+    source_fmt = MIME_FORMAT.get(v["image_mime"], "png")
+    fmt = format or source_fmt
+    # Versions are immutable, so every variant is cacheable forever
+    etag = f'"{derivative_key(image_hash, w, fmt)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if w is None and fmt == source_fmt:
+        return Response(content=get_blob_store().get(image_hash), media_type=v["image_mime"], headers=headers)
+    try:
+        data, mime = get_derivative(image_hash, w, fmt)
+    except OSError as e:
+        raise HTTPException(status_code=422, detail=f"image cannot be transformed: {e}")
+    return Response(content=data, media_type=mime, headers=headers)
 
 
 @router.post("/versions/{version_id}/revert", response_model=SubmitVersionOut)
-def revert_version(project_id: str, version_id: str):
+def revert_version(project_id: str, version_id: str, loader: Loader = Depends(get_loader)):
     log.info("version_revert project_id=%s version_id=%s", project_id, version_id)
-    if not project_get(project_id):
-        raise HTTPException(status_code=404, detail="project not found")
-    base = version_get(version_id)
-    if not base or base.get("project_id") != project_id:
-        raise HTTPException(status_code=404, detail="version not found for project")
+    base = _version_in_project(loader, project_id, version_id, "version not found for project")
+    # Revert copies only the blob reference, never the image data
     new_v = version_insert(
         project_id=project_id,
         parent_version_id=base["id"],
         interface_name=base["interface_name"],
         image_mime=base["image_mime"],
-        image_base64=base["image_base64"],
+        image_hash=_image_hash(base),
     )
     return SubmitVersionOut(
         project_id=project_id,
         version={"id": new_v["id"], "index": new_v["index"]},
-        image=ImagePayload(base64=new_v["image_base64"], mime=new_v["image_mime"]),
+        image=ImagePayload(base64=_image_base64(new_v), mime=new_v["image_mime"]),
         interface_name=new_v["interface_name"],
     )
@@ -31,8 +31,8 @@ class ImagePayload(BaseModel):
     mime: Literal["image/png", "image/jpeg"]
 
 
-class SubmitVersionIn(BaseModel):
-    image: ImagePayload
+# SubmitVersionIn without the image (JSON `params` field of the multipart variant)
+class SubmitVersionFields(BaseModel):
     interface_name: Literal["TextToImage", "SketchTo3D", "FusionRandomize", "RefineEdit"]
     base_version_id: Optional[UuidStr] = None
     # generation info stays out of DB per minimal schema; accepted but not stored
@@ -44,6 +44,10 @@ class SubmitVersionIn(BaseModel):
     seed: Optional[int] = None
 
 
+class SubmitVersionIn(SubmitVersionFields):
+    image: ImagePayload
+
+
 class SubmitVersionOut(BaseModel):
     project_id: UuidStr
     version: dict
@@ -59,6 +63,13 @@ class VersionDetailOut(BaseModel):
     image: ImagePayload
 
 
+class AssetOut(BaseModel):
+    asset_id: UuidStr
+    project_id: UuidStr
+    mime: str
+    created_at: str
+
+
 class PromptTemplateParams(BaseModel):
     template_key: str
     template_params: dict
@@ -81,10 +92,37 @@ class GenerateCommon(BaseModel):
     custom_prompt: Optional[str] = None
     primary_image: Optional[PrimaryImage] = None
     ref_images: Optional[List[RefImage]] = None
+    # Server-side inputs: a stored version as primary, uploaded project assets as refs
+    primary_version_id: Optional[UuidStr] = None
+    ref_asset_ids: Optional[List[UuidStr]] = None
     num_candidates: Optional[int] = 4
     ark: Optional[dict] = None
 
 
+class BatchItem(GenerateCommon):
+    interface_name: Literal["TextToImage", "SketchTo3D", "FusionRandomize", "RefineEdit"]
+
+
+class BatchGenerateIn(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=100)
+
+
 class CandidatesOut(BaseModel):
     candidates: List[ImagePayload]
     metadata: dict
+
+
+class JobOut(BaseModel):
+    job_id: str
+    project_id: UuidStr
+    interface_name: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    # Set once the job failed; `error_status` is the HTTP status the sync route would have used
+    error: Optional[str] = None
+    error_status: Optional[int] = None
+    # Set once the job succeeded
+    result: Optional[CandidatesOut] = None
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import base64
+import binascii
+from typing import Optional, Type, TypeVar
+
+from fastapi import HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ValidationError
+
+
+ALLOWED_IMAGE_MIMES = ("image/png", "image/jpeg")
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def parse_form_model(model: Type[M], raw: Optional[str]) -> M:
+    """Validate the JSON `params` form field of a multipart request."""
+    try:
+        return model.model_validate_json(raw or "{}")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors(include_url=False)))
+
+
+def decode_image(image_base64: str) -> bytes:
+    # Tolerate data URLs; the blob store keys on the raw image bytes
+    if image_base64.startswith("data:") and "," in image_base64:
+        image_base64 = image_base64.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail="image.base64 is not valid base64")
+
+
+def upload_mime(f: UploadFile) -> str:
+    mime = (f.content_type or "").split(";", 1)[0].strip().lower()
+    if mime not in ALLOWED_IMAGE_MIMES:
+        raise HTTPException(status_code=422, detail=f"{f.filename or 'image'}: unsupported content type {mime or '-'}")
+    return mime
@@ -15,10 +15,96 @@ create table if not exists public.version (
   index int not null,
   interface_name text not null,
   image_mime text not null,
-  image_base64 text not null,
+  -- sha256 hex of the image bytes; the bytes live in the content-addressed blob store
+  image_hash text null,
+  -- legacy inline image (rows created before the blob store); null for new rows
+  image_base64 text null,
   created_at timestamptz not null default now(),
   constraint version_index_unique unique (project_id, index)
 );
 
 create index if not exists idx_version_project_index on public.version(project_id, index asc);
 
+-- per-project reference images uploaded once and referenced by id from
+-- generate requests (ref_asset_ids); identical images map to one asset
+create table if not exists public.asset (
+  id uuid primary key default gen_random_uuid(),
+  project_id uuid not null references public.project(id) on delete cascade,
+  image_mime text not null,
+  image_hash text not null,
+  created_at timestamptz not null default now(),
+  constraint asset_project_hash_unique unique (project_id, image_hash)
+);
+
+
+-- migration for databases created before the blob store
+alter table public.version add column if not exists image_hash text;
+alter table public.version alter column image_base64 drop not null;
+
+-- blob store bucket (BLOB_STORE=supabase); objects are keyed by image_hash
+insert into storage.buckets (id, name, public)
+values ('version-images', 'version-images', false)
+on conflict (id) do nothing;
+
+-- version counts for a page of projects in one round trip (GET /api/projects)
+create or replace function public.project_version_counts(project_ids uuid[])
+returns table (project_id uuid, version_count bigint)
+language sql stable
+as $$
+  select v.project_id, count(*) as version_count
+  from public.version v
+  where v.project_id = any(project_ids)
+  group by v.project_id;
+$$;
+
+-- atomic version insert: allocates index = max + 1 and inserts in one call.
+-- Locking the project row serializes concurrent submits to the same project,
+-- so version_index_unique is never violated.
+create or replace function public.version_insert_next(
+  p_id uuid,
+  p_project_id uuid,
+  p_parent_version_id uuid,
+  p_interface_name text,
+  p_image_mime text,
+  p_image_hash text
+)
+returns public.version
+language plpgsql
+as $$
+declare
+  v public.version;
+begin
+  perform 1 from public.project where id = p_project_id for update;
+  insert into public.version (id, project_id, parent_version_id, index, interface_name, image_mime, image_hash)
+  select
+    p_id, p_project_id, p_parent_version_id,
+    coalesce(max(x.index), 0) + 1,
+    p_interface_name, p_image_mime, p_image_hash
+  from public.version x
+  where x.project_id = p_project_id
+  returning * into v;
+  return v;
+end;
+$$;
+
+-- dedupe-on-insert for assets: returns the existing row when the project
+-- already holds an image with the same hash
+create or replace function public.asset_upsert(
+  p_id uuid,
+  p_project_id uuid,
+  p_image_mime text,
+  p_image_hash text
+)
+returns public.asset
+language plpgsql
+as $$
+declare
+  a public.asset;
+begin
+  insert into public.asset (id, project_id, image_mime, image_hash)
+  values (p_id, p_project_id, p_image_mime, p_image_hash)
+  on conflict (project_id, image_hash) do nothing;
+  select * into a from public.asset where project_id = p_project_id and image_hash = p_image_hash;
+  return a;
+end;
+$$;
@@ -0,0 +1,197 @@
+"""Process-wide Ark SDK clients sharing one keep-alive connection pool.
+
+Both the API (`app.ark`) and the CLI/workflow runner (`src.ark_image_cli`)
+obtain their Ark client here instead of constructing one per call, so TCP/TLS
+setup to the Ark endpoint is paid once per connection rather than per request.
+
+Pool tuning (environment):
+  - ARK_POOL_MAX_CONNECTIONS   (default 64)
+  - ARK_POOL_MAX_KEEPALIVE     (default 32)
+  - ARK_POOL_KEEPALIVE_EXPIRY  seconds (default 60)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from src.env import env_float, env_int
+
+
+DEFAULT_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+
+
+@dataclass(frozen=True)
+class PoolSettings:
+    max_connections: int = 64
+    max_keepalive: int = 32
+    keepalive_expiry: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        return cls(
+            max_connections=max(1, env_int("ARK_POOL_MAX_CONNECTIONS", 64)),
+            max_keepalive=max(0, env_int("ARK_POOL_MAX_KEEPALIVE", 32)),
+            keepalive_expiry=max(0.0, env_float("ARK_POOL_KEEPALIVE_EXPIRY", 60.0)),
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class PoolStats:
+    """Thread-safe request/connection counters fed by httpcore trace events."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def on_event(self, event_name: str) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            requests = self.requests
+            opened = self.connections_opened
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "connections_reused": max(0, requests - opened),
+        }
+
+
+_lock = threading.Lock()
+_settings: Optional[PoolSettings] = None
+_stats = PoolStats()
+_sync_clients: Dict[Tuple[str, str, Optional[float]], Any] = {}
+# Per event loop, so clients on different loops never evict each other
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str, Optional[float]], Any]]
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _pool_settings() -> PoolSettings:
+    global _settings
+    if _settings is None:
+        _settings = PoolSettings.from_env()
+    return _settings
+
+
+def _timeout(timeout: Optional[float]) -> httpx.Timeout:
+    return httpx.Timeout(timeout or 600.0, connect=60.0)
+
+
+def _sync_http_client(timeout: Optional[float]) -> httpx.Client:
+    def _trace(event_name: str, info: Dict[str, Any]) -> None:
+        _stats.on_event(event_name)
+
+    def _on_request(request: httpx.Request) -> None:
+        _stats.on_request()
+        request.extensions["trace"] = _trace
+
+    return httpx.Client(
+        limits=_pool_settings().limits(),
+        timeout=_timeout(timeout),
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def _async_http_client(timeout: Optional[float]) -> httpx.AsyncClient:
+    async def _trace(event_name: str, info: Dict[str, Any]) -> None:
+        _stats.on_event(event_name)
+
+    async def _on_request(request: httpx.Request) -> None:
+        _stats.on_request()
+        request.extensions["trace"] = _trace
+
+    return httpx.AsyncClient(
+        limits=_pool_settings().limits(),
+        timeout=_timeout(timeout),
+        event_hooks={"request": [_on_request]},
+    )
+
+
+def get_ark_client(base_url: Optional[str], api_key: str, timeout: Optional[float] = None):
+    """Return the process-wide synchronous Ark client for (base_url, api_key, timeout)."""
+    from volcenginesdkarkruntime import Ark  # type: ignore
+
+    key = (base_url or DEFAULT_BASE_URL, api_key, timeout)
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            # The SDK sends its own timeout with every request, so it is set on the client too.
+            # Retries are owned by src.retry (budgeted, Retry-After aware); never stack the SDK's
+            client = Ark(
+                base_url=key[0],
+                api_key=api_key,
+                timeout=_timeout(timeout),
+                max_retries=0,
+                http_client=_sync_http_client(timeout),
+            )
+            _sync_clients[key] = client
+        return client
+
+
+def get_async_ark_client(base_url: Optional[str], api_key: str, timeout: Optional[float] = None):
+    """Return the AsyncArk client for (base_url, api_key, timeout) on the running event loop.
+
+    Async connections belong to the event loop that opened them, so each loop
+    gets its own client; :func:`close_async_clients` closes them on shutdown.
+    """
+    from volcenginesdkarkruntime import AsyncArk  # type: ignore
+
+    loop = asyncio.get_running_loop()
+    key = (base_url or DEFAULT_BASE_URL, api_key, timeout)
+    with _lock:
+        # Clients of a loop closed without shutdown can no longer be closed; drop them so their
+        # sockets are released (open connections reference their loop, defeating the weak key)
+        for stale in [lp for lp in _async_clients if lp.is_closed()]:
+            del _async_clients[stale]
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncArk(
+                base_url=key[0],
+                api_key=api_key,
+                timeout=_timeout(timeout),
+                max_retries=0,
+                http_client=_async_http_client(timeout),
+            )
+            clients[key] = client
+        return client
+
+
+async def close_async_clients() -> None:
+    """Close the running loop's AsyncArk clients and their connections (app shutdown)."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+def pool_stats() -> Dict[str, Any]:
+    s = _pool_settings()
+    with _lock:
+        clients = len(_sync_clients) + sum(len(c) for c in _async_clients.values())
+    return {
+        "max_connections": s.max_connections,
+        "max_keepalive": s.max_keepalive,
+        "keepalive_expiry": s.keepalive_expiry,
+        "clients": clients,
+        **_stats.snapshot(),
+    }
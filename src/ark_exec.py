@@ -0,0 +1,402 @@
+"""Programmatic Ark image execution for the CLI and the workflow runner.
+
+An :class:`ArkExecutor` loads ``config.toml`` once, holds one pooled Ark
+client and encodes each input image once, however many runs use it. The
+workflow runner calls it directly, once per candidate in concurrent mode.
+``src.ark_image_cli`` is a thin argv wrapper around it. Every run writes its
+outputs and a ``<run_id>_metadata.json`` to the output directory, as the CLI
+always has.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from src.ark_client import get_ark_client
+from src.cache import ByteLRU
+from src.config import ArkConfig, load_config
+from src.downloads import get_download_pool
+from src.image_prep import ImagePrepError, get_image_prep
+from src.result_cache import get_result_cache, is_deterministic, payload_key
+from src.retry import RetryBudget, RetryPolicy, call_with_retry, classify
+
+
+DEFAULT_MODEL = "doubao-seedream-4-0-250828"
+
+
+class ArkExecError(ValueError):
+    """Invalid setup or input (missing key, unreadable image, bad params); the CLI exits with 2."""
+
+
+def _parse_param_overrides(param_list: List[str]) -> Dict[str, Any]:
+    overrides: Dict[str, Any] = {}
+    for item in param_list:
+        if "=" not in item:
+            raise ValueError(f"Invalid --param '{item}', expected key=value")
+        k, v = item.split("=", 1)
+        v = v.strip()
+        # attempt simple typing: bool/int/float/str
+        if v.lower() in ("true", "false"):
+            overrides[k] = v.lower() == "true"
+        else:
+            try:
+                if "." in v:
+                    overrides[k] = float(v)
+                else:
+                    overrides[k] = int(v)
+            except ValueError:
+                overrides[k] = v
+    return overrides
+
+
+def _now_stamp() -> str:
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+
+_run_id_lock = threading.Lock()
+_last_run_ms = 0
+
+
+def _new_run_id() -> str:
+    # Concurrent runs in one process must not share a run id (and so a metadata file)
+    global _last_run_ms
+    with _run_id_lock:
+        ms = max(int(time.time() * 1000), _last_run_ms + 1)
+        _last_run_ms = ms
+    return f"{_now_stamp()}_{ms % 1000000}"
+
+
+def _split_image_and_weight(items: List[str]) -> Tuple[List[str], List[float]]:
+    paths: List[str] = []
+    weights: List[float] = []
+    for item in items[:3]:  # max 3
+        # Only treat trailing :weight when it looks like a local path, not a URL
+        if ":" in item and not item.lower().startswith("http"):
+            p, w = item.rsplit(":", 1)
+            try:
+                weights.append(float(w))
+                paths.append(p)
+            except ValueError:
+                paths.append(item)
+        else:
+            paths.append(item)
+    return paths, weights
+
+
+def _file_to_data_url(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    # Oversized photos/scans are downscaled and recompressed before upload
+    data, mime = get_image_prep().prepare(data)
+    b64 = base64.b64encode(data).decode("ascii")
+    return f"data:{mime};base64,{b64}"
+
+
+@dataclass
+class ArkRequest:
+    """One Ark generation, with the documented fields only (plus explicit extras)."""
+
+    prompt: str
+    model: Optional[str] = None
+    # Local image paths, optionally ``path:weight``; at most 3 are used
+    images: List[str] = field(default_factory=list)
+    source_index: int = 0
+    size: Optional[str] = None
+    seed: Optional[int] = None
+    guidance_scale: Optional[float] = None
+    sequential_image_generation: Optional[str] = None
+    response_format: str = "url"
+    watermark: bool = True
+    # Extra API params: ``key=value`` strings and/or a JSON object string
+    param: List[str] = field(default_factory=list)
+    json_params: str = ""
+    # Workflow interface making the call; its seed policy decides result caching
+    interface_name: Optional[str] = None
+
+
+@dataclass
+class RunResult:
+    exit_code: int
+    meta_path: Optional[str] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class ArkExecutor:
+    """Shared config, client and encoded inputs for any number of runs (thread-safe)."""
+
+    def __init__(
+        self,
+        cfg: Optional[ArkConfig] = None,
+        output_dir: Optional[str] = None,
+        timeout: Optional[int] = None,
+        log: TextIO = sys.stderr,
+        input_cache_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.cfg = cfg or load_config()
+        if not self.cfg.api_key:
+            raise ArkExecError("Missing API key. Set in config.toml [ark].api_key or env ARK_API_KEY.")
+        try:
+            import volcenginesdkarkruntime  # noqa: F401
+        except Exception as e:  # pragma: no cover
+            raise ArkExecError(
+                "Failed to import Ark SDK: install with pip install 'volcengine-python-sdk[ark]'. Error: " + str(e)
+            )
+        self.output_dir = output_dir or self.cfg.output_dir
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.timeout = timeout or self.cfg.timeout
+        # Process-wide pooled client: repeated/concurrent runs reuse connections
+        self.client = get_ark_client(self.cfg.base_url, self.cfg.api_key, self.timeout)
+        self.retry_policy = RetryPolicy.from_env()
+        self.log = log
+        # Bounded: one executor may serve a long batch over many distinct images
+        self._data_urls: ByteLRU[str] = ByteLRU(input_cache_bytes)
+
+    def data_url(self, path: str) -> str:
+        """The prepared data URL of a local image, read and encoded once per executor."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise ArkExecError(f"Image not found: {path}")
+        # An image rewritten in place is encoded again
+        key = f"{st.st_mtime_ns}:{st.st_size}:{path}"
+        url = self._data_urls.get(key)
+        if url is None:
+            try:
+                url = _file_to_data_url(path)
+            except ImagePrepError as e:
+                raise ArkExecError(f"Invalid input image: {e}")
+            self._data_urls.put(key, url)
+        return url
+
+    def preload(self, images: List[str]) -> None:
+        """Encode the inputs of upcoming runs up front (``path[:weight]`` items, as in ArkRequest)."""
+        for path in _split_image_and_weight(images)[0]:
+            self.data_url(path)
+
+    def build_payload(self, req: ArkRequest) -> Tuple[Dict[str, Any], List[str], List[float]]:
+        """Ark payload for ``req`` plus the local image paths and weights it used."""
+        model = req.model or self.cfg.default_model or DEFAULT_MODEL
+        img_paths, weights = _split_image_and_weight(req.images)
+        for p in img_paths:
+            if not os.path.exists(p):
+                raise ArkExecError(f"Image not found: {p}")
+
+        payload: Dict[str, Any] = {
+            "model": model,
+            "prompt": req.prompt,
+            "response_format": req.response_format,
+            "watermark": req.watermark,
+        }
+        if req.size:
+            payload["size"] = req.size
+        if req.seed is not None:
+            payload["seed"] = req.seed
+        if req.guidance_scale is not None:
+            payload["guidance_scale"] = req.guidance_scale
+        if req.sequential_image_generation:
+            payload["sequential_image_generation"] = req.sequential_image_generation
+
+        # Dynamic extra params (user must ensure they are documented)
+        try:
+            payload.update(_parse_param_overrides(req.param))
+        except ValueError as ve:
+            raise ArkExecError(str(ve))
+        if req.json_params:
+            try:
+                payload.update(json.loads(req.json_params))
+            except Exception as e:
+                raise ArkExecError(f"Invalid --json-params: {e}")
+
+        data_urls = [self.data_url(p) for p in img_paths]
+        if model.startswith("doubao-seededit-3-0-i2i"):
+            # Seededit: accept single image (source). If multiple provided, take source-index only.
+            if data_urls:
+                idx = max(0, min(req.source_index, len(data_urls) - 1))
+                payload["image"] = data_urls[idx]
+                if len(data_urls) > 1:
+                    print("Seededit i2i takes single source image; extra images ignored.", file=self.log)
+        else:
+            # Seedream: multi-image supported as per doc example
+            if data_urls:
+                payload["image"] = data_urls
+        return payload, img_paths, weights
+
+    def run(
+        self,
+        req: ArkRequest,
+        count: int = 1,
+        retry_budget: Optional[RetryBudget] = None,
+        parallel: int = 1,
+    ) -> RunResult:
+        """Call Ark ``count`` times, save outputs and metadata. Raises ArkExecError on bad input.
+
+        With ``parallel > 1`` up to that many calls are in flight at once, and each
+        call downloads its results while the others are still generating. Metadata
+        lists calls in completion order.
+        """
+        payload, img_paths, weights = self.build_payload(req)
+        count = max(1, count)
+
+        # Metadata common fields
+        run_id = _new_run_id()
+        meta: Dict[str, Any] = {
+            "run_id": run_id,
+            "timestamp": _now_stamp(),
+            "model": payload["model"],
+            "input": {
+                "prompt": req.prompt,
+                "images": img_paths,  # record local file names only
+                "weights": weights,
+            },
+            "request_payload_preview": {k: ("<data_url_list>" if k == "image" and isinstance(v, list) else ("<data_url>" if k == "image" else v)) for k, v in payload.items()},
+            "responses": [],
+            "outputs": [],
+            "retries": [],
+            "calls": [],
+        }
+
+        # Opt-in result cache: seeded calls are deterministic and can skip Ark
+        result_cache = get_result_cache()
+        cache_key = (
+            payload_key(payload) if result_cache is not None and is_deterministic(payload, req.interface_name) else None
+        )
+
+        # Transient Ark failures are retried; the budget may be shared with sibling runs
+        if retry_budget is None:
+            retry_budget = self.retry_policy.new_budget()
+
+        call = _Call(self, payload, run_id, count, meta, result_cache, cache_key, retry_budget)
+        workers = max(1, min(parallel, count))
+        if workers == 1:
+            ok = [call(i) for i in range(count)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                ok = list(ex.map(call, range(count)))
+        errors = ok.count(False)
+
+        # Write metadata
+        meta_path = os.path.join(self.output_dir, f"{run_id}_metadata.json")
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if errors and errors == count:
+            print("All requests failed. See metadata for details.", file=self.log)
+            return RunResult(1, meta_path, meta)
+        return RunResult(0, meta_path, meta)
+
+
+class _Call:
+    """One Ark call of a run plus its downloads; safe to run from several threads."""
+
+    def __init__(
+        self,
+        executor: ArkExecutor,
+        payload: Dict[str, Any],
+        run_id: str,
+        count: int,
+        meta: Dict[str, Any],
+        result_cache: Any,
+        cache_key: Optional[str],
+        retry_budget: RetryBudget,
+    ):
+        self.executor = executor
+        self.payload = payload
+        self.run_id = run_id
+        self.count = count
+        self.meta = meta
+        self.result_cache = result_cache
+        self.cache_key = cache_key
+        self.retry_budget = retry_budget
+        self._lock = threading.Lock()
+
+    def _record(self, i: int, response: Dict[str, Any], outputs: List[Any], started: float, generate_ms: int) -> None:
+        # A call's response and outputs are appended together, in completion order
+        with self._lock:
+            self.meta["responses"].append(response)
+            self.meta["outputs"].extend(outputs)
+            self.meta["calls"].append(
+                {
+                    "call": i + 1,
+                    "generate_ms": generate_ms,
+                    "total_ms": int((time.perf_counter() - started) * 1000),
+                    "outputs": len(outputs),
+                }
+            )
+
+    def __call__(self, i: int) -> bool:
+        ex = self.executor
+        output_dir = ex.output_dir
+        started = time.perf_counter()
+        cached = self.result_cache.get(self.cache_key) if self.result_cache is not None and self.cache_key else None
+        if cached is not None:
+            outputs: List[Any] = []
+            for j, raw in enumerate(cached):
+                out_path = os.path.join(output_dir, f"{self.run_id}_{i+1}_{j+1}.png")
+                with open(out_path, "wb") as f:
+                    f.write(raw)
+                outputs.append({"file": out_path, "cache_hit": True})
+            self._record(i, {"cache_hit": self.cache_key}, outputs, started, 0)
+            return True
+
+        def _on_retry(attempt: int, exc: BaseException, wait: float) -> None:
+            with self._lock:
+                self.meta["retries"].append({"call": i + 1, "attempt": attempt, "class": classify(exc), "delay_s": round(wait, 3)})
+            print(f"Retrying ({i+1}/{self.count}) in {wait:.1f}s after {classify(exc)} error: {exc}", file=ex.log)
+
+        try:
+            resp = call_with_retry(
+                lambda: ex.client.images.generate(**self.payload), ex.retry_policy, self.retry_budget, on_retry=_on_retry
+            )
+        except Exception as e:
+            print(f"Request failed ({i+1}/{self.count}, {classify(e)}): {e}", file=ex.log)
+            return False
+        generate_ms = int((time.perf_counter() - started) * 1000)
+
+        # Try to serialize response to dict
+        try:
+            resp_dict = json.loads(json.dumps(resp, default=lambda o: o.__dict__))
+        except Exception:
+            resp_dict = {"repr": str(resp)}
+
+        # Save outputs (download URLs if present) over the shared keep-alive pool
+        outputs = []
+        saved: List[str] = []
+        data_list = []
+        try:
+            data_list = getattr(resp, "data", None) or resp_dict.get("data", [])
+            for j, item in enumerate(data_list):
+                url = getattr(item, "url", None) if hasattr(item, "url") else item.get("url")
+                size = getattr(item, "size", None) if hasattr(item, "size") else item.get("size")
+                if url and str(url).lower().startswith("http"):
+                    out_path = os.path.join(output_dir, f"{self.run_id}_{i+1}_{j+1}.png")
+                    # Download if possible; if blocked, still record URL
+                    try:
+                        get_download_pool().fetch_to(url, out_path, timeout=ex.timeout)
+                        outputs.append({"file": out_path, "size": size, "source_url": url})
+                        saved.append(out_path)
+                    except Exception as de:
+                        outputs.append({"url": url, "size": size, "download_error": str(de)})
+                else:
+                    # If API returns non-URL content, just record as-is
+                    outputs.append(item)
+        except Exception as e:
+            outputs.append({"error": f"failed to parse outputs: {e}"})
+
+        if self.result_cache is not None and self.cache_key and saved and len(saved) == len(data_list):
+            images: List[bytes] = []
+            for path in saved:
+                with open(path, "rb") as f:
+                    images.append(f.read())
+            self.result_cache.put(self.cache_key, images)
+
+        self._record(i, resp_dict, outputs, started, generate_ms)
+        return True
@@ -0,0 +1,146 @@
+"""Shared pools for downloading Ark result images.
+
+All result URLs of a response are fetched in parallel over one process-wide
+keep-alive client (async for the API, threaded for the CLI). Concurrency per
+host is capped so a burst of 4K downloads does not open an unbounded number
+of connections to the same CDN node.
+
+Tuning (environment):
+  - ARK_DOWNLOAD_MAX_PER_HOST  (default 8)
+  - ARK_DOWNLOAD_TIMEOUT       seconds (default 30)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+import httpx
+
+from src.env import env_float, env_int
+
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _max_per_host() -> int:
+    return max(1, env_int("ARK_DOWNLOAD_MAX_PER_HOST", 8))
+
+
+def _timeout() -> float:
+    return env_float("ARK_DOWNLOAD_TIMEOUT", 30.0)
+
+
+class AsyncDownloadPool:
+    """Event-loop-bound download client with per-host concurrency limits."""
+
+    def __init__(self, max_per_host: int, timeout: float, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._max_per_host = max_per_host
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            transport=transport,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=32, keepalive_expiry=60.0),
+        )
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _slots_for(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        sem = self._host_slots.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self._max_per_host)
+            self._host_slots[host] = sem
+        return sem
+
+    async def fetch(self, url: str) -> bytes:
+        async with self._slots_for(url):
+            async with self._client.stream("GET", url) as r:
+                r.raise_for_status()
+                buf = bytearray()
+                async for chunk in r.aiter_bytes(_CHUNK_SIZE):
+                    buf.extend(chunk)
+                return bytes(buf)
+
+    async def fetch_all(self, urls: List[str]) -> List[bytes]:
+        """Download all URLs concurrently; order of results matches `urls`."""
+        return list(await asyncio.gather(*(self.fetch(u) for u in urls)))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class DownloadPool:
+    """Thread-safe blocking counterpart of AsyncDownloadPool (CLI and workflow runner)."""
+
+    def __init__(self, max_per_host: int, timeout: float, transport: Optional[httpx.BaseTransport] = None):
+        self._max_per_host = max_per_host
+        self._client = httpx.Client(
+            timeout=timeout,
+            transport=transport,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=32, keepalive_expiry=60.0),
+        )
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _slots_for(self, url: str) -> threading.BoundedSemaphore:
+        host = httpx.URL(url).host
+        with self._lock:
+            sem = self._host_slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self._max_per_host)
+                self._host_slots[host] = sem
+            return sem
+
+    def fetch_to(self, url: str, path: str, timeout: Optional[float] = None) -> int:
+        """Stream ``url`` into the file at ``path``; returns the number of bytes written."""
+        written = 0
+        kwargs = {"timeout": timeout} if timeout else {}
+        with self._slots_for(url):
+            with self._client.stream("GET", url, **kwargs) as r:
+                r.raise_for_status()
+                with open(path, "wb") as f:
+                    for chunk in r.iter_bytes(_CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+        return written
+
+
+_lock = threading.Lock()
+_pool: Optional[DownloadPool] = None
+# Per event loop: async connections belong to the loop that opened them
+_async_pools: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncDownloadPool] = weakref.WeakKeyDictionary()
+
+
+def get_async_download_pool() -> AsyncDownloadPool:
+    """Return the download pool for the running event loop (one per process under uvicorn).
+
+    :func:`close_async_download_pools` closes it on shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        # Pools of a loop closed without shutdown can no longer be closed; drop them so their
+        # sockets are released (open connections reference their loop, defeating the weak key)
+        for stale in [lp for lp in _async_pools if lp.is_closed()]:
+            del _async_pools[stale]
+        pool = _async_pools.get(loop)
+        if pool is None:
+            pool = _async_pools[loop] = AsyncDownloadPool(_max_per_host(), _timeout())
+        return pool
+
+
+async def close_async_download_pools() -> None:
+    """Close the running loop's download pool and its connections (app shutdown)."""
+    with _lock:
+        pool = _async_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
+
+
+def get_download_pool() -> DownloadPool:
+    """Return the process-wide blocking download pool."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = DownloadPool(_max_per_host(), _timeout())
+        return _pool
@@ -0,0 +1,24 @@
+"""Numeric tuning knobs read from the environment.
+
+Every module with environment tuning (Ark pool, downloads, retries, image
+prep, governor, hedging, jobs, caches) parses through these, so an unset,
+empty or malformed value always falls back to the documented default.
+"""
+
+from __future__ import annotations
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
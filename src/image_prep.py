@@ -0,0 +1,177 @@
+"""Input image normalization before images are sent to Ark.
+
+Phone photos and scans are often far larger than anything Ark needs. Inputs
+are checked from their header first (dimensions, format), so oversized or
+unsupported images are rejected before any decoding or upload. Images over
+the pixel/byte limits are downscaled and recompressed; images within the
+limits pass through byte for byte. Results are cached by the sha256 of the
+input bytes, so re-sending the same image costs a hash only.
+
+Tuning (environment):
+  - ARK_INPUT_MAX_PIXELS      downscale target (default 16777216, i.e. 4096x4096)
+  - ARK_INPUT_MAX_BYTES       recompress target (default 10 MiB)
+  - ARK_INPUT_REJECT_PIXELS   larger inputs are rejected outright (default 100 MP)
+  - ARK_INPUT_REJECT_BYTES    larger inputs are rejected outright (default 50 MiB)
+  - ARK_INPUT_CACHE_BYTES     normalized-output cache bound (default 64 MiB)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import math
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from src.cache import ByteLRU
+from src.env import env_int
+
+
+FORMAT_MIME = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Enough of the file for PIL to read dimensions of PNG/WEBP and typical JPEGs
+_HEADER_BYTES = 64 * 1024
+_JPEG_QUALITIES = (90, 82, 74, 66)
+
+
+class ImagePrepError(ValueError):
+    """Input image is unreadable, unsupported or beyond the hard limits."""
+
+
+@dataclass(frozen=True)
+class PrepLimits:
+    max_pixels: int
+    max_bytes: int
+    reject_pixels: int
+    reject_bytes: int
+
+    @classmethod
+    def from_env(cls) -> "PrepLimits":
+        return cls(
+            max_pixels=env_int("ARK_INPUT_MAX_PIXELS", 4096 * 4096),
+            max_bytes=env_int("ARK_INPUT_MAX_BYTES", 10 * 1024 * 1024),
+            reject_pixels=env_int("ARK_INPUT_REJECT_PIXELS", 100_000_000),
+            reject_bytes=env_int("ARK_INPUT_REJECT_BYTES", 50 * 1024 * 1024),
+        )
+
+
+def _pil():
+    try:
+        from PIL import Image  # type: ignore
+    except Exception as e:  # pragma: no cover
+        raise RuntimeError("Pillow not available. Install with: pip install Pillow") from e
+    return Image
+
+
+def probe(header: bytes) -> Optional[Tuple[str, int, int]]:
+    """(format, width, height) from the leading bytes of an image, or None if unreadable."""
+    Image = _pil()
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            return img.format or "", img.width, img.height
+    except Exception:
+        return None
+
+
+def _check(fmt: str, width: int, height: int, limits: PrepLimits) -> None:
+    if fmt not in FORMAT_MIME:
+        raise ImagePrepError(f"unsupported image format: {fmt or 'unknown'}")
+    if width * height > limits.reject_pixels:
+        raise ImagePrepError(f"image too large: {width}x{height} exceeds {limits.reject_pixels} pixels")
+
+
+def _encode(img: Any, fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    if fmt == "PNG":
+        img.save(out, format="PNG", optimize=True)
+    else:
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _shrink(data: bytes, limits: PrepLimits) -> Tuple[bytes, str]:
+    Image = _pil()
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        pixels = img.width * img.height
+        if pixels > limits.max_pixels:
+            scale = math.sqrt(limits.max_pixels / pixels)
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+        # Keep PNG for transparency when it fits; everything else recompresses as JPEG
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        if has_alpha:
+            out = _encode(img, "PNG", 0)
+            if len(out) <= limits.max_bytes:
+                return out, "image/png"
+        while True:
+            for q in _JPEG_QUALITIES:
+                out = _encode(img, "JPEG", q)
+                if len(out) <= limits.max_bytes:
+                    return out, "image/jpeg"
+            if img.width <= 64 or img.height <= 64:
+                raise ImagePrepError(f"image cannot be compressed below {limits.max_bytes} bytes")
+            img = img.resize((max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.LANCZOS)
+
+
+class ImagePrep:
+    def __init__(self, limits: PrepLimits, cache_bytes: int):
+        self.limits = limits
+        self._cache: "ByteLRU[Tuple[bytes, str]]" = ByteLRU(cache_bytes, sizeof=lambda v: len(v[0]) + 64)
+        self._lock = threading.Lock()
+        self.passed = 0
+        self.resized = 0
+        self.rejected = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def prepare(self, data: bytes) -> Tuple[bytes, str]:
+        """Return (bytes, mime) within the limits; ImagePrepError when the input is unusable."""
+        if len(data) > self.limits.reject_bytes:
+            self._count("rejected")
+            raise ImagePrepError(f"image too large: {len(data)} bytes exceeds {self.limits.reject_bytes}")
+        key = hashlib.sha256(data).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            # Inputs already within limits are cached as a bare "unchanged" marker
+            return (cached[0] or data), cached[1]
+        info = probe(data[:_HEADER_BYTES]) or probe(data)
+        if info is None:
+            self._count("rejected")
+            raise ImagePrepError("unreadable image")
+        fmt, width, height = info
+        try:
+            _check(fmt, width, height, self.limits)
+        except ImagePrepError:
+            self._count("rejected")
+            raise
+        if width * height <= self.limits.max_pixels and len(data) <= self.limits.max_bytes:
+            self._count("passed")
+            self._cache.put(key, (b"", FORMAT_MIME[fmt]))
+            return data, FORMAT_MIME[fmt]
+        self._count("resized")
+        result = _shrink(data, self.limits)
+        self._cache.put(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {"passed": self.passed, "resized": self.resized, "rejected": self.rejected}
+        return {**counts, "limits": asdict(self.limits), "cache": self._cache.stats()}
+
+
+_lock = threading.Lock()
+_prep: Optional[ImagePrep] = None
+
+
+def get_image_prep() -> ImagePrep:
+    """Process-wide preprocessor shared by the API and the CLI."""
+    global _prep
+    with _lock:
+        if _prep is None:
+            _prep = ImagePrep(PrepLimits.from_env(), env_int("ARK_INPUT_CACHE_BYTES", 64 * 1024 * 1024))
+        return _prep
@@ -0,0 +1,120 @@
+"""Opt-in cache of Ark generation results for deterministic (fixed-seed) calls.
+
+With a fixed seed, the same model, prompt, input images and size produce the
+same output, so a repeat of a seeded request can be answered without paying
+Ark again. Entries are keyed by a hash of the normalized Ark payload and kept
+in a small memory tier in front of a size-bounded disk tier.
+
+Enable by setting ARK_RESULT_CACHE_DIR. Tuning:
+  - ARK_RESULT_CACHE_MAX_BYTES     disk tier bound (default 2 GiB)
+  - ARK_RESULT_CACHE_MEMORY_BYTES  memory tier bound (default 64 MiB)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.cache import ByteLRU, DiskLRU
+from src.env import env_int
+from src.workflow.interfaces import SPECS
+
+
+# Fields that change the transport of the result, not the image itself
+_IGNORED_FIELDS = ("response_format", "stream")
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    norm = {k: v for k, v in payload.items() if k not in _IGNORED_FIELDS and v is not None}
+    if isinstance(norm.get("image"), str):
+        norm["image"] = [norm["image"]]
+    raw = json.dumps(norm, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(payload: Dict[str, Any], interface_name: Optional[str] = None) -> bool:
+    """Only seeded calls are reproducible; interfaces with varying seeds never are."""
+    if payload.get("seed") is None:
+        return False
+    if interface_name is not None:
+        spec = SPECS.get(interface_name)
+        return spec is not None and spec.seed_policy == "fixed"
+    return True
+
+
+def _pack(images: List[bytes]) -> bytes:
+    parts = [struct.pack(">I", len(images))]
+    for img in images:
+        parts.append(struct.pack(">Q", len(img)))
+        parts.append(img)
+    return b"".join(parts)
+
+
+def _unpack(data: bytes) -> List[bytes]:
+    (n,) = struct.unpack_from(">I", data, 0)
+    pos = 4
+    out: List[bytes] = []
+    for _ in range(n):
+        (size,) = struct.unpack_from(">Q", data, pos)
+        pos += 8
+        out.append(data[pos : pos + size])
+        pos += size
+    return out
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int, memory_bytes: int):
+        self._memory: ByteLRU[bytes] = ByteLRU(memory_bytes)
+        self._disk = DiskLRU(root, max_bytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[bytes]]:
+        data = self._memory.get(key)
+        if data is None:
+            data = self._disk.get(key)
+            if data is not None:
+                self._memory.put(key, data)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _unpack(data)
+
+    def put(self, key: str, images: List[bytes]) -> None:
+        if not images:
+            return
+        data = _pack(images)
+        self._disk.put(key, data)
+        self._memory.put(key, data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"hits": hits, "misses": misses, "memory": self._memory.stats(), "disk": self._disk.stats()}
+
+
+_lock = threading.Lock()
+_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Process-wide cache, or None when ARK_RESULT_CACHE_DIR is unset (the default)."""
+    global _cache
+    root = os.getenv("ARK_RESULT_CACHE_DIR")
+    if not root:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = ResultCache(
+                root,
+                env_int("ARK_RESULT_CACHE_MAX_BYTES", 2 * 1024**3),
+                env_int("ARK_RESULT_CACHE_MEMORY_BYTES", 64 * 1024**2),
+            )
+        return _cache
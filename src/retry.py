@@ -0,0 +1,217 @@
+"""Retry policy for Ark calls, shared by the API, the image CLI and the workflow runner.
+
+Transient failures (429, 5xx, timeouts, dropped connections) are retried with
+exponential backoff and full jitter; a ``Retry-After`` header from Ark wins
+over the computed delay. Each request (or CLI run) gets a retry budget, so a
+burst of failures cannot multiply load on an already struggling service.
+The SDK's own retries are disabled (see ``src.ark_client``) so attempts are
+never stacked.
+
+Tuning (environment):
+  - ARK_RETRY_MAX_ATTEMPTS  attempts per call, including the first (default 3)
+  - ARK_RETRY_BASE_DELAY    seconds; backoff is base * 2**retry (default 0.5)
+  - ARK_RETRY_MAX_DELAY     cap on any single delay, Retry-After included (default 30)
+  - ARK_RETRY_BUDGET        retries shared by all calls of one request/run (default 4)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from src.env import env_float, env_int
+
+
+T = TypeVar("T")
+
+THROTTLED = "throttled"
+SERVER = "server"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+FATAL = "fatal"
+
+RETRYABLE = (THROTTLED, SERVER, TIMEOUT, CONNECTION)
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by an Ark SDK or httpx error, if any."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify(exc: BaseException) -> str:
+    """Bucket an exception from the Ark SDK, httpx or asyncio into a retry class."""
+    status = status_code(exc)
+    if status == 429:
+        return THROTTLED
+    if status is not None:
+        return SERVER if status >= 500 else FATAL
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    name = type(exc).__name__
+    if "Timeout" in name:
+        return TIMEOUT
+    if "Connection" in name or name in ("ConnectError", "ReadError", "RemoteProtocolError", "NetworkError"):
+        return CONNECTION
+    return FATAL
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if the error carries one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    raw = headers.get("retry-after") if headers is not None else None
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    budget: int = 4
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=max(1, env_int("ARK_RETRY_MAX_ATTEMPTS", 3)),
+            base_delay=max(0.0, env_float("ARK_RETRY_BASE_DELAY", 0.5)),
+            max_delay=max(0.0, env_float("ARK_RETRY_MAX_DELAY", 30.0)),
+            budget=max(0, env_int("ARK_RETRY_BUDGET", 4)),
+        )
+
+    def delay(self, retry: int, exc: BaseException) -> float:
+        """Delay before retry number ``retry`` (0-based): Retry-After, else full jitter."""
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**retry)))
+
+    def new_budget(self) -> "RetryBudget":
+        return RetryBudget(self.budget)
+
+
+class RetryBudget:
+    """Retries left for one request or CLI run; shared by its concurrent calls."""
+
+    def __init__(self, retries: int):
+        self._lock = threading.Lock()
+        self.remaining = retries
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class RetryStats:
+    """Process-wide counters by error class (exported in /api/metrics)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.budget_exhausted = 0
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def record_retry(self, kind: str) -> None:
+        with self._lock:
+            self.retries[kind] = self.retries.get(kind, 0) + 1
+
+    def record_failure(self, kind: str, budget_exhausted: bool = False) -> None:
+        with self._lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+            self.budget_exhausted += int(budget_exhausted)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": dict(self.retries),
+                "failures": dict(self.failures),
+                "budget_exhausted": self.budget_exhausted,
+            }
+
+
+retry_stats = RetryStats()
+
+
+def _should_retry(policy: RetryPolicy, budget: Optional[RetryBudget], attempt: int, exc: BaseException) -> bool:
+    kind = classify(exc)
+    if kind not in RETRYABLE or attempt + 1 >= policy.max_attempts:
+        retry_stats.record_failure(kind)
+        return False
+    if budget is not None and not budget.try_spend():
+        retry_stats.record_failure(kind, budget_exhausted=True)
+        return False
+    retry_stats.record_retry(kind)
+    return True
+
+
+def call_with_retry(
+    fn: Callable[[], T],
+    policy: Optional[RetryPolicy] = None,
+    budget: Optional[RetryBudget] = None,
+    on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """Run ``fn`` under the retry policy (blocking callers: CLI, workflow runner)."""
+    policy = policy or RetryPolicy.from_env()
+    retry_stats.record_call()
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as exc:
+            if not _should_retry(policy, budget, attempt, exc):
+                raise
+            wait = policy.delay(attempt, exc)
+            if on_retry is not None:
+                on_retry(attempt + 1, exc, wait)
+            sleep(wait)
+            attempt += 1
+
+
+async def acall_with_retry(
+    fn: Callable[[], Awaitable[T]],
+    policy: Optional[RetryPolicy] = None,
+    budget: Optional[RetryBudget] = None,
+    on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+) -> T:
+    """Async variant of :func:`call_with_retry` (API)."""
+    policy = policy or RetryPolicy.from_env()
+    retry_stats.record_call()
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as exc:
+            if not _should_retry(policy, budget, attempt, exc):
+                raise
+            wait = policy.delay(attempt, exc)
+            if on_retry is not None:
+                on_retry(attempt + 1, exc, wait)
+            await asyncio.sleep(wait)
+            attempt += 1
@@ -0,0 +1,241 @@
+"""Resumable JSONL batch mode for the workflow CLI (``--batch jobs.jsonl``).
+
+Each line of the jobs file is one JSON object with the workflow CLI's options
+in snake_case (``interface``, ``prompt_mode``, ``custom_prompt``,
+``primary_image``, ``num_candidates``, ``size``, ``seed``, ...); keys a job
+leaves out fall back to the command-line values. Jobs are read lazily and run
+with bounded concurrency in one process, sharing one config and one Ark
+executor per output directory. Every finished job appends one line to the
+manifest. A re-run skips jobs the manifest records as ``ok``, so an
+interrupted run resumes where it stopped. Failed jobs run again.
+
+A job is identified by its ``id`` key, or else by a hash of its content.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.ark_exec import ArkExecError, ArkExecutor, RunResult
+from src.config import ArkConfig, load_config
+from src.workflow.runner import run_interface
+
+
+OK = "ok"
+FAILED = "failed"
+
+# Job keys forwarded to Ark (same names as the CLI passthrough options)
+ARK_KEYS = (
+    "size",
+    "seed",
+    "guidance_scale",
+    "sequential_image_generation",
+    "response_format",
+    "watermark",
+    "output_dir",
+    "timeout",
+    "param",
+    "json_params",
+)
+
+
+def default_manifest_path(jobs_path: str) -> str:
+    return os.path.splitext(jobs_path)[0] + ".manifest.jsonl"
+
+
+def job_id(job: Dict[str, Any]) -> str:
+    if job.get("id") not in (None, ""):
+        return str(job["id"])
+    canonical = json.dumps(job, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_jobs(path: str) -> Iterator[Tuple[int, str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Yield ``(line_no, job_id, job, error)`` one line at a time; blank and ``#`` lines are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError("job must be a JSON object")
+            except ValueError as e:
+                yield n, f"line-{n}", None, f"invalid job: {e}"
+                continue
+            yield n, job_id(job), job, None
+
+
+def completed_ids(manifest_path: str) -> Set[str]:
+    """Ids recorded as ok; a torn last line (crash mid-write) is ignored."""
+    done: Set[str] = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(rec, dict) and rec.get("status") == OK:
+                done.add(str(rec.get("id")))
+    return done
+
+
+class Manifest:
+    """Append-only JSONL; each record is flushed to disk before the next job is counted done."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Terminate a torn last line so the next record does not run into it
+        with open(path, "ab+") as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        self._f = open(path, "a", encoding="utf-8")
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _Executors:
+    """One executor per (output_dir, timeout), all built from one loaded config."""
+
+    def __init__(self, cfg: ArkConfig):
+        self.cfg = cfg
+        self._lock = threading.Lock()
+        self._executors: Dict[Tuple[Optional[str], Optional[int]], ArkExecutor] = {}
+
+    def get(self, output_dir: Optional[str], timeout: Optional[int]) -> ArkExecutor:
+        key = (output_dir, timeout)
+        with self._lock:
+            ex = self._executors.get(key)
+            if ex is None:
+                ex = ArkExecutor(cfg=self.cfg, output_dir=output_dir, timeout=timeout)
+                self._executors[key] = ex
+            return ex
+
+
+def _run_job(job: Dict[str, Any], defaults: Dict[str, Any], executors: _Executors) -> Tuple[int, List[str]]:
+    spec = {**defaults, **{k: v for k, v in job.items() if v is not None}}
+    template_params = spec.get("template_params") or {}
+    if isinstance(template_params, str):
+        template_params = json.loads(template_params)
+    ark_kwargs = {k: spec.get(k) for k in ARK_KEYS}
+    results: List[RunResult] = []
+    rc = run_interface(
+        interface_name=spec.get("interface"),
+        prompt_mode=spec.get("prompt_mode"),
+        template_key=spec.get("template_key"),
+        template_params=template_params,
+        custom_prompt=spec.get("custom_prompt"),
+        model=spec.get("model"),
+        primary_image=spec.get("primary_image"),
+        ref_images=spec.get("ref_images") or [],
+        num_candidates=int(spec.get("num_candidates") or 4),
+        concurrency=bool(spec.get("concurrency")),
+        max_workers=int(spec.get("max_workers") or 4),
+        ark_kwargs=ark_kwargs,
+        executor=executors.get(ark_kwargs["output_dir"], ark_kwargs["timeout"]),
+        on_result=results.append,
+    )
+    return rc, [r.meta_path for r in results if r.meta_path]
+
+
+def run_batch(
+    jobs_path: str,
+    defaults: Dict[str, Any],
+    manifest_path: Optional[str] = None,
+    workers: int = 4,
+    cfg: Optional[ArkConfig] = None,
+) -> int:
+    """Run every job of ``jobs_path`` not yet ok in the manifest; 0 when none failed."""
+    manifest_path = manifest_path or default_manifest_path(jobs_path)
+    done = completed_ids(manifest_path)
+    executors = _Executors(cfg or load_config())
+    try:
+        # Fail fast on setup problems (missing API key, SDK) instead of once per job
+        executors.get(defaults.get("output_dir"), defaults.get("timeout"))
+    except ArkExecError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    manifest = Manifest(manifest_path)
+    counts = {OK: 0, FAILED: 0, "skipped": 0}
+    counts_lock = threading.Lock()
+    seen: Set[str] = set()
+    started = time.perf_counter()
+
+    def _record(line_no: int, jid: str, status: str, exit_code: Optional[int], error: Optional[str], t0: float, metadata: List[str]) -> None:
+        manifest.append(
+            {
+                "id": jid,
+                "line": line_no,
+                "status": status,
+                "exit_code": exit_code,
+                "error": error,
+                "elapsed_ms": int((time.perf_counter() - t0) * 1000),
+                "metadata": metadata,
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        with counts_lock:
+            counts[status] += 1
+
+    def _one(line_no: int, jid: str, job: Dict[str, Any]) -> None:
+        t0 = time.perf_counter()
+        try:
+            rc, metadata = _run_job(job, defaults, executors)
+        except (ValueError, ArkExecError) as e:
+            _record(line_no, jid, FAILED, 2, str(e), t0, [])
+            print(f"Job {jid} (line {line_no}) failed: {e}", file=sys.stderr)
+            return
+        except Exception as e:
+            _record(line_no, jid, FAILED, 1, f"{type(e).__name__}: {e}", t0, [])
+            print(f"Job {jid} (line {line_no}) failed: {e}", file=sys.stderr)
+            return
+        _record(line_no, jid, OK if rc == 0 else FAILED, rc, None if rc == 0 else f"exit code {rc}", t0, metadata)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            pending: Set[Future] = set()
+            for line_no, jid, job, error in iter_jobs(jobs_path):
+                if jid in done or jid in seen:
+                    counts["skipped"] += 1
+                    continue
+                seen.add(jid)
+                if job is None:
+                    _record(line_no, jid, FAILED, 2, error, time.perf_counter(), [])
+                    continue
+                # Bounded lookahead: the file is never read much further than the work in flight
+                if len(pending) >= 2 * max(1, workers):
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pending.add(ex.submit(_one, line_no, jid, job))
+            wait(pending)
+    finally:
+        manifest.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Batch done in {elapsed:.1f}s: {counts[OK]} ok, {counts[FAILED]} failed, "
+        f"{counts['skipped']} skipped. Manifest: {manifest_path}"
+    )
+    return 0 if counts[FAILED] == 0 else 1
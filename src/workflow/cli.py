@@ -8,13 +8,14 @@ from src.workflow.interfaces import (
     FUSION_RANDOMIZE,
     REFINE_EDIT,
 )
+from src.workflow.batch import run_batch
 from src.workflow.runner import run_interface
 
 
 def main(argv: List[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Workflow CLI wrapper for Ark image generation")
-    parser.add_argument("--interface", required=True, choices=[TEXT_TO_IMAGE, SKETCH_TO_3D, FUSION_RANDOMIZE, REFINE_EDIT])
-    parser.add_argument("--prompt-mode", required=True, choices=["template", "custom"])
+    parser.add_argument("--interface", choices=[TEXT_TO_IMAGE, SKETCH_TO_3D, FUSION_RANDOMIZE, REFINE_EDIT])
+    parser.add_argument("--prompt-mode", choices=["template", "custom"])
     parser.add_argument("--template-key")
     parser.add_argument("--template-params", default="", help="JSON object of template params")
     parser.add_argument("--custom-prompt")
@@ -39,7 +40,16 @@ def main(argv: List[str] | None = None) -> int:
     parser.add_argument("--param", action="append", default=[])
     parser.add_argument("--json-params", dest="json_params")
 
+    # Batch mode: one job per JSONL line; the options above become per-job defaults
+    parser.add_argument("--batch", help="JSONL file of jobs (keys: the options above in snake_case)")
+    parser.add_argument("--manifest", help="Append-only results manifest (default: <batch>.manifest.jsonl)")
+    parser.add_argument("--batch-workers", type=int, default=4, help="Jobs run concurrently in batch mode")
+
     args = parser.parse_args(argv)
+    if not args.batch:
+        for flag, value in (("--interface", args.interface), ("--prompt-mode", args.prompt_mode)):
+            if not value:
+                parser.error(f"{flag} is required unless --batch is given")
 
     tpl_params: Dict[str, Any] = {}
     if args.template_params:
@@ -63,6 +73,23 @@ def main(argv: List[str] | None = None) -> int:
         "json_params": args.json_params,
     }
 
+    if args.batch:
+        defaults: Dict[str, Any] = {
+            "interface": args.interface,
+            "prompt_mode": args.prompt_mode,
+            "template_key": args.template_key,
+            "template_params": tpl_params,
+            "custom_prompt": args.custom_prompt,
+            "primary_image": args.primary_image,
+            "ref_images": args.ref_images,
+            "num_candidates": args.num_candidates,
+            "concurrency": args.concurrency,
+            "max_workers": args.max_workers,
+            "model": args.model,
+            **ark_kwargs,
+        }
+        return run_batch(args.batch, defaults, manifest_path=args.manifest, workers=args.batch_workers)
+
     return run_interface(
         interface_name=args.interface,
         prompt_mode=args.prompt_mode,
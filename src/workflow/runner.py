@@ -1,11 +1,12 @@
-import json
 import random
+import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional
 
 from src.workflow.interfaces import SPECS, normalize_images
 from src.workflow import templates as tpl
-from src import ark_image_cli
+from src.ark_exec import ArkExecError, ArkExecutor, ArkRequest, RunResult
+from src.retry import RetryBudget, RetryPolicy
 
 
 def _expand_prompt(prompt_mode: str, template_key: Optional[str], template_params: Dict[str, Any], custom_prompt: Optional[str]) -> str:
@@ -28,23 +29,13 @@ def _expand_prompt(prompt_mode: str, template_key: Optional[str], template_param
         raise ValueError(f"template_params missing key: {ke}")
 
 
-def _build_ark_argv(
+def _build_ark_request(
+    interface_name: str,
     model: str,
     prompt: str,
     images: List[str],
     ark_kwargs: Dict[str, Any],
-    count: int,
-) -> List[str]:
-    argv: List[str] = [
-        "--model",
-        model,
-        "--prompt",
-        prompt,
-    ]
-    if images:
-        argv.append("--images")
-        argv.extend(images)
-
+) -> ArkRequest:
     # Defaults per S10-P0-2 (apply when missing or None/empty)
     if "size" not in ark_kwargs or ark_kwargs.get("size") in (None, ""):
         ark_kwargs["size"] = "4K"
@@ -58,21 +49,21 @@ def _build_ark_argv(
     if "watermark" not in ark_kwargs or ark_kwargs.get("watermark") is None:
         ark_kwargs["watermark"] = False
 
-    # Known mapped args
-    for k in ["size", "seed", "guidance_scale", "sequential_image_generation", "response_format", "watermark", "output_dir", "timeout"]:
-        if k in ark_kwargs and ark_kwargs[k] is not None:
-            flag = f"--{k.replace('_', '-')}"
-            argv.extend([flag, str(ark_kwargs[k])])
-
-    # Extra passthrough
-    extra_params: List[str] = ark_kwargs.get("param", []) or []
-    for p in extra_params:
-        argv.extend(["--param", p])
-    if ark_kwargs.get("json_params"):
-        argv.extend(["--json-params", str(ark_kwargs["json_params"])])
-
-    argv.extend(["--count", str(max(1, int(count)))])
-    return argv
+    return ArkRequest(
+        prompt=prompt,
+        model=model,
+        images=list(images),
+        size=ark_kwargs["size"],
+        seed=ark_kwargs.get("seed"),
+        guidance_scale=ark_kwargs.get("guidance_scale"),
+        sequential_image_generation=ark_kwargs["sequential_image_generation"],
+        response_format=ark_kwargs["response_format"],
+        watermark=bool(ark_kwargs["watermark"]),
+        # Extra passthrough
+        param=list(ark_kwargs.get("param", []) or []),
+        json_params=str(ark_kwargs.get("json_params") or ""),
+        interface_name=interface_name,
+    )
 
 
 def run_interface(
@@ -88,6 +79,8 @@ def run_interface(
     concurrency: bool = False,
     max_workers: int = 4,
     ark_kwargs: Optional[Dict[str, Any]] = None,
+    executor: Optional[ArkExecutor] = None,
+    on_result: Optional[Callable[[RunResult], None]] = None,
 ) -> int:
     if interface_name not in SPECS:
         raise ValueError(f"unknown interface: {interface_name}")
@@ -100,13 +93,23 @@ def run_interface(
     base_ark = dict(ark_kwargs or {})
     provided_seed = base_ark.get("seed")
 
+    # One executor per invocation (or per batch): config, Ark client and encoded inputs are shared by all calls
+    try:
+        if executor is None:
+            executor = ArkExecutor(output_dir=base_ark.get("output_dir"), timeout=base_ark.get("timeout"))
+        executor.preload(images)
+    except ArkExecError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
     if not concurrency:
-        # Simpler path: one call with --count
-        argv = _build_ark_argv(model, prompt, images, base_ark, num_candidates)
-        return ark_image_cli.main(argv)
+        # Simpler path: one run with count=N
+        return _run(executor, _build_ark_request(interface_name, model, prompt, images, base_ark), num_candidates, on_result=on_result)
 
-    # Concurrency path: multiple calls with --count 1
+    # Concurrency path: multiple runs with count=1
     workers = max(1, min(max_workers, num_candidates))
+    # Parallel calls draw on one retry budget, as a single API request does
+    retry_budget = RetryPolicy.from_env().new_budget()
     results: List[int] = []
     with ThreadPoolExecutor(max_workers=workers) as ex:
         futs = []
@@ -116,8 +119,8 @@ def run_interface(
                 # assign different seed per call if not provided
                 if provided_seed is None:
                     call_kwargs["seed"] = random.randint(1, 2**31 - 1)
-            argv = _build_ark_argv(model, prompt, images, call_kwargs, 1)
-            futs.append(ex.submit(ark_image_cli.main, argv))
+            req = _build_ark_request(interface_name, model, prompt, images, call_kwargs)
+            futs.append(ex.submit(_run, executor, req, 1, retry_budget, on_result))
         for fu in as_completed(futs):
             try:
                 results.append(int(fu.result()))
@@ -125,3 +128,22 @@ def run_interface(
                 results.append(1)
     # Return 0 if any succeeded
     return 0 if any(r == 0 for r in results) else 1
+
+
+def _run(
+    executor: ArkExecutor,
+    req: ArkRequest,
+    count: int,
+    retry_budget: Optional[RetryBudget] = None,
+    on_result: Optional[Callable[[RunResult], None]] = None,
+) -> int:
+    try:
+        result = executor.run(req, count=count, retry_budget=retry_budget)
+    except ArkExecError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if on_result is not None:
+        on_result(result)
+    if result.exit_code == 0:
+        print(f"Done. Metadata written: {result.meta_path}")
+    return result.exit_code
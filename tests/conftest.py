@@ -1,6 +1,8 @@
 import os
 import sys
+import threading
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
 import pytest
@@ -22,15 +24,66 @@ class _Resp:
     count: Optional[int] = None
 
 
+_OPS = {
+    "eq": lambda a, b: a == b,
+    "gt": lambda a, b: a is not None and a > b,
+    "gte": lambda a, b: a is not None and a >= b,
+    "lt": lambda a, b: a is not None and a < b,
+}
+
+
+def _coerce(row_value: Any, raw: str) -> Any:
+    if isinstance(row_value, bool):
+        return raw == "true"
+    if isinstance(row_value, int):
+        return int(raw)
+    return raw
+
+
+def _split_top(expr: str) -> List[str]:
+    parts, depth, quoted, cur = [], 0, False, ""
+    for ch in expr:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    parts.append(cur)
+    return parts
+
+
+def _parse_logic(expr: str):
+    """Minimal PostgREST logic-tree parser (`or=(...)`) for the fake client."""
+    preds = []
+    for part in _split_top(expr):
+        for op in ("and", "or"):
+            if part.startswith(op + "(") and part.endswith(")"):
+                subs = _parse_logic(part[len(op) + 1 : -1])
+                combine = all if op == "and" else any
+                preds.append(lambda r, subs=subs, combine=combine: combine(p(r) for p in subs))
+                break
+        else:
+            col, op, raw = part.split(".", 2)
+            raw = raw[1:-1] if raw.startswith('"') and raw.endswith('"') else raw
+            preds.append(lambda r, col=col, op=op, raw=raw: _OPS[op](r.get(col), _coerce(r.get(col), raw)))
+    return preds
+
+
 class _Query:
     def __init__(self, table: "_Table"):
         self._table = table
         self._filters: List = []
-        self._order_key: Optional[str] = None
-        self._order_desc: bool = False
+        self._orders: List = []
         self._limit: Optional[int] = None
         self._count_mode: Optional[str] = None
         self._select_cols: Optional[str] = None
+        self._update: Optional[Dict[str, Any]] = None
 
     def select(self, cols: str, **kwargs):
         self._select_cols = cols
@@ -38,12 +91,20 @@ class _Query:
         return self
 
     def eq(self, key: str, value: Any):
-        self._filters.append((key, value))
+        self._filters.append(lambda r: r.get(key) == value)
+        return self
+
+    def gt(self, key: str, value: Any):
+        self._filters.append(lambda r: r.get(key) is not None and r.get(key) > value)
+        return self
+
+    def or_(self, expr: str):
+        preds = _parse_logic(expr)
+        self._filters.append(lambda r: any(p(r) for p in preds))
         return self
 
     def order(self, key: str, desc: bool = False):
-        self._order_key = key
-        self._order_desc = bool(desc)
+        self._orders.append((key, bool(desc)))
         return self
 
     def limit(self, n: int):
@@ -51,11 +112,16 @@ class _Query:
         return self
 
     def execute(self) -> _Resp:
+        self._table._client.queries.append(self._table._name)
         rows = list(self._table._rows)
-        for k, v in self._filters:
-            rows = [r for r in rows if r.get(k) == v]
-        if self._order_key:
-            rows.sort(key=lambda r: r.get(self._order_key), reverse=self._order_desc)
+        for f in self._filters:
+            rows = [r for r in rows if f(r)]
+        if self._update is not None:
+            for r in rows:
+                r.update(self._update)
+            return _Resp(data=rows)
+        for key, desc in reversed(self._orders):
+            rows.sort(key=lambda r: r.get(key), reverse=desc)
         if self._limit is not None:
             rows = rows[: self._limit]
         # apply projection if simple list of columns
@@ -70,8 +136,9 @@ class _Query:
 
 
 class _Table:
-    def __init__(self, name: str, storage: Dict[str, List[Dict[str, Any]]]):
+    def __init__(self, name: str, storage: Dict[str, List[Dict[str, Any]]], client: "_FakeClient"):
         self._name = name
+        self._client = client
         self._storage = storage
         self._rows = storage.setdefault(name, [])
         self._pending_insert: Optional[List[Dict[str, Any]]] = None
@@ -89,6 +156,11 @@ class _Table:
             return out
         return _Resp(data=[])
 
+    def update(self, values: Dict[str, Any]) -> _Query:
+        q = _Query(self)
+        q._update = dict(values)
+        return q
+
     # query builder
     def select(self, cols: str, **kwargs) -> _Query:
         return _Query(self).select(cols, **kwargs)
@@ -103,16 +175,88 @@ class _Table:
         return _Query(self).limit(n)
 
 
+def _rpc_project_version_counts(storage: Dict[str, List[Dict[str, Any]]], params: Dict[str, Any]):
+    ids = set(params["project_ids"])
+    counts: Dict[str, int] = {}
+    for r in storage.get("version", []):
+        if r.get("project_id") in ids:
+            counts[r["project_id"]] = counts.get(r["project_id"], 0) + 1
+    return [{"project_id": k, "version_count": v} for k, v in counts.items()]
+
+
+_insert_lock = threading.Lock()
+
+
+def _rpc_version_insert_next(storage: Dict[str, List[Dict[str, Any]]], params: Dict[str, Any]):
+    # The lock stands in for the project row lock taken by the SQL function
+    with _insert_lock:
+        rows = storage.setdefault("version", [])
+        idx = max((r["index"] for r in rows if r.get("project_id") == params["p_project_id"]), default=0) + 1
+        row = {
+            "id": params["p_id"],
+            "project_id": params["p_project_id"],
+            "parent_version_id": params.get("p_parent_version_id"),
+            "index": idx,
+            "interface_name": params["p_interface_name"],
+            "image_mime": params["p_image_mime"],
+            "image_hash": params["p_image_hash"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        rows.append(row)
+        return row
+
+
+def _rpc_asset_upsert(storage: Dict[str, List[Dict[str, Any]]], params: Dict[str, Any]):
+    with _insert_lock:
+        rows = storage.setdefault("asset", [])
+        for r in rows:
+            if r["project_id"] == params["p_project_id"] and r["image_hash"] == params["p_image_hash"]:
+                return r
+        row = {
+            "id": params["p_id"],
+            "project_id": params["p_project_id"],
+            "image_mime": params["p_image_mime"],
+            "image_hash": params["p_image_hash"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        rows.append(row)
+        return row
+
+
+# Local equivalents of the SQL functions in docs/project/schema.sql
+_RPC_FUNCTIONS = {
+    "project_version_counts": _rpc_project_version_counts,
+    "version_insert_next": _rpc_version_insert_next,
+    "asset_upsert": _rpc_asset_upsert,
+}
+
+
+class _Rpc:
+    def __init__(self, client: "_FakeClient", name: str, params: Dict[str, Any]):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self) -> _Resp:
+        self._client.rpc_calls.append(self._name)
+        return _Resp(data=_RPC_FUNCTIONS[self._name](self._client._storage, self._params))
+
+
 class _FakeClient:
     def __init__(self):
         self._storage: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpc_calls: List[str] = []
+        self.queries: List[str] = []
 
     def table(self, name: str) -> _Table:
-        return _Table(name, self._storage)
+        return _Table(name, self._storage, self)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _Rpc:
+        return _Rpc(self, name, params or {})
 
 
 @pytest.fixture(autouse=True)
-def _supabase_mode(monkeypatch):
+def _supabase_mode(monkeypatch, tmp_path):
     """By default, tests use an in-memory fake Supabase.
 
     To run tests against a real Supabase project, export SUPABASE_TEST_REAL=true
@@ -129,6 +273,21 @@ def _supabase_mode(monkeypatch):
         monkeypatch.setattr(adb, "get_client", lambda: fake, raising=True)
         monkeypatch.setattr(adb, "_require_env", lambda: None, raising=True)
 
+    # Version images go to a per-test local blob store
+    import app.blobs as blobs
+
+    monkeypatch.setattr(blobs, "_store", blobs.LocalBlobStore(str(tmp_path / "blobs")), raising=True)
+
+    # Background jobs queue in a per-test SQLite file
+    import app.jobs as jobs
+
+    monkeypatch.setattr(jobs, "_queue", jobs.JobQueue(str(tmp_path / "jobs.sqlite")), raising=True)
+
+    import app.derivatives as derivatives
+    from src.cache import DiskLRU
+
+    monkeypatch.setattr(derivatives, "_cache", DiskLRU(str(tmp_path / "derivatives"), 16 * 1024 * 1024), raising=True)
+
     yield
 # Silence deprecations from third-party client versions during tests
 # Suppress deprecation warnings coming from third-party libs during tests
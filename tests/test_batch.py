@@ -0,0 +1,198 @@
+import json
+import threading
+
+import src.ark_exec as ark_exec
+import src.workflow.batch as batch
+from src.config import ArkConfig
+from src.workflow.batch import Manifest, completed_ids, job_id, run_batch
+
+
+PNG_1x1 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMB/axuE9sAAAAASUVORK5CYII="
+
+
+class _StubImages:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prompts = []
+
+    def generate(self, **payload):
+        with self.lock:
+            self.prompts.append(payload["prompt"])
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+
+class _StubArk:
+    def __init__(self):
+        self.images = _StubImages()
+
+
+class _FakeJobs:
+    """Stands in for the per-job executor call; jobs whose prompt is in ``fail`` exit 1."""
+
+    def __init__(self, fail=()):
+        self.lock = threading.Lock()
+        self.fail = set(fail)
+        self.ran = []
+
+    def __call__(self, job, defaults, executors):
+        prompt = job["custom_prompt"]
+        with self.lock:
+            self.ran.append(prompt)
+        if prompt == "boom":
+            raise RuntimeError("executor crashed")
+        return (1, []) if prompt in self.fail else (0, [f"{prompt}_metadata.json"])
+
+
+def _cfg(tmp_path):
+    return ArkConfig(base_url="http://ark.test", api_key="k", output_dir=str(tmp_path / "out"))
+
+
+def _write_jobs(path, jobs):
+    with open(path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write((job if isinstance(job, str) else json.dumps(job)) + "\n")
+    return str(path)
+
+
+def _records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _setup(monkeypatch, fake):
+    monkeypatch.setattr(ark_exec, "get_ark_client", lambda *args, **kwargs: _StubArk())
+    monkeypatch.setattr(batch, "_run_job", fake)
+
+
+def test_job_id_prefers_explicit_id_and_hashes_content():
+    assert job_id({"id": 7, "custom_prompt": "a"}) == "7"
+    a = job_id({"interface": "TextToImage", "custom_prompt": "a", "seed": 1})
+    # Key order does not matter; any value does
+    assert a == job_id({"seed": 1, "custom_prompt": "a", "interface": "TextToImage"})
+    assert a != job_id({"interface": "TextToImage", "custom_prompt": "a", "seed": 2})
+    assert len(a) == 16 and job_id({"id": "", "custom_prompt": "a"}) == job_id({"id": "", "custom_prompt": "a"})
+
+
+def test_batch_rerun_executes_only_unfinished_jobs(monkeypatch, tmp_path):
+    jobs = _write_jobs(
+        tmp_path / "jobs.jsonl",
+        [
+            {"id": "a", "custom_prompt": "a"},
+            {"custom_prompt": "b"},
+            "# comment",
+            {"id": "c", "custom_prompt": "c"},
+            "not json",
+            {"id": "d", "custom_prompt": "boom"},
+            {"id": "a", "custom_prompt": "a"},
+        ],
+    )
+    manifest = str(tmp_path / "jobs.manifest.jsonl")
+    first = _FakeJobs(fail={"c"})
+    _setup(monkeypatch, first)
+
+    assert run_batch(jobs, {}, workers=2, cfg=_cfg(tmp_path)) == 1
+    # The duplicate "a" runs once; the default manifest sits next to the jobs file
+    assert sorted(first.ran) == ["a", "b", "boom", "c"]
+    status = {r["id"]: (r["status"], r["exit_code"]) for r in _records(manifest)}
+    assert status == {
+        "a": ("ok", 0),
+        job_id({"custom_prompt": "b"}): ("ok", 0),
+        "c": ("failed", 1),
+        "line-5": ("failed", 2),
+        "d": ("failed", 1),
+    }
+
+    # Resume: ok jobs are skipped; failed jobs and the unreadable line run again
+    second = _FakeJobs()
+    monkeypatch.setattr(batch, "_run_job", second)
+    with open(jobs, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "e", "custom_prompt": "e"}) + "\n")
+    assert run_batch(jobs, {}, manifest, workers=2, cfg=_cfg(tmp_path)) == 1
+    assert sorted(second.ran) == ["boom", "c", "e"]
+    assert completed_ids(manifest) == {"a", job_id({"custom_prompt": "b"}), "c", "e"}
+
+    third = _FakeJobs()
+    monkeypatch.setattr(batch, "_run_job", third)
+    with open(jobs, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "d", "custom_prompt": "d"}) + "\n")
+    assert run_batch(jobs, {}, manifest, workers=2, cfg=_cfg(tmp_path)) == 0
+    assert third.ran == ["d"]
+
+
+def test_torn_manifest_line_is_ignored_and_terminated(monkeypatch, tmp_path):
+    jobs = _write_jobs(tmp_path / "jobs.jsonl", [{"id": i, "custom_prompt": str(i)} for i in range(3)])
+    manifest = tmp_path / "m.jsonl"
+    # A crash mid-write left a partial record for job 1
+    manifest.write_text(json.dumps({"id": "0", "status": "ok"}) + '\n{"id": "1", "sta', encoding="utf-8")
+    fake = _FakeJobs()
+    _setup(monkeypatch, fake)
+
+    assert completed_ids(str(manifest)) == {"0"}
+    assert run_batch(jobs, {}, str(manifest), workers=1, cfg=_cfg(tmp_path)) == 0
+    assert fake.ran == ["1", "2"]
+    # The records written after the torn line are intact
+    assert completed_ids(str(manifest)) == {"0", "1", "2"}
+
+    Manifest(str(manifest)).close()
+    assert manifest.read_text(encoding="utf-8").count('{"id": "1", "sta\n') == 1
+
+
+def test_batch_reads_jobs_with_bounded_lookahead(monkeypatch, tmp_path):
+    jobs = _write_jobs(tmp_path / "jobs.jsonl", [{"id": i, "custom_prompt": str(i)} for i in range(20)])
+    release = threading.Event()
+    read = []
+    real_iter = batch.iter_jobs
+
+    def _iter(path):
+        for item in real_iter(path):
+            read.append(item[1])
+            yield item
+
+    def _blocked(job, defaults, executors):
+        release.wait(5)
+        return 0, []
+
+    _setup(monkeypatch, _blocked)
+    monkeypatch.setattr(batch, "iter_jobs", _iter)
+    result = {}
+    t = threading.Thread(target=lambda: result.update(rc=run_batch(jobs, {}, str(tmp_path / "m.jsonl"), workers=2, cfg=_cfg(tmp_path))))
+    t.start()
+    try:
+        t.join(0.3)
+        # Two jobs run and two wait per worker pair; the reader stops at the next line
+        assert len(read) == 2 * 2 + 1
+    finally:
+        release.set()
+        t.join(5)
+    assert result["rc"] == 0 and len(read) == 20
+
+
+def test_batch_jobs_share_one_executor_per_output_dir(monkeypatch, tmp_path):
+    stub = _StubArk()
+    monkeypatch.setattr(ark_exec, "get_ark_client", lambda *args, **kwargs: stub)
+    built = []
+    real_init = ark_exec.ArkExecutor.__init__
+
+    def _init(self, *args, **kwargs):
+        built.append(kwargs.get("output_dir"))
+        real_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(ark_exec.ArkExecutor, "__init__", _init)
+    other = str(tmp_path / "other")
+    jobs = _write_jobs(
+        tmp_path / "jobs.jsonl",
+        [
+            {"id": "a", "custom_prompt": "a"},
+            {"id": "b", "custom_prompt": "b"},
+            {"id": "c", "custom_prompt": "c", "output_dir": other},
+        ],
+    )
+    defaults = {"interface": "TextToImage", "prompt_mode": "custom", "num_candidates": 1}
+    manifest = str(tmp_path / "m.jsonl")
+
+    assert run_batch(jobs, defaults, manifest, workers=2, cfg=_cfg(tmp_path)) == 0
+    assert sorted(stub.images.prompts) == ["a", "b", "c"]
+    assert sorted(built, key=str) == sorted([None, other], key=str)
+    records = {r["id"]: r for r in _records(manifest)}
+    assert all(len(r["metadata"]) == 1 for r in records.values())
+    assert records["c"]["metadata"][0].startswith(other)
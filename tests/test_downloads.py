@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+import httpx
+import pytest
+
+import src.ark_exec as ark_exec
+from src import ark_image_cli
+from src.downloads import AsyncDownloadPool, DownloadPool
+
+
+class _Hosts:
+    """Counts requests in flight per host; URLs containing ``broken`` answer 500."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def enter(self, host):
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+
+    def leave(self, host):
+        with self.lock:
+            self.active[host] -= 1
+
+    def response(self, request):
+        if "broken" in request.url.path:
+            return httpx.Response(500)
+        return httpx.Response(200, content=str(request.url).encode())
+
+    def handler(self, request):
+        self.enter(request.url.host)
+        try:
+            time.sleep(0.05)
+            return self.response(request)
+        finally:
+            self.leave(request.url.host)
+
+    async def async_handler(self, request):
+        self.enter(request.url.host)
+        try:
+            await asyncio.sleep(0.05)
+            return self.response(request)
+        finally:
+            self.leave(request.url.host)
+
+
+def test_async_download_pool_caps_hosts_and_keeps_order():
+    hosts = _Hosts()
+    urls = [f"http://cdn-{h}.test/{i}.png" for i in range(5) for h in "ab"]
+
+    async def _main():
+        pool = AsyncDownloadPool(2, 5, transport=httpx.MockTransport(hosts.async_handler))
+        blobs = await pool.fetch_all(urls)
+        with pytest.raises(httpx.HTTPStatusError):
+            await pool.fetch_all(["http://cdn-a.test/1.png", "http://cdn-a.test/broken.png"])
+        return blobs
+
+    blobs = asyncio.run(_main())
+    assert blobs == [u.encode() for u in urls]
+    assert hosts.peak == {"cdn-a.test": 2, "cdn-b.test": 2}
+
+
+def test_download_pool_caps_concurrency_per_host(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    hosts = _Hosts()
+    pool = DownloadPool(2, 5, transport=httpx.MockTransport(hosts.handler))
+    urls = [f"http://cdn-{h}.test/{i}.png" for i in range(4) for h in "ab"]
+    paths = [str(tmp_path / f"{n}.png") for n in range(len(urls))]
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        sizes = list(ex.map(pool.fetch_to, urls, paths))
+    assert sizes == [len(u) for u in urls]
+    assert all(open(p, "rb").read() == u.encode() for u, p in zip(urls, paths))
+    assert hosts.peak == {"cdn-a.test": 2, "cdn-b.test": 2}
+
+
+class _UrlImages:
+    """Ark stand-in answering each call with two result URLs on different hosts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def generate(self, **payload):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(0.05)
+        finally:
+            with self.lock:
+                self.active -= 1
+        second = "broken" if n == 2 else str(n)
+        return {"data": [{"url": f"http://cdn-a.test/{n}.png"}, {"url": f"http://cdn-b.test/{second}.png"}]}
+
+
+class _StubArk:
+    def __init__(self):
+        self.images = _UrlImages()
+
+
+def test_cli_parallel_count_downloads_while_generating(monkeypatch, tmp_path, capsys):
+    stub = _StubArk()
+    hosts = _Hosts()
+    pool = DownloadPool(2, 5, transport=httpx.MockTransport(hosts.handler))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ARK_API_KEY", "k")
+    monkeypatch.setattr(ark_exec, "get_ark_client", lambda *args, **kwargs: stub)
+    monkeypatch.setattr(ark_exec, "get_download_pool", lambda: pool)
+
+    out_dir = tmp_path / "out"
+    rc = ark_image_cli.main(["--prompt", "a car", "--count", "4", "--parallel", "4", "--output-dir", str(out_dir)])
+    assert rc == 0
+    assert stub.images.calls == 4 and stub.images.peak > 1
+    assert max(hosts.peak.values()) <= 2
+
+    meta_path = capsys.readouterr().out.strip().rsplit(" ", 1)[-1]
+    meta = json.load(open(meta_path, encoding="utf-8"))
+    run_id = meta["run_id"]
+    assert sorted(c["call"] for c in meta["calls"]) == [1, 2, 3, 4]
+    assert all(c["outputs"] == 2 for c in meta["calls"])
+
+    # The broken download is recorded; every other result is saved as {run_id}_{call}_{item}.png
+    failed = [o for o in meta["outputs"] if "download_error" in o]
+    saved = [o for o in meta["outputs"] if "file" in o]
+    assert [o["url"] for o in failed] == ["http://cdn-b.test/broken.png"]
+    assert len(saved) == 7
+    for o in saved:
+        name = os.path.basename(o["file"])
+        assert re.fullmatch(rf"{run_id}_[1-4]_[12]\.png", name)
+        assert name.endswith("_1.png") == ("cdn-a" in o["source_url"])
+        assert open(o["file"], "rb").read() == o["source_url"].encode()
+    assert len(os.listdir(out_dir)) == 7 + 1
+
+
+def test_async_download_pools_are_per_loop_and_closed_on_shutdown():
+    from src.downloads import close_async_download_pools, get_async_download_pool
+
+    async def _on_loop():
+        pool = get_async_download_pool()
+        assert get_async_download_pool() is pool
+        await close_async_download_pools()
+        assert pool._client.is_closed
+        # A later call on the same loop opens a fresh pool
+        assert get_async_download_pool() is not pool
+        await close_async_download_pools()
+        return pool
+
+    first = asyncio.run(_on_loop())
+    assert asyncio.run(_on_loop()) is not first
@@ -55,3 +55,678 @@ def test_sketch_to_3d_requires_primary():
     # assert r2.status_code == 200
     # assert len(r2.json()["candidates"]) == 2
 
+
+
+class _FakeImages:
+    def __init__(self, owner: "_FakeAsyncArk"):
+        self._owner = owner
+
+    async def generate(self, **payload):
+        import asyncio
+
+        self._owner.calls.append(payload)
+        await asyncio.sleep(0)
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+
+class _FakeAsyncArk:
+    calls: list = []
+
+    def __init__(self, base_url=None, api_key=None, **kwargs):
+        self.images = _FakeImages(self)
+
+    async def close(self):
+        pass
+
+
+def _fake_ark(monkeypatch):
+    import volcenginesdkarkruntime
+
+    _FakeAsyncArk.calls = []
+    monkeypatch.setenv("ARK_API_KEY", "test-key")
+    monkeypatch.setattr(volcenginesdkarkruntime, "AsyncArk", _FakeAsyncArk)
+    return _FakeAsyncArk
+
+
+def test_text_to_image_async_engine(monkeypatch):
+    fake = _fake_ark(monkeypatch)
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image",
+        json={"prompt_mode": "custom", "custom_prompt": "a blue car", "num_candidates": 3},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert len(data["candidates"]) == 3
+    assert data["candidates"][0]["base64"] == PNG_1x1
+    assert len(fake.calls) == 3
+    assert fake.calls[0]["size"] == "4K"
+
+
+def test_metrics_exposes_ark_pool():
+    r = client.get("/api/metrics")
+    assert r.status_code == 200
+    pool = r.json()["ark_pool"]
+    for k in ("max_connections", "max_keepalive", "requests", "connections_opened", "connections_reused"):
+        assert k in pool
+
+
+def test_ark_clients_keyed_by_timeout_and_closed_per_loop():
+    import asyncio
+
+    from src.ark_client import close_async_clients, get_ark_client, get_async_ark_client
+
+    a = get_ark_client("http://ark.test", "k", 5)
+    assert get_ark_client("http://ark.test", "k", 5) is a
+    b = get_ark_client("http://ark.test", "k", 7)
+    # The SDK sends its client timeout with every request, so it must be the requested one
+    assert b is not a and a.timeout.read == 5 and b.timeout.read == 7
+
+    async def _on_loop():
+        c = get_async_ark_client("http://ark.test", "k", 3)
+        assert get_async_ark_client("http://ark.test", "k", 3) is c and c.timeout.read == 3
+        await close_async_clients()
+        assert c.is_closed()
+        return c
+
+    first = asyncio.run(_on_loop())
+    assert asyncio.run(_on_loop()) is not first
+
+
+def test_url_results_download_in_parallel(monkeypatch):
+    import weakref
+
+    import httpx
+    import src.downloads as dl
+
+    fake = _fake_ark(monkeypatch)
+
+    async def _generate(**payload):
+        fake.calls.append(payload)
+        return {"data": [{"url": "https://cdn.example/a.png"}, {"url": "https://cdn.example/b.png"}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", lambda self, **p: _generate(**p))
+    transport = httpx.MockTransport(lambda req: httpx.Response(200, content=req.url.path.encode()))
+    orig_init = dl.AsyncDownloadPool.__init__
+
+    def _init(self, max_per_host, timeout, transport=transport):
+        orig_init(self, max_per_host, timeout, transport=transport)
+
+    monkeypatch.setattr(dl.AsyncDownloadPool, "__init__", _init)
+    monkeypatch.setattr(dl, "_async_pools", weakref.WeakKeyDictionary())
+
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image",
+        json={"prompt_mode": "custom", "custom_prompt": "a car", "num_candidates": 2},
+    )
+    assert r.status_code == 200
+    data = r.json()
+    import base64
+
+    assert [base64.b64decode(c["base64"]) for c in data["candidates"]] == [b"/a.png", b"/b.png"]
+    assert all(t["download_ms"] is not None for t in data["metadata"]["timings"])
+
+
+def test_surplus_calls_cancelled_once_enough_candidates(monkeypatch):
+    import asyncio
+    import time
+
+    fake = _fake_ark(monkeypatch)
+    cancelled = []
+
+    async def _generate(**payload):
+        fake.calls.append(payload)
+        if len(fake.calls) == 1:
+            # a sequential-generation style response carrying two images
+            return {"data": [{"b64_json": PNG_1x1}, {"b64_json": PNG_1x1}]}
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(payload)
+            raise
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", lambda self, **p: _generate(**p))
+    pid = _mk_project()
+    started = time.monotonic()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image",
+        json={"prompt_mode": "custom", "custom_prompt": "a car", "num_candidates": 2},
+    )
+    assert r.status_code == 200
+    assert len(r.json()["candidates"]) == 2
+    assert time.monotonic() - started < 5
+    assert len(cancelled) == 1
+
+
+def test_text_to_image_streams_ndjson(monkeypatch):
+    import json
+
+    _fake_ark(monkeypatch)
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image?stream=ndjson",
+        json={"prompt_mode": "custom", "custom_prompt": "a car", "num_candidates": 2},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    frames = [json.loads(line) for line in r.text.splitlines() if line]
+    assert [f["type"] for f in frames] == ["candidate", "candidate", "metadata"]
+    assert frames[0]["candidate"]["base64"] == PNG_1x1
+    assert frames[-1]["metadata"]["interface_name"] == "TextToImage"
+
+
+def test_sketch_to_3d_stream_sse_validates_before_streaming(monkeypatch):
+    _fake_ark(monkeypatch)
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/sketch-to-3d?stream=sse",
+        json={"prompt_mode": "custom", "custom_prompt": "upscale"},
+    )
+    assert r.status_code == 422
+
+    r2 = client.post(
+        f"/api/projects/{pid}/generate/sketch-to-3d?stream=sse",
+        json={
+            "prompt_mode": "custom",
+            "custom_prompt": "upscale",
+            "primary_image": {"base64": PNG_1x1, "mime": "image/png"},
+            "num_candidates": 1,
+        },
+    )
+    assert r2.status_code == 200
+    assert r2.text.startswith("event: candidate\ndata: ")
+    assert "event: metadata" in r2.text
+
+
+def test_fixed_seed_results_served_from_cache(monkeypatch, tmp_path):
+    import src.result_cache as rc
+
+    fake = _fake_ark(monkeypatch)
+    monkeypatch.setenv("ARK_RESULT_CACHE_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(rc, "_cache", None)
+    pid = _mk_project()
+    body = {"prompt_mode": "custom", "custom_prompt": "a car", "num_candidates": 1, "ark": {"seed": 42}}
+
+    r1 = client.post(f"/api/projects/{pid}/generate/text-to-image", json=body)
+    assert r1.status_code == 200
+    r2 = client.post(f"/api/projects/{pid}/generate/text-to-image", json=body)
+    assert r2.status_code == 200
+    assert r2.json()["candidates"] == r1.json()["candidates"]
+    assert len(fake.calls) == 1
+
+    # FusionRandomize uses varying seeds and is never cached
+    fusion = {**body, "primary_image": {"base64": PNG_1x1, "mime": "image/png"}}
+    for _ in range(2):
+        assert client.post(f"/api/projects/{pid}/generate/fusion-randomize", json=fusion).status_code == 200
+    assert len(fake.calls) == 3
+    stats = client.get("/api/metrics").json()["result_cache"]
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_sketch_to_3d_multipart_upload(monkeypatch):
+    import base64
+    import json
+
+    fake = _fake_ark(monkeypatch)
+    pid = _mk_project()
+    raw = base64.b64decode(PNG_1x1)
+    r = client.post(
+        f"/api/projects/{pid}/generate/sketch-to-3d/multipart",
+        data={"params": json.dumps({"prompt_mode": "custom", "custom_prompt": "make 3d", "num_candidates": 1})},
+        files={"primary_image": ("sketch.png", raw, "image/png")},
+    )
+    assert r.status_code == 200, r.text
+    assert len(r.json()["candidates"]) == 1
+    assert fake.calls[0]["image"] == [f"data:image/png;base64,{PNG_1x1}"]
+
+    r2 = client.post(
+        f"/api/projects/{pid}/generate/sketch-to-3d/multipart",
+        data={"params": json.dumps({"prompt_mode": "custom", "custom_prompt": "make 3d"})},
+        files={"primary_image": ("sketch.gif", raw, "image/gif")},
+    )
+    assert r2.status_code == 422
+
+
+def test_refine_edit_resolves_stored_version_and_assets(monkeypatch):
+    fake = _fake_ark(monkeypatch)
+    pid = _mk_project()
+    ver = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "TextToImage"},
+    ).json()["version"]
+    a1 = client.post(f"/api/projects/{pid}/assets", json={"base64": PNG_1x1, "mime": "image/png"})
+    assert a1.status_code == 200, a1.text
+    # Same bytes, same project: deduped to the existing asset
+    a2 = client.post(f"/api/projects/{pid}/assets", json={"base64": PNG_1x1, "mime": "image/png"})
+    assert a2.json()["asset_id"] == a1.json()["asset_id"]
+
+    body = {
+        "prompt_mode": "custom",
+        "custom_prompt": "refine",
+        "num_candidates": 1,
+        "primary_version_id": ver["id"],
+        "ref_asset_ids": [a1.json()["asset_id"]],
+    }
+    r = client.post(f"/api/projects/{pid}/generate/refine-edit", json=body)
+    assert r.status_code == 200, r.text
+    assert fake.calls[0]["image"] == [f"data:image/png;base64,{PNG_1x1}"] * 2
+
+    other = _mk_project()
+    assert client.post(f"/api/projects/{other}/generate/refine-edit", json=body).status_code == 404
+    both = {**body, "primary_image": {"base64": PNG_1x1, "mime": "image/png"}}
+    assert client.post(f"/api/projects/{pid}/generate/refine-edit", json=both).status_code == 422
+
+
+def test_oversized_inputs_downscaled_and_unsupported_rejected(monkeypatch):
+    import base64
+    import io
+
+    from PIL import Image
+
+    import src.image_prep as image_prep
+
+    prep = image_prep.ImagePrep(
+        image_prep.PrepLimits(max_pixels=64 * 64, max_bytes=1024 * 1024, reject_pixels=1000 * 1000, reject_bytes=4 * 1024 * 1024),
+        1024 * 1024,
+    )
+    monkeypatch.setattr(image_prep, "_prep", prep)
+    fake = _fake_ark(monkeypatch)
+    pid = _mk_project()
+
+    def _b64(size, fmt):
+        out = io.BytesIO()
+        Image.new("RGB", size, (200, 30, 30)).save(out, format=fmt)
+        return base64.b64encode(out.getvalue()).decode("ascii")
+
+    body = {"prompt_mode": "custom", "custom_prompt": "3d", "num_candidates": 1,
+            "primary_image": {"base64": _b64((256, 128), "PNG"), "mime": "image/png"}}
+    for _ in range(2):
+        r = client.post(f"/api/projects/{pid}/generate/sketch-to-3d", json=body)
+        assert r.status_code == 200, r.text
+    head, b64 = fake.calls[0]["image"][0].split(",", 1)
+    with Image.open(io.BytesIO(base64.b64decode(b64))) as img:
+        assert img.width * img.height <= 64 * 64 and img.width == 2 * img.height
+    # The second request reuses the normalized image from the content-hash cache
+    assert fake.calls[1]["image"] == fake.calls[0]["image"]
+    assert prep.stats()["resized"] == 1 and prep.stats()["cache"]["hits"] == 1
+
+    too_big = {**body, "primary_image": {"base64": _b64((2000, 1000), "PNG"), "mime": "image/png"}}
+    assert client.post(f"/api/projects/{pid}/generate/sketch-to-3d", json=too_big).status_code == 422
+    gif = {**body, "primary_image": {"base64": _b64((8, 8), "GIF"), "mime": "image/png"}}
+    r = client.post(f"/api/projects/{pid}/generate/sketch-to-3d", json=gif)
+    assert r.status_code == 422 and "unsupported" in r.json()["detail"]
+    assert len(fake.calls) == 2
+
+
+def test_batch_reports_items_incrementally_under_one_cap(monkeypatch):
+    import asyncio
+    import json
+
+    fake = _fake_ark(monkeypatch)
+    monkeypatch.setenv("ARK_BATCH_MAX_CONCURRENCY", "2")
+    state = {"inflight": 0, "peak": 0}
+
+    async def _generate(self, **payload):
+        state["inflight"] += 1
+        state["peak"] = max(state["peak"], state["inflight"])
+        await asyncio.sleep(0.01)
+        state["inflight"] -= 1
+        self._owner.calls.append(payload)
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", _generate)
+    pid = _mk_project()
+    primary = {"base64": PNG_1x1, "mime": "image/png"}
+    items = [
+        {"interface_name": "TextToImage", "prompt_mode": "custom", "custom_prompt": "car", "num_candidates": 3},
+        {"interface_name": "SketchTo3D", "prompt_mode": "custom", "custom_prompt": "3d"},
+        {"interface_name": "RefineEdit", "prompt_mode": "custom", "custom_prompt": "edit", "num_candidates": 2, "primary_image": primary},
+    ]
+    r = client.post(f"/api/projects/{pid}/generate/batch", json={"items": items})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    frames = [json.loads(line) for line in r.text.splitlines()]
+    by_index = {f["index"]: f for f in frames if f["type"] in ("item", "error")}
+    assert len(by_index[0]["candidates"]) == 3
+    assert by_index[1]["type"] == "error" and by_index[1]["status"] == 422
+    assert len(by_index[2]["candidates"]) == 2
+    assert frames[-1] == {**frames[-1], "type": "done", "items": 3, "succeeded": 2, "failed": 1}
+    assert len(fake.calls) == 5
+    assert state["peak"] <= 2
+
+
+def _governor(initial, store=None):
+    from app.governor import Governor, GovernorSettings, LocalTokenStore
+
+    settings = GovernorSettings(
+        initial=initial, min_limit=1, max_limit=8, latency_target_ms=1000, backoff=0.5, cooldown_s=0
+    )
+    return Governor(settings, store or LocalTokenStore(initial))
+
+
+def test_governor_caps_calls_and_adapts_aimd():
+    import asyncio
+
+    gov = _governor(2)
+    state = {"inflight": 0, "peak": 0, "depth": 0}
+
+    async def _call():
+        async with gov.slot():
+            state["inflight"] += 1
+            state["peak"] = max(state["peak"], state["inflight"])
+            state["depth"] = max(state["depth"], gov.stats()["queue_depth"])
+            await asyncio.sleep(0.005)
+            state["inflight"] -= 1
+
+    async def _main():
+        await asyncio.gather(*[_call() for _ in range(6)])
+
+    asyncio.run(_main())
+    assert state["peak"] == 2 and state["depth"] >= 1
+    # Fast successes grow the limit additively...
+    assert gov.stats()["limit"] > 2 and gov.stats()["in_flight"] == 0
+
+    class _RateLimited(Exception):
+        status_code = 429
+
+    async def _throttled():
+        try:
+            async with gov.slot():
+                raise _RateLimited()
+        except _RateLimited:
+            pass
+
+    before = gov.stats()["limit"]
+    asyncio.run(_throttled())
+    # ...and a 429 cuts it multiplicatively
+    stats = gov.stats()
+    assert stats["limit"] == round(before * 0.5, 2) and stats["throttled"] == 1 and stats["decreases"] == 1
+
+
+def test_governor_sqlite_store_shared_across_workers(tmp_path):
+    import asyncio
+
+    from app.governor import SqliteTokenStore
+
+    path = str(tmp_path / "governor.sqlite")
+    # Two governors over one file stand in for two uvicorn workers
+    a = _governor(2, SqliteTokenStore(path, 2))
+    b = _governor(2, SqliteTokenStore(path, 2))
+    state = {"inflight": 0, "peak": 0}
+
+    async def _call(gov):
+        async with gov.slot():
+            state["inflight"] += 1
+            state["peak"] = max(state["peak"], state["inflight"])
+            await asyncio.sleep(0.01)
+            state["inflight"] -= 1
+
+    async def _main():
+        await asyncio.gather(*[_call(g) for g in (a, b, a, b, a, b)])
+
+    asyncio.run(_main())
+    limit = a.stats()["limit"]
+    # The shared limit grows with each success, and the cap held across both workers
+    assert a.stats()["store"] == "sqlite" and b.stats()["in_flight"] == 0
+    assert limit == b.stats()["limit"] > 2
+    assert 2 <= state["peak"] <= int(limit) < 6
+
+
+def test_governor_shared_store_stays_off_the_event_loop(tmp_path):
+    import asyncio
+    import threading
+
+    from app.governor import SqliteTokenStore
+
+    store = SqliteTokenStore(str(tmp_path / "governor.sqlite"), 2)
+    gov = _governor(2, store)
+    loop_threads = []
+    for name in ("try_acquire", "release", "increase", "decrease"):
+        real = getattr(store, name)
+
+        def _spy(*args, _real=real):
+            if threading.current_thread() is threading.main_thread():
+                loop_threads.append(_real.__name__)
+            return _real(*args)
+
+        setattr(store, name, _spy)
+
+    async def _main():
+        async with gov.slot():
+            pass
+        await gov.release(await gov.acquire(), throttled=True)
+
+    asyncio.run(_main())
+    assert loop_threads == []
+    assert gov.stats()["in_flight"] == 0 and gov.stats()["increases"] == 1 and gov.stats()["decreases"] == 1
+
+    # Limit updates are single statements against the shared row
+    assert store.get_limit() == 1.25
+    other = SqliteTokenStore(str(tmp_path / "governor.sqlite"), 99)
+    other.decrease(0.5, 1)
+    assert store.get_limit() == other.get_limit() == 1.0
+    assert other.increase(8) and store.get_limit() == 2.0
+    assert not SqliteTokenStore(str(tmp_path / "cap.sqlite"), 8).increase(8)
+
+
+def test_metrics_exposes_governor():
+    r = client.get("/api/metrics")
+    gov = r.json()["ark_governor"]
+    for k in ("limit", "in_flight", "queue_depth", "throttled"):
+        assert k in gov
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        import httpx
+
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = httpx.Response(status_code, headers=headers or {})
+
+
+def test_transient_ark_errors_retried_with_retry_after(monkeypatch):
+    import asyncio
+
+    from src.retry import retry_stats
+
+    fake = _fake_ark(monkeypatch)
+    monkeypatch.setenv("ARK_RETRY_BASE_DELAY", "0")
+    failures = [_StatusError(429, {"Retry-After": "0.01"}), _StatusError(503)]
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def _sleep(delay, *a, **k):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    async def _generate(self, **payload):
+        self._owner.calls.append(payload)
+        if failures:
+            raise failures.pop(0)
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", _generate)
+    monkeypatch.setattr("src.retry.asyncio.sleep", _sleep)
+    before = retry_stats.snapshot()["retries"]
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image",
+        json={"prompt_mode": "custom", "custom_prompt": "car", "num_candidates": 1},
+    )
+    assert r.status_code == 200
+    assert len(fake.calls) == 3
+    assert sleeps[0] == 0.01  # Retry-After honored
+    after = retry_stats.snapshot()["retries"]
+    assert after.get("throttled", 0) == before.get("throttled", 0) + 1
+    assert after.get("server", 0) == before.get("server", 0) + 1
+
+
+def test_retry_policy_budget_and_fatal_errors():
+    import pytest
+
+    from src.retry import RetryPolicy, call_with_retry
+
+    policy = RetryPolicy(max_attempts=5, base_delay=0, max_delay=1, budget=2)
+    budget = policy.new_budget()
+    calls = []
+
+    def _always_503():
+        calls.append(1)
+        raise _StatusError(503)
+
+    # The budget (2 retries) runs out before max_attempts (5)
+    with pytest.raises(_StatusError):
+        call_with_retry(_always_503, policy, budget, sleep=lambda s: None)
+    assert len(calls) == 3 and budget.remaining == 0
+
+    calls.clear()
+
+    def _bad_request():
+        calls.append(1)
+        raise _StatusError(400)
+
+    with pytest.raises(_StatusError):
+        call_with_retry(_bad_request, policy, policy.new_budget(), sleep=lambda s: None)
+    assert len(calls) == 1
+
+
+def test_hedged_call_races_duplicate_past_percentile(monkeypatch):
+    import asyncio
+
+    from app.hedging import Hedger, HedgeSettings
+
+    fake = _fake_ark(monkeypatch)
+    hedger = Hedger(HedgeSettings(percentile=90, max_rate=1.0, min_samples=5, window=50, min_delay_ms=0))
+    key = ("doubao-seedream-4-0-250828", "TextToImage")
+    for _ in range(10):
+        hedger._record(key, 20.0)
+    monkeypatch.setattr("app.ark.get_hedger", lambda: hedger)
+
+    async def _generate(self, **payload):
+        self._owner.calls.append(payload)
+        if len(self._owner.calls) == 1:
+            await asyncio.sleep(5)  # the tail: only the hedge can answer in time
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", _generate)
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/generate/text-to-image",
+        json={"prompt_mode": "custom", "custom_prompt": "car", "num_candidates": 1},
+    )
+    assert r.status_code == 200
+    assert len(fake.calls) == 2
+    stats = hedger.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_hedge_rate_is_capped_and_needs_samples():
+    import asyncio
+
+    from app.hedging import Hedger, HedgeSettings
+
+    hedger = Hedger(HedgeSettings(percentile=50, max_rate=0.25, min_samples=3, window=8, min_delay_ms=0))
+    key = ("m", "TextToImage")
+    started = []
+
+    async def _slow():
+        started.append(1)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def _run(n):
+        return [await hedger.call(key, _slow) for _ in range(n)]
+
+    # No samples yet: never hedged, but latencies are learned
+    asyncio.run(_run(3))
+    assert hedger.hedged == 0 and len(started) == 3
+    # Calls now outlive a ~1ms p50, yet at most a quarter of recent calls may be hedged
+    hedger._tracker = type(hedger._tracker)(8)
+    for _ in range(8):
+        hedger._record(key, 1.0)
+    asyncio.run(_run(8))
+    assert hedger.hedged >= 1 and hedger.denied >= 1
+    assert hedger.hedged <= 0.25 * hedger.calls
+
+
+def test_concurrent_hedges_mark_their_own_calls():
+    import asyncio
+
+    from app.hedging import Hedger, HedgeSettings
+
+    hedger = Hedger(HedgeSettings(percentile=50, max_rate=0.5, min_samples=1, window=6, min_delay_ms=0))
+    key = ("m", "TextToImage")
+    hedger._record(key, 1.0)
+
+    async def _slow():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def _main():
+        # Overlapping calls: each hedge must mark its own window slot, never a newer call's
+        for _ in range(5):
+            await asyncio.gather(*(hedger.call(key, _slow) for _ in range(8)))
+            assert hedger._recent_hedged == sum(hedger._recent)
+        # Once the hedged calls age out of the window, hedging is allowed again
+        for _ in range(6):
+            await hedger.call(key, lambda: asyncio.sleep(0))
+        assert hedger._recent_hedged == sum(hedger._recent) == 0
+
+    asyncio.run(_main())
+    assert hedger.hedged >= 5 and hedger.denied >= 1
+
+
+def test_hedge_timer_starts_after_the_governor_admits_the_call(monkeypatch):
+    import asyncio
+
+    from app.ark import generate_images
+    from app.governor import Governor, GovernorSettings, LocalTokenStore
+    from app.hedging import Hedger, HedgeSettings
+
+    fake = _fake_ark(monkeypatch)
+    # Pinned at one call in flight
+    gov = Governor(GovernorSettings(1, 1, 1, 1000, 0.5, 0), LocalTokenStore(1))
+    hedger = Hedger(HedgeSettings(percentile=90, max_rate=1.0, min_samples=5, window=50, min_delay_ms=0))
+    key = ("doubao-seedream-4-0-250828", "TextToImage")
+    for _ in range(10):
+        hedger._record(key, 20.0)
+    monkeypatch.setattr("app.ark.get_governor", lambda: gov)
+    monkeypatch.setattr("app.ark.get_hedger", lambda: hedger)
+    slow = {"first": 0.0}
+
+    async def _generate(self, **payload):
+        self._owner.calls.append(payload)
+        if len(self._owner.calls) == 1:
+            await asyncio.sleep(slow["first"])
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+    monkeypatch.setattr(_FakeImages, "generate", _generate)
+
+    def _generate_one():
+        return generate_images("TextToImage", "custom", "car", None, None, None, [], num_candidates=1)
+
+    async def _queued():
+        # Another caller holds the only token well past the 20ms hedge delay
+        token = await gov.acquire()
+        task = asyncio.ensure_future(_generate_one())
+        await asyncio.sleep(0.2)
+        await gov.release(token)
+        return await task
+
+    assert len(asyncio.run(_queued())) == 1
+    # Time spent queued neither triggered a hedge nor entered the latency samples
+    assert len(fake.calls) == 1 and hedger.hedged == 0
+    assert hedger._tracker.percentile(key, 100) < 150
+
+    async def _slow_in_ark():
+        return await _generate_one()
+
+    fake.calls.clear()
+    slow["first"] = 0.2
+    assert len(asyncio.run(_slow_in_ark())) == 1
+    # The hedge fired, but waited for a token of its own and never reached Ark
+    assert hedger.hedged == 1 and len(fake.calls) == 1
+    assert gov.stats()["in_flight"] == 0 and gov.acquired == 3
@@ -0,0 +1,271 @@
+import asyncio
+import time
+import threading
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from test_generate import PNG_1x1, _fake_ark
+
+
+client = TestClient(app)
+
+
+def _mk_project(c):
+    r = c.post("/api/projects/create", json={"name": "j"})
+    assert r.status_code == 200
+    return r.json()["project_id"]
+
+
+def test_job_submit_then_long_poll_result(monkeypatch):
+    fake = _fake_ark(monkeypatch)
+    # Entering the client runs the lifespan, which starts the job workers
+    with TestClient(app) as c:
+        pid = _mk_project(c)
+        r = c.post(
+            f"/api/projects/{pid}/jobs",
+            json={
+                "interface_name": "SketchTo3D",
+                "prompt_mode": "custom",
+                "custom_prompt": "upscale",
+                "primary_image": {"base64": PNG_1x1, "mime": "image/png"},
+                "num_candidates": 2,
+            },
+        )
+        assert r.status_code == 202
+        job = r.json()
+        assert job["status"] in ("queued", "running") and job["result"] is None
+        assert r.headers["location"] == f"/api/projects/{pid}/jobs/{job['job_id']}"
+
+        r = c.get(f"/api/projects/{pid}/jobs/{job['job_id']}", params={"wait": 10})
+        assert r.status_code == 200
+        done = r.json()
+        assert done["status"] == "succeeded" and done["attempts"] == 1
+        assert [x["mime"] for x in done["result"]["candidates"]] == ["image/png", "image/png"]
+        assert done["result"]["metadata"]["interface_name"] == "SketchTo3D"
+        # The stored input reached Ark as a data URL
+        assert fake.calls[0]["image"][0].startswith("data:image/png;base64,")
+
+        m = c.get("/api/metrics").json()["jobs"]
+        assert m["succeeded"] == 1 and m["queue_depth"] == 0
+        assert m["total_ms"]["count"] == 1
+
+
+def test_job_submit_validates_and_scopes_to_project():
+    pid = _mk_project(client)
+    body = {"interface_name": "SketchTo3D", "prompt_mode": "custom", "custom_prompt": "x"}
+    # Missing primary image fails at submit, not in the queue
+    assert client.post(f"/api/projects/{pid}/jobs", json=body).status_code == 422
+    body["interface_name"] = "TextToImage"
+    assert client.post("/api/projects/nope/jobs", json=body).status_code == 404
+
+    r = client.post(f"/api/projects/{pid}/jobs", json=body)
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+    other = _mk_project(client)
+    assert client.get(f"/api/projects/{other}/jobs/{job_id}").status_code == 404
+    assert client.get(f"/api/projects/{pid}/jobs/{job_id}").json()["status"] == "queued"
+    assert client.get("/api/metrics").json()["jobs"]["queue_depth"] == 1
+
+
+def test_job_requeued_after_worker_loss(tmp_path):
+    from app.jobs import JobQueue, JobSettings, JobWorkers
+
+    settings = JobSettings(workers=1, lease_s=0.05, max_attempts=2, poll_s=0.05)
+    queue = JobQueue(str(tmp_path / "q.sqlite"), settings)
+    job = queue.submit("p", "TextToImage", {"n": 1})
+
+    # A worker claims the job and dies without finishing or renewing it
+    assert queue.claim()["id"] == job["id"]
+    assert queue.claim() is None
+    time.sleep(0.1)
+
+    # The restarted process (a fresh queue over the same file) picks it up again
+    queue = JobQueue(str(tmp_path / "q.sqlite"), settings)
+    ran = []
+
+    async def _runner(j):
+        ran.append(j["params"]["n"])
+        return {"ok": True}
+
+    async def _main():
+        workers = JobWorkers(queue, _runner)
+        workers.start()
+        await queue.wait(job["id"], 5)
+        await workers.stop()
+
+    asyncio.run(_main())
+    assert ran == [1]
+    again = queue.get(job["id"])
+    assert again["status"] == "succeeded" and again["attempts"] == 2 and again["result"] == {"ok": True}
+
+
+def test_job_failed_once_attempts_used_up(tmp_path):
+    from app.jobs import JobQueue, JobSettings
+
+    queue = JobQueue(str(tmp_path / "q.sqlite"), JobSettings(lease_s=0.01, max_attempts=2))
+    job = queue.submit("p", "TextToImage", {})
+    for _ in range(2):
+        assert queue.claim()["id"] == job["id"]
+        time.sleep(0.03)
+    # Its worker died on every attempt
+    assert queue.claim() is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed" and failed["error_status"] == 500
+    assert queue.stats()["failed"] == 1
+
+
+def test_job_generic_failures_retried_with_backoff(tmp_path):
+    from app.jobs import JobFailed, JobQueue, JobSettings, JobWorkers
+
+    settings = JobSettings(workers=1, lease_s=5, max_attempts=3, poll_s=0.05, retry_delay_s=0.05)
+    queue = JobQueue(str(tmp_path / "q.sqlite"), settings)
+    flaky = queue.submit("p", "TextToImage", {"kind": "flaky"})
+    broken = queue.submit("p", "TextToImage", {"kind": "broken"})
+    rejected = queue.submit("p", "TextToImage", {"kind": "rejected"})
+    runs = []
+    loop_threads = set()
+    real_get = queue.get
+
+    def _get(job_id):
+        loop_threads.add(threading.get_ident())
+        return real_get(job_id)
+
+    queue.get = _get
+
+    async def _runner(j):
+        kind = j["params"]["kind"]
+        runs.append(kind)
+        if kind == "rejected":
+            raise JobFailed(422, "bad input")
+        if kind == "broken" or runs.count("flaky") < 2:
+            raise RuntimeError("upstream hiccup")
+        return {"ok": True}
+
+    async def _main():
+        workers = JobWorkers(queue, _runner)
+        workers.start()
+        for job in (flaky, broken, rejected):
+            await queue.wait(job["id"], 5)
+        await workers.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(_main())
+    # Long-polls read the queue in threads, never on the event loop
+    assert loop_threads and loop_thread not in loop_threads
+
+    assert runs.count("flaky") == 2 and runs.count("broken") == 3 and runs.count("rejected") == 1
+    done = real_get(flaky["id"])
+    assert done["status"] == "succeeded" and done["attempts"] == 2
+    failed = real_get(broken["id"])
+    assert failed["status"] == "failed" and failed["attempts"] == 3 and failed["error"] == "upstream hiccup"
+    # Client errors are final
+    final = real_get(rejected["id"])
+    assert final["status"] == "failed" and final["error_status"] == 422 and final["attempts"] == 1
+
+
+def test_job_retry_waits_out_its_backoff(tmp_path):
+    from app.jobs import JobQueue, JobSettings
+
+    queue = JobQueue(str(tmp_path / "q.sqlite"), JobSettings(lease_s=5, max_attempts=2, retry_delay_s=0.1))
+    job = queue.submit("p", "TextToImage", {})
+    assert queue.claim()["id"] == job["id"]
+    assert queue.retry(job["id"], 1, "boom")
+    assert queue.get(job["id"])["status"] == "queued"
+    assert queue.claim() is None
+    time.sleep(0.15)
+    assert queue.claim()["attempts"] == 2
+    # The last attempt is not retried
+    assert not queue.retry(job["id"], 2, "boom")
+
+
+def test_ark_rejection_fails_the_job_once_with_the_sync_status(monkeypatch):
+    from test_generate import _FakeImages, _StatusError
+
+    fake = _fake_ark(monkeypatch)
+
+    async def _reject(self, **payload):
+        self._owner.calls.append(payload)
+        raise _StatusError(400)
+
+    monkeypatch.setattr(_FakeImages, "generate", _reject)
+    body = {"interface_name": "TextToImage", "prompt_mode": "custom", "custom_prompt": "x", "num_candidates": 2}
+    with TestClient(app) as c:
+        pid = _mk_project(c)
+        sync = c.post(f"/api/projects/{pid}/generate/text-to-image", json=body)
+        assert sync.status_code == 422 and "fatal" in sync.json()["detail"]
+        # A 4xx is never retried: one call per candidate
+        assert len(fake.calls) == 2
+
+        fake.calls.clear()
+        job_id = c.post(f"/api/projects/{pid}/jobs", json=body).json()["job_id"]
+        done = c.get(f"/api/projects/{pid}/jobs/{job_id}", params={"wait": 10}).json()
+        assert done["status"] == "failed" and done["attempts"] == 1
+        assert done["error_status"] == sync.status_code and done["error"] == sync.json()["detail"]
+        assert len(fake.calls) == 2
+
+
+def test_stale_worker_cannot_overwrite_a_reclaimed_job(tmp_path):
+    from app.jobs import JobQueue, JobSettings
+
+    queue = JobQueue(str(tmp_path / "q.sqlite"), JobSettings(lease_s=0.01, max_attempts=3, retry_delay_s=0))
+    job = queue.submit("p", "TextToImage", {})
+    first = queue.claim()
+    time.sleep(0.03)
+    # The first worker stalled past its lease; another one claims the job
+    second = queue.claim()
+    assert (first["attempts"], second["attempts"]) == (1, 2)
+
+    assert not queue.renew(job["id"], 1)
+    assert not queue.finish(job["id"], 1, result={"stale": True})
+    assert not queue.retry(job["id"], 1, "stale failure")
+    assert queue.get(job["id"])["status"] == "running"
+
+    assert queue.finish(job["id"], 2, result={"ok": True})
+    done = queue.get(job["id"])
+    assert done["status"] == "succeeded" and done["result"] == {"ok": True} and done["error"] is None
+    assert not queue.finish(job["id"], 2, error="late", error_status=500)
+
+
+def test_abandoned_job_keeps_the_last_attempt_error(tmp_path):
+    from app.jobs import JobQueue, JobSettings
+
+    queue = JobQueue(str(tmp_path / "q.sqlite"), JobSettings(lease_s=0.01, max_attempts=2, retry_delay_s=0))
+    job = queue.submit("p", "TextToImage", {})
+    assert queue.claim()["attempts"] == 1
+    assert queue.retry(job["id"], 1, "upstream hiccup")
+    assert queue.claim()["attempts"] == 2
+    # The worker of the last attempt dies
+    time.sleep(0.03)
+    assert queue.claim() is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error"] == "job abandoned: worker lost on the last attempt; previous attempt failed: upstream hiccup"
+
+
+def test_idle_workers_hold_no_threads_and_wake_on_submit(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.jobs import JobQueue, JobSettings, JobWorkers
+
+    # Long poll interval: only the submit wake-up can make this finish in time
+    queue = JobQueue(str(tmp_path / "q.sqlite"), JobSettings(workers=4, lease_s=5, poll_s=30))
+
+    async def _runner(j):
+        return {"ok": True}
+
+    async def _main():
+        # As many idle workers as executor threads: the request path must still get one
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=4))
+        workers = JobWorkers(queue, _runner)
+        workers.start()
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        job = await asyncio.wait_for(asyncio.to_thread(queue.submit, "p", "TextToImage", {}), 2)
+        done = await queue.wait(job["id"], 5)
+        elapsed = time.monotonic() - started
+        await workers.stop()
+        return done, elapsed
+
+    done, elapsed = asyncio.run(_main())
+    assert done["status"] == "succeeded" and elapsed < 2
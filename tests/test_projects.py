@@ -23,3 +23,61 @@ def test_create_and_get_project():
     arr = r3.json()
     assert any(p["project_id"] == pid for p in arr)
 
+
+
+def test_list_projects_paginates_with_cursor():
+    created = [client.post("/api/projects/create", json={"name": f"p{i}"}).json()["project_id"] for i in range(5)]
+
+    seen = []
+    url = "/api/projects?limit=2"
+    while True:
+        r = client.get(url)
+        assert r.status_code == 200
+        page = r.json()
+        assert len(page) <= 2
+        seen.extend(p["project_id"] for p in page)
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        url = f"/api/projects?limit=2&cursor={cursor}"
+    assert sorted(seen) == sorted(created)
+    assert len(seen) == len(set(seen))
+
+
+def test_list_projects_rejects_crafted_cursors():
+    import uuid
+
+    from app.pagination import encode_cursor
+
+    now = "2024-01-01T00:00:00+00:00"
+    for data in (
+        # Filter injection through either field
+        {"created_at": now, "id": "0),or(id.neq.0"},
+        {"created_at": now + '",id.neq."0', "id": str(uuid.uuid4())},
+        {"created_at": "yesterday", "id": str(uuid.uuid4())},
+        {"created_at": now, "id": 7},
+        {"id": str(uuid.uuid4())},
+    ):
+        r = client.get("/api/projects", params={"cursor": encode_cursor(data)})
+        assert r.status_code == 422, data
+    assert client.get("/api/projects", params={"cursor": "%%%"}).status_code == 422
+
+
+def test_list_projects_counts_versions_in_one_query():
+    import app.db as adb
+
+    png = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMB/axuE9sAAAAASUVORK5CYII="
+    pids = [client.post("/api/projects/create", json={"name": f"c{i}"}).json()["project_id"] for i in range(3)]
+    for n, pid in enumerate(pids):
+        for _ in range(n):
+            client.post(
+                f"/api/projects/{pid}/versions/create",
+                json={"image": {"base64": png, "mime": "image/png"}, "interface_name": "TextToImage"},
+            )
+    fake = adb.get_client()
+    fake.rpc_calls.clear()
+    r = client.get("/api/projects")
+    assert r.status_code == 200
+    counts = {p["project_id"]: p["version_count"] for p in r.json()}
+    assert [counts[pid] for pid in pids] == [0, 1, 2]
+    assert fake.rpc_calls == ["project_version_counts"]
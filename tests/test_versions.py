@@ -58,3 +58,290 @@ def test_submit_version_and_list_detail_revert():
     assert r5.status_code == 200
     assert r5.json()["version"]["index"] == 3
 
+
+
+def test_versions_store_images_once_by_hash():
+    import base64
+
+    import app.blobs as blobs
+    import app.db as adb
+
+    pid = _mk_project()
+    ids = []
+    for _ in range(2):
+        r = client.post(
+            f"/api/projects/{pid}/versions/create",
+            json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "TextToImage"},
+        )
+        assert r.status_code == 200
+        ids.append(r.json()["version"]["id"])
+    r = client.post(f"/api/projects/{pid}/versions/{ids[0]}/revert")
+    assert r.status_code == 200
+    assert r.json()["image"]["base64"] == PNG_1x1
+
+    rows = adb.get_client().table("version").select("*").eq("project_id", pid).execute().data
+    assert len(rows) == 3
+    assert len({row["image_hash"] for row in rows}) == 1
+    assert all("image_base64" not in row for row in rows)
+    store = blobs.get_blob_store()
+    assert store.get(rows[0]["image_hash"]) == base64.b64decode(PNG_1x1)
+
+
+def test_legacy_inline_image_moved_to_blob_store_once(monkeypatch):
+    import base64
+    import uuid
+
+    import app.blobs as blobs
+    import app.db as adb
+
+    pid = _mk_project()
+    vid = str(uuid.uuid4())
+    fake = adb.get_client()
+    fake._storage.setdefault("version", []).append(
+        {
+            "id": vid,
+            "project_id": pid,
+            "parent_version_id": None,
+            "index": 1,
+            "interface_name": "TextToImage",
+            "image_mime": "image/png",
+            "image_base64": PNG_1x1,
+            "image_hash": None,
+            "created_at": "2024-01-01T00:00:00+00:00",
+        }
+    )
+    store = blobs.get_blob_store()
+    puts = []
+    real_put = store.put
+    monkeypatch.setattr(store, "put", lambda data, mime: puts.append(mime) or real_put(data, mime))
+
+    for _ in range(3):
+        r = client.get(f"/api/projects/{pid}/versions/{vid}/image")
+        assert r.status_code == 200 and r.content == base64.b64decode(PNG_1x1)
+    # Only the first read pays the decode and upload; the row now carries its key
+    assert puts == ["image/png"]
+    row = fake.table("version").select("*").eq("id", vid).execute().data[0]
+    assert store.get(row["image_hash"]) == base64.b64decode(PNG_1x1)
+
+
+def test_supabase_blob_store_streams_uploads(monkeypatch):
+    import hashlib
+    import io
+
+    import app.blobs as blobs
+
+    data = b"x" * (3 * 1024 * 1024 + 5)
+    uploaded = {}
+
+    class _Bucket:
+        def exists(self, path):
+            return path in uploaded
+
+        def upload(self, path, file, options):
+            # A file object is sent by the client in chunks; bytes would be one buffer
+            assert not isinstance(file, (bytes, bytearray))
+            uploaded[path] = file.read()
+
+    store = blobs.SupabaseBlobStore("version-images")
+    monkeypatch.setattr(store, "_bucket", lambda: _Bucket())
+
+    class _Upload:
+        def __init__(self):
+            self._src = io.BytesIO(data)
+
+        def read(self, n=-1):
+            # The store must not slurp the whole upload
+            assert 0 < n <= 1024 * 1024
+            return self._src.read(n)
+
+    key = store.put_stream(_Upload(), "image/png")
+    assert key == hashlib.sha256(data).hexdigest()
+    assert uploaded == {blobs._key_path(key): data}
+    # Storing the same bytes again skips the upload
+    assert store.put_stream(io.BytesIO(data), "image/png") == key and len(uploaded) == 1
+
+
+def test_submit_version_rejects_invalid_base64():
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": "not base64!", "mime": "image/png"}, "interface_name": "TextToImage"},
+    )
+    assert r.status_code == 422
+
+
+def test_list_versions_paginates_with_cursor():
+    pid = _mk_project()
+    for _ in range(5):
+        r = client.post(
+            f"/api/projects/{pid}/versions/create",
+            json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "TextToImage"},
+        )
+        assert r.status_code == 200
+
+    seen = []
+    url = f"/api/projects/{pid}/versions?limit=2"
+    while True:
+        r = client.get(url)
+        assert r.status_code == 200
+        seen.extend(v["index"] for v in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        url = f"/api/projects/{pid}/versions?limit=2&cursor={cursor}"
+    assert seen == [1, 2, 3, 4, 5]
+
+    assert client.get(f"/api/projects/{pid}/versions?cursor=garbage").status_code == 422
+
+
+def _png(width: int, height: int) -> str:
+    import base64
+    import io
+
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def test_version_image_derivatives_cached_with_headers():
+    import io
+
+    from PIL import Image
+
+    import app.derivatives as derivatives
+
+    pid = _mk_project()
+    r = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": _png(640, 320), "mime": "image/png"}, "interface_name": "TextToImage"},
+    )
+    assert r.status_code == 200
+    vid = r.json()["version"]["id"]
+    # eager thumbnail rendered by the background task
+    assert derivatives.get_derivative_cache().stats()["entries"] == 1
+
+    r2 = client.get(f"/api/projects/{pid}/versions/{vid}/image?w=256&format=webp")
+    assert r2.status_code == 200
+    assert r2.headers["content-type"] == "image/webp"
+    assert "immutable" in r2.headers["cache-control"]
+    assert Image.open(io.BytesIO(r2.content)).size == (256, 128)
+    assert derivatives.get_derivative_cache().stats()["hits"] == 1
+
+    r3 = client.get(
+        f"/api/projects/{pid}/versions/{vid}/image?w=256&format=webp",
+        headers={"If-None-Match": r2.headers["etag"]},
+    )
+    assert r3.status_code == 304
+
+    r4 = client.get(f"/api/projects/{pid}/versions/{vid}/image")
+    assert r4.status_code == 200
+    assert r4.headers["content-type"] == "image/png"
+    assert Image.open(io.BytesIO(r4.content)).size == (640, 320)
+
+
+def test_concurrent_version_inserts_get_unique_indexes():
+    from concurrent.futures import ThreadPoolExecutor
+
+    import app.db as adb
+
+    pid = _mk_project()
+    fake = adb.get_client()
+    fake.rpc_calls.clear()
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        rows = list(ex.map(lambda _: adb.version_insert(pid, "TextToImage", "image/png", "h"), range(20)))
+    assert sorted(r["index"] for r in rows) == list(range(1, 21))
+    # one round trip per insert
+    assert fake.rpc_calls == ["version_insert_next"] * 20
+
+
+def test_version_routes_make_one_lookup_round_trip():
+    import app.db as adb
+
+    pid = _mk_project()
+    v1 = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "TextToImage"},
+    ).json()["version"]["id"]
+    fake = adb.get_client()
+
+    fake.queries.clear()
+    r = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "RefineEdit", "base_version_id": v1},
+    )
+    assert r.status_code == 200
+    assert fake.queries == ["version"]
+
+    fake.queries.clear()
+    assert client.get(f"/api/projects/{pid}/versions/{v1}").status_code == 200
+    assert fake.queries == ["version"]
+
+    fake.queries.clear()
+    assert client.post(f"/api/projects/{pid}/versions/{v1}/revert").status_code == 200
+    assert fake.queries == ["version"]
+
+    r = client.get(f"/api/projects/{pid}/versions/does-not-exist")
+    assert r.status_code == 404
+    r = client.post(f"/api/projects/missing/versions/{v1}/revert")
+    assert r.status_code == 404
+    assert r.json()["detail"] == "project not found"
+
+
+def test_version_detail_cached_and_conditional_get():
+    import app.db as adb
+
+    pid = _mk_project()
+    vid = client.post(
+        f"/api/projects/{pid}/versions/create",
+        json={"image": {"base64": PNG_1x1, "mime": "image/png"}, "interface_name": "TextToImage"},
+    ).json()["version"]["id"]
+    fake = adb.get_client()
+
+    r1 = client.get(f"/api/projects/{pid}/versions/{vid}")
+    assert r1.status_code == 200
+    etag = r1.headers["etag"]
+
+    fake.queries.clear()
+    r2 = client.get(f"/api/projects/{pid}/versions/{vid}")
+    assert r2.status_code == 200
+    assert r2.json() == r1.json()
+    assert fake.queries == []
+
+    r3 = client.get(f"/api/projects/{pid}/versions/{vid}", headers={"If-None-Match": etag})
+    assert r3.status_code == 304
+    assert fake.queries == []
+
+    other = _mk_project()
+    assert client.get(f"/api/projects/{other}/versions/{vid}").status_code == 404
+    # A matching or wildcard ETag never turns a missing or foreign version into a 304
+    for tag in (etag, "*"):
+        assert client.get(f"/api/projects/{other}/versions/{vid}", headers={"If-None-Match": tag}).status_code == 404
+        missing = f"/api/projects/{pid}/versions/00000000-0000-0000-0000-000000000000"
+        assert client.get(missing, headers={"If-None-Match": tag}).status_code == 404
+    assert client.get(f"/api/projects/{pid}/versions/{vid}", headers={"If-None-Match": "*"}).status_code == 200
+
+
+def test_submit_version_multipart_upload():
+    import base64
+    import json
+
+    pid = _mk_project()
+    raw = base64.b64decode(PNG_1x1)
+    r = client.post(
+        f"/api/projects/{pid}/versions/create/multipart",
+        data={"params": json.dumps({"interface_name": "TextToImage"})},
+        files={"image": ("v.png", raw, "image/png")},
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["image"] == {"base64": PNG_1x1, "mime": "image/png"}
+    vid = r.json()["version"]["id"]
+    assert client.get(f"/api/projects/{pid}/versions/{vid}").json()["image"]["base64"] == PNG_1x1
+
+    bad = client.post(
+        f"/api/projects/{pid}/versions/create/multipart",
+        data={"params": json.dumps({"interface_name": "Nope"})},
+        files={"image": ("v.png", raw, "image/png")},
+    )
+    assert bad.status_code == 422
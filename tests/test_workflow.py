@@ -0,0 +1,176 @@
+import base64
+import io
+import os
+import threading
+import time
+
+import src.ark_exec as ark_exec
+from src.ark_exec import ArkExecutor
+from src.config import ArkConfig
+from src.workflow.runner import run_interface
+
+
+PNG_1x1 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAwMB/axuE9sAAAAASUVORK5CYII="
+
+
+class _StubImages:
+    def __init__(self, owner: "_StubArk"):
+        self._owner = owner
+
+    def generate(self, **payload):
+        with self._owner.lock:
+            self._owner.calls.append(payload)
+        return {"data": [{"b64_json": PNG_1x1}]}
+
+
+class _StubArk:
+    """Synchronous stand-in for the Ark client used by ArkExecutor."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: list = []
+        self.images = _StubImages(self)
+
+
+def _executor(monkeypatch, tmp_path, stub):
+    monkeypatch.setattr(ark_exec, "get_ark_client", lambda *args, **kwargs: stub)
+    cfg = ArkConfig(base_url="http://ark.test", api_key="k", output_dir=str(tmp_path / "out"))
+    return ArkExecutor(cfg=cfg, log=io.StringIO())
+
+
+def _png_file(tmp_path, name="in.png"):
+    path = tmp_path / name
+    path.write_bytes(base64.b64decode(PNG_1x1))
+    return str(path)
+
+
+class _CountingCache:
+    def __init__(self):
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return None
+
+    def put(self, key, images):
+        pass
+
+
+def _run(executor, interface_name, **kwargs):
+    params = dict(
+        interface_name=interface_name,
+        prompt_mode="custom",
+        template_key=None,
+        template_params={},
+        custom_prompt="a car",
+        model="doubao-seedream-4-0-250828",
+        primary_image=None,
+        ref_images=[],
+        executor=executor,
+    )
+    params.update(kwargs)
+    return run_interface(**params)
+
+
+def test_result_cache_follows_the_interface_seed_policy(monkeypatch, tmp_path):
+    stub = _StubArk()
+    executor = _executor(monkeypatch, tmp_path, stub)
+    cache = _CountingCache()
+    monkeypatch.setattr(ark_exec, "get_result_cache", lambda: cache)
+    seeded = {"seed": 7}
+
+    # FusionRandomize varies its seed per call, so a seeded call is never a cache candidate
+    rc = _run(
+        executor,
+        "FusionRandomize",
+        primary_image=_png_file(tmp_path),
+        num_candidates=2,
+        concurrency=True,
+        ark_kwargs=dict(seeded),
+    )
+    assert rc == 0 and len(stub.calls) == 2 and cache.gets == 0
+
+    assert _run(executor, "TextToImage", num_candidates=1, ark_kwargs=dict(seeded)) == 0
+    assert cache.gets == 1
+
+
+class _BusyImages:
+    """Sleeps in each call, tracking how many overlap; the calls listed in ``fail`` raise."""
+
+    def __init__(self, fail=(), delay=0.05):
+        self.lock = threading.Lock()
+        self.fail = set(fail)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def generate(self, **payload):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if n in self.fail:
+                raise ValueError(f"call {n} rejected")
+            return {"data": [{"b64_json": PNG_1x1}]}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _busy_executor(monkeypatch, tmp_path, images):
+    stub = _StubArk()
+    stub.images = images
+    return _executor(monkeypatch, tmp_path, stub)
+
+
+def test_concurrent_candidates_share_inputs_and_report_each_result(monkeypatch, tmp_path):
+    images = _BusyImages()
+    executor = _busy_executor(monkeypatch, tmp_path, images)
+    encoded = []
+    real_encode = ark_exec._file_to_data_url
+    monkeypatch.setattr(ark_exec, "_file_to_data_url", lambda path: encoded.append(path) or real_encode(path))
+    results = []
+
+    rc = _run(
+        executor,
+        "FusionRandomize",
+        primary_image=_png_file(tmp_path),
+        num_candidates=6,
+        concurrency=True,
+        max_workers=2,
+        on_result=results.append,
+    )
+    assert rc == 0 and images.calls == 6
+    # Never more calls in flight than max_workers
+    assert images.peak == 2
+    # The input image is read and encoded once for all candidates
+    assert len(encoded) == 1
+    # One callback per candidate, each with its own run and metadata file
+    assert len(results) == 6 and all(r.exit_code == 0 for r in results)
+    assert len({r.meta["run_id"] for r in results}) == 6
+    assert all(os.path.exists(r.meta_path) for r in results)
+
+
+def test_one_failed_candidate_does_not_fail_the_run(monkeypatch, tmp_path):
+    images = _BusyImages(fail={2}, delay=0)
+    executor = _busy_executor(monkeypatch, tmp_path, images)
+    results = []
+
+    rc = _run(executor, "TextToImage", num_candidates=3, concurrency=True, max_workers=1, on_result=results.append)
+    assert rc == 0 and images.calls == 3
+    assert sorted(r.exit_code for r in results) == [0, 0, 1]
+    failed = next(r for r in results if r.exit_code == 1)
+    assert failed.meta["outputs"] == [] and failed.meta["calls"] == []
+
+    # Every candidate failing fails the run
+    images.fail = {4, 5}
+    assert _run(executor, "TextToImage", num_candidates=2, concurrency=True) == 1
+
+    # Bad input is reported before any call is made
+    calls = images.calls
+    assert _run(executor, "FusionRandomize", primary_image=str(tmp_path / "missing.png"), num_candidates=2) == 2
+    assert images.calls == calls